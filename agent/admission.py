@@ -0,0 +1,213 @@
+"""Token-bucket admission control for OpenAI calls.
+
+Every call reserves one request and its estimated tokens from the caller's
+limits and from the deployment-wide ones (per-minute buckets sized by the
+ADMISSION_* settings). A reservation may run a bucket into debt by up to
+ADMISSION_MAX_WAIT_SECONDS of refill; the call then sleeps until its share
+has refilled, so waiting calls go in arrival order and one user only ever
+queues behind their own backlog. Anything that would wait longer is refused
+with AdmissionRejected (429 + Retry-After at the API). Once the response
+arrives the token estimate is settled against the reported usage. Retries,
+hedged requests and fallbacks of an admitted call (agent/llm.py) reserve
+their own request and tokens through admit_extra, which never waits: with
+no headroom the extra attempt is skipped.
+
+Buckets are kept as GCRA theoretical arrival times (one timestamp per limit),
+which a single conditional update can advance. ADMISSION_BACKEND=local keeps
+them in the process; mongo shares them between workers (rate_limits).
+"""
+import asyncio
+import logging
+import math
+import time
+
+from config import settings
+from services.rate_limits import advance_tat, get_tat, rewind_tat
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+_RACE_ATTEMPTS = 3
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, scope: str, retry_after: float):
+        self.scope = scope  # "user" | "global"
+        self.retry_after = retry_after
+        super().__init__(f"Too many {scope} requests to the language model; retry in {self.retry_after_header}s")
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+def estimate_tokens(messages: list) -> int:
+    """Prompt estimate (agent.context.estimate_tokens per message) and the expected completion."""
+    # agent.context imports agent.core, which imports this module
+    from agent.context import estimate_tokens as text_tokens
+
+    prompt = sum(text_tokens(message.get("content") or "") for message in messages)
+    return prompt + settings.ADMISSION_COMPLETION_TOKENS
+
+
+def _limits(rpm: int, tpm: int) -> dict:
+    # name -> (capacity, refill per second)
+    limits = {}
+    if rpm > 0:
+        limits["requests"] = (rpm, rpm / 60)
+    if tpm > 0:
+        limits["tokens"] = (tpm, tpm / 60)
+    return limits
+
+
+class _LocalLimits:
+    def __init__(self):
+        self._tat = {}  # key -> theoretical arrival time (epoch seconds)
+        self._takes = 0
+
+    async def take(self, key: str, increment: float, now: float, limit: float) -> float | None:
+        tat = max(self._tat.get(key, now), now) + increment
+        if tat > limit:
+            return None
+        self._tat[key] = tat
+        self._takes += 1
+        if self._takes % 1000 == 0:
+            # a tat in the past is a full bucket, same as no entry
+            for idle in [k for k, value in self._tat.items() if value < now]:
+                del self._tat[idle]
+        return tat
+
+    async def current(self, key: str) -> float | None:
+        return self._tat.get(key)
+
+    async def give(self, key: str, seconds: float):
+        if key in self._tat:
+            self._tat[key] -= seconds
+
+
+class _MongoLimits:
+    async def take(self, key: str, increment: float, now: float, limit: float) -> float | None:
+        for _attempt in range(_RACE_ATTEMPTS):
+            tat = await advance_tat(key, increment, now, limit)
+            if tat is not None:
+                return tat
+            current = await get_tat(key)
+            if current is not None and max(current, now) + increment > limit:
+                return None
+            # the bucket went idle or filled between the two updates; go again
+        return None
+
+    async def current(self, key: str) -> float | None:
+        return await get_tat(key)
+
+    async def give(self, key: str, seconds: float):
+        await rewind_tat(key, seconds)
+
+
+class Admission:
+    def __init__(self, backend):
+        self.backend = backend
+        self.user_limits = _limits(settings.ADMISSION_USER_RPM, settings.ADMISSION_USER_TPM)
+        self.global_limits = _limits(settings.ADMISSION_GLOBAL_RPM, settings.ADMISSION_GLOBAL_TPM)
+        self._settling = set()
+        self.admitted = 0
+        self.delayed = 0
+        self.rejected = {"user": 0, "global": 0}
+        self.extra_admitted = 0
+        self.extra_refused = 0
+
+    async def admit(self, user_id: str | None, tokens: int) -> list | None:
+        """Reserve capacity for one call, waiting briefly if needed; returns a ticket for settle()."""
+        if not settings.ADMISSION_ENABLED:
+            return None
+        try:
+            ticket = await self._reserve(user_id, tokens, settings.ADMISSION_MAX_WAIT_SECONDS)
+        except AdmissionRejected as e:
+            self.rejected[e.scope] += 1
+            raise
+        self.admitted += 1
+        return ticket
+
+    async def admit_extra(self, user_id: str | None, tokens: int) -> bool:
+        """Reserve capacity for a retry, hedge or fallback of an admitted call; False when there is none right now.
+
+        The reservation is not settled: the usage of a losing or failed attempt is not reported.
+        """
+        if not settings.ADMISSION_ENABLED:
+            return True
+        try:
+            await self._reserve(user_id, tokens, 0.0)
+        except AdmissionRejected:
+            self.extra_refused += 1
+            return False
+        self.extra_admitted += 1
+        return True
+
+    async def _reserve(self, user_id: str | None, tokens: int, max_wait: float) -> list:
+        cost = {"requests": 1, "tokens": tokens}
+        scopes = [("global", "global", self.global_limits)]
+        if user_id:
+            scopes.insert(0, ("user", f"user:{user_id}", self.user_limits))
+
+        now = time.time()
+        checks = []  # (scope, key, name, rate, amount, burst seconds)
+        for scope, prefix, limits in scopes:
+            for name, (capacity, rate) in limits.items():
+                # a single call larger than the bucket could never fit; let it take the whole bucket
+                amount = min(cost[name], capacity)
+                checks.append((scope, f"{prefix}:{name}", name, rate, amount, capacity / rate))
+
+        with span("llm.admission", tokens=tokens) as admission_span:
+            tats = await asyncio.gather(*(
+                self.backend.take(key, amount / rate, now, now + burst + max_wait)
+                for _scope, key, _name, rate, amount, burst in checks
+            ))
+            refused = [check for check, tat in zip(checks, tats) if tat is None]
+            if refused:
+                await asyncio.gather(*(
+                    self.backend.give(key, amount / rate)
+                    for (_scope, key, _name, rate, amount, _burst), tat in zip(checks, tats) if tat is not None
+                ))
+                scope, key, _name, rate, amount, burst = refused[0]
+                tat = await self.backend.current(key) or now
+                if admission_span is not None:
+                    admission_span.set(rejected=scope)
+                raise AdmissionRejected(scope, max(tat, now) + amount / rate - burst - max_wait - now)
+
+            wait = max([tat - now - check[5] for check, tat in zip(checks, tats)] + [0.0])
+            if admission_span is not None:
+                admission_span.set(wait_ms=round(wait * 1000, 1))
+            if wait > 0:
+                self.delayed += 1
+                await asyncio.sleep(wait)
+        return [(key, rate, amount) for _scope, key, name, rate, amount, _burst in checks if name == "tokens"]
+
+    def settle(self, ticket: list | None, usage):
+        """Correct the token reservation with the usage OpenAI reported (in the background)."""
+        if not ticket or usage is None:
+            return
+        task = asyncio.ensure_future(self._give_all(ticket, usage.total_tokens or 0))
+        self._settling.add(task)
+        task.add_done_callback(self._settling.discard)
+
+    async def _give_all(self, ticket: list, used: int):
+        for key, rate, reserved in ticket:
+            if reserved == used:
+                continue
+            try:
+                await self.backend.give(key, (reserved - used) / rate)
+            except Exception as e:
+                logger.warning("Settling admission tokens for %s failed: %s", key, e)
+
+    def stats(self) -> dict:
+        return {
+            "admitted": self.admitted,
+            "delayed": self.delayed,
+            "rejected_user": self.rejected["user"],
+            "rejected_global": self.rejected["global"],
+            "extra_admitted": self.extra_admitted,
+            "extra_refused": self.extra_refused,
+        }
+
+
+admission = Admission(_MongoLimits() if settings.ADMISSION_BACKEND == "mongo" else _LocalLimits())
@@ -0,0 +1,129 @@
+import asyncio
+import json
+import logging
+from datetime import timezone
+
+from agent.core import Agent
+from config import settings
+from services.conversation_summaries import get_conversation_summary, save_conversation_summary
+from services.messages import decode_cursor, encode_cursor, list_messages, recent_messages
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+_condensing = {}  # user_id -> task folding older turns into the rolling summary
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token plus per-message overhead)."""
+    return len(text) // 4 + 4
+
+
+def _chat_message(role: str, content) -> dict:
+    if role == "tool":
+        # stored tool turns are {"plan", "result"}; the chat API has no bare tool role
+        return {"role": "assistant", "content": f"Tool result: {json.dumps(content, ensure_ascii=True, default=str)}"}
+    if not isinstance(content, str):
+        content = json.dumps(content, ensure_ascii=True, default=str)
+    return {"role": "assistant" if role == "assistant" else "user", "content": content}
+
+
+def _position(doc: dict):
+    created_at = doc["created_at"]
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at, doc["_id"]
+
+
+async def _condense(user_id: str, summary: str, covered_until: str | None, boundary: str):
+    page = await list_messages(
+        user_id,
+        limit=settings.CONTEXT_SUMMARY_BATCH,
+        before=boundary,
+        after=covered_until,
+        # the summary grows from the oldest uncovered turn, also before there is one
+        oldest_first=True,
+    )
+    turns = list(reversed(page["messages"]))  # oldest first
+    if len(turns) < settings.CONTEXT_SUMMARY_MIN_TURNS:
+        return
+    payload = {
+        "summary": summary,
+        "turns": [_chat_message(turn.get("role"), turn.get("content")) for turn in turns],
+    }
+    response = await Agent().process_request(
+        message=json.dumps(payload, ensure_ascii=True),
+        user_id=user_id,
+        context=[],
+        mode="condense",
+    )
+    new_summary = response.get("summary")
+    if isinstance(new_summary, str) and new_summary:
+        await save_conversation_summary(user_id, new_summary, page["next_after"], covered_until)
+
+
+def _schedule_condense(user_id: str, summary: str, covered_until: str | None, boundary: str):
+    if user_id in _condensing:
+        return
+    task = asyncio.ensure_future(_condense(user_id, summary, covered_until, boundary))
+    _condensing[user_id] = task
+
+    def _done(t):
+        _condensing.pop(user_id, None)
+        if not t.cancelled() and t.exception() is not None:
+            logger.warning("Conversation summary update failed for %s: %s", user_id, t.exception())
+
+    task.add_done_callback(_done)
+
+
+async def build_context(user_id: str, exclude_id=None) -> list:
+    """Prior conversation for the planner, kept within CONTEXT_TOKEN_BUDGET.
+
+    Recent turns are included verbatim, newest first until the budget runs
+    out; older turns are represented by the user's rolling summary. When
+    turns may exist before the window (cut by the budget or by
+    CONTEXT_MAX_TURNS), a background task folds them into the summary once
+    at least CONTEXT_SUMMARY_MIN_TURNS are uncovered, so later requests can
+    reuse it.
+    """
+    if settings.CONTEXT_TOKEN_BUDGET <= 0:
+        return []
+
+    with span("mongo.load_context"):
+        summary_doc, docs = await asyncio.gather(
+            get_conversation_summary(user_id),
+            recent_messages(user_id, limit=settings.CONTEXT_MAX_TURNS + 1),
+        )
+    summary = (summary_doc or {}).get("summary") or ""
+    covered_until = (summary_doc or {}).get("covered_until")
+    covered = decode_cursor(covered_until) if covered_until else None
+
+    turns = [
+        doc for doc in docs
+        if doc["_id"] != exclude_id and (covered is None or _position(doc) > covered)
+    ]
+
+    budget = settings.CONTEXT_TOKEN_BUDGET
+    context = []
+    if summary:
+        summary_message = {"role": "system", "content": f"Summary of the earlier conversation: {summary}"}
+        budget -= estimate_tokens(summary_message["content"])
+        context.append(summary_message)
+
+    selected = []
+    for doc in turns[:settings.CONTEXT_MAX_TURNS]:
+        message = _chat_message(doc.get("role"), doc.get("content"))
+        cost = estimate_tokens(message["content"])
+        if cost > budget:
+            break
+        budget -= cost
+        selected.append(message)
+
+    # older uncovered turns may exist whether the budget or the turn cap cut the window;
+    # _condense looks before the oldest selected turn and only folds them in once there are enough
+    if turns and (len(selected) < len(turns) or len(docs) > settings.CONTEXT_MAX_TURNS):
+        boundary = turns[len(selected) - 1] if selected else turns[0]
+        _schedule_condense(user_id, summary, covered_until, encode_cursor(boundary))
+
+    context.extend(reversed(selected))
+    return context
@@ -1,17 +1,22 @@
 import json
-from openai import OpenAI
+import time
+from contextlib import aclosing
+from functools import partial
+from agent.admission import admission, estimate_tokens
+from agent.llm import complete, open_stream
 from agent.prompts import (
     SYSTEM_PROMPT,
     PLANNING_PROMPT,
     SUMMARY_PROMPT,
-    CHAT_PROMPT
+    CHAT_PROMPT,
+    CONDENSE_PROMPT,
 )
 from config import settings
-
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
+from utils.metrics import observe_llm
+from utils.tracing import span
 
 class Agent:
-    def process_request(self, message: str, user_id: str, context: list, mode: str = "plan"):
+    def _build_messages(self, message: str, context: list, mode: str):
         safe_context = []
         for item in context:
             if not isinstance(item, dict):
@@ -28,18 +33,75 @@ class Agent:
             prompt = SUMMARY_PROMPT.format(context=json.dumps(safe_context, ensure_ascii=True))
         elif mode == "chat":
             prompt = CHAT_PROMPT.format(message=message)
+        elif mode == "condense":
+            prompt = CONDENSE_PROMPT.format(message=message)
         else:
             prompt = message
 
-        response = client.chat.completions.create(
-            model="gpt-4.1",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                *safe_context,
-                {"role": "user", "content": prompt},
-            ],
-            response_format={"type": "json_object"},
-        )
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            *safe_context,
+            {"role": "user", "content": prompt},
+        ]
+
+    async def process_request(
+        self, message: str, user_id: str, context: list, mode: str = "plan", model: str | None = None
+    ):
+        """Run one completion; raises AdmissionRejected when the user or deployment is over its limits."""
+        model = model or settings.LLM_MODEL
+        messages = self._build_messages(message, context, mode)
+        tokens = estimate_tokens(messages)
+        ticket = await admission.admit(user_id, tokens)
+        extra = partial(admission.admit_extra, user_id, tokens)  # retries, hedges and fallbacks pay too
+        started = time.perf_counter()
+        with span(f"llm.{mode}", model=model) as llm_span:
+            try:
+                model, response = await complete(messages, mode, model, admit=extra)
+            except Exception:
+                observe_llm(mode, model, time.perf_counter() - started, ok=False)
+                raise
+            observe_llm(mode, model, time.perf_counter() - started, ok=True, usage=response.usage)
+            admission.settle(ticket, response.usage)
+            if llm_span is not None:
+                llm_span.set(answered_by=model)
+                if response.usage is not None:
+                    llm_span.set(prompt_tokens=response.usage.prompt_tokens, completion_tokens=response.usage.completion_tokens)
 
         content = response.choices[0].message.content or "{}"
-        return json.loads(content)
\ No newline at end of file
+        return json.loads(content)
+
+    async def stream_request(
+        self, message: str, user_id: str, context: list, mode: str = "plan", model: str | None = None
+    ):
+        """Yield the raw JSON response text as it is generated."""
+        model = model or settings.LLM_MODEL
+        messages = self._build_messages(message, context, mode)
+        tokens = estimate_tokens(messages)
+        ticket = await admission.admit(user_id, tokens)
+        extra = partial(admission.admit_extra, user_id, tokens)
+        started = time.perf_counter()
+        usage = None
+        # a generator: keep the span out of the caller's context between yields
+        with span(f"llm.{mode}", current=False, model=model, stream=True) as llm_span:
+            try:
+                model, chunks = await open_stream(messages, mode, model, admit=extra)
+                if llm_span is not None:
+                    llm_span.set(answered_by=model)
+                async with aclosing(chunks):
+                    async for chunk in chunks:
+                        if getattr(chunk, "usage", None) is not None:
+                            usage = chunk.usage
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            if llm_span is not None and "first_token_ms" not in llm_span.attributes:
+                                llm_span.set(first_token_ms=round((time.perf_counter() - started) * 1000, 1))
+                            yield delta
+            except Exception:
+                observe_llm(mode, model, time.perf_counter() - started, ok=False)
+                raise
+            observe_llm(mode, model, time.perf_counter() - started, ok=True, usage=usage)
+            admission.settle(ticket, usage)
+            if llm_span is not None and usage is not None:
+                llm_span.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
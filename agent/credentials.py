@@ -0,0 +1,142 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from utils.cache import Cache
+
+logger = logging.getLogger(__name__)
+
+_REFRESH_LEASE_SECONDS = 30
+_REFRESH_WAIT_SECONDS = 5.0
+
+
+class CredentialManager:
+    """Caches per-user Google credentials and keeps their access tokens fresh.
+
+    Credentials are refreshed in place, so services built from them (see
+    agent.google_services) stay valid. A token close to expiry is refreshed in
+    the background while the current one is still served; an expired token is
+    refreshed before returning. Concurrent callers for one user share a single
+    load and a single refresh.
+
+    Across workers (a shared CACHE_BACKEND), the refreshed access token is
+    published to the cache and one worker at a time holds a refresh lease per
+    user; the others wait for and adopt its token instead of refreshing too.
+    """
+
+    def __init__(self, loader, maxsize: int, ttl: float, refresh_margin: float):
+        self._loader = loader  # async (user_id) -> Credentials | None
+        # services are built on these objects, so they stay in the process; forget() reaches every worker
+        self._cache = Cache("google_credentials", maxsize=maxsize, ttl=ttl, shared=False)
+        # user_id -> {"token", "expiry"} of the latest refresh by any worker
+        self._tokens = Cache("google_tokens", maxsize=maxsize, ttl=ttl)
+        self._leases = Cache("google_token_refresh", maxsize=maxsize, ttl=_REFRESH_LEASE_SECONDS)
+        self.adopted = 0
+        self._refresh_margin = timedelta(seconds=refresh_margin)
+        self._inflight = {}  # (kind, user_id) -> task
+        self._background = set()
+
+    def _single_flight(self, kind: str, user_id: str, factory):
+        key = (kind, user_id)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t: self._inflight.pop(key, None))
+        return task
+
+    async def _load(self, user_id: str):
+        creds = await self._loader(user_id)
+        if creds is not None:
+            await self._cache.set(user_id, creds)
+        return creds
+
+    async def _adopt(self, user_id: str, creds) -> bool:
+        """Take over a newer access token another worker refreshed; True if creds now has one."""
+        shared = await self._tokens.get(user_id)
+        if not shared or not shared.get("expiry"):
+            return False
+        expiry = datetime.fromisoformat(shared["expiry"])
+        if creds.expiry is not None and expiry <= creds.expiry:
+            return False
+        creds.token = shared["token"]
+        creds.expiry = expiry
+        self.adopted += 1
+        return True
+
+    async def _refresh(self, user_id: str, creds):
+        if await self._adopt(user_id, creds) and not self._due(creds):
+            return creds
+        leased = await self._leases.add(user_id, True, _REFRESH_LEASE_SECONDS)
+        if not leased:
+            # another worker is refreshing this user's token; wait for it, then go ahead anyway
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + _REFRESH_WAIT_SECONDS
+            while loop.time() < deadline:
+                await asyncio.sleep(0.25)
+                if await self._adopt(user_id, creds) and not self._due(creds):
+                    return creds
+        try:
+            return await self._refresh_token(user_id, creds)
+        finally:
+            if leased:
+                await self._leases.delete(user_id)
+
+    async def _refresh_token(self, user_id: str, creds):
+        from db import users_collection
+
+        refresh_token = creds.refresh_token
+        from google.auth.transport.requests import Request
+
+        await asyncio.to_thread(creds.refresh, Request())
+        update = {
+            "google_tokens.token": creds.token,
+            "google_tokens.expiry": creds.expiry.isoformat() if creds.expiry else None,
+        }
+        if creds.refresh_token and creds.refresh_token != refresh_token:
+            update["google_tokens.refresh_token"] = creds.refresh_token
+        await users_collection.update_one({"user_id": user_id}, {"$set": update})
+        await self._tokens.set(user_id, {"token": creds.token, "expiry": update["google_tokens.expiry"]})
+        return creds
+
+    def _due(self, creds) -> bool:
+        """The token should be refreshed: missing, expired or within the refresh margin."""
+        return not creds.token or creds.expired or (
+            creds.expiry is not None and creds.expiry - datetime.utcnow() < self._refresh_margin
+        )
+
+    def _refresh_in_background(self, user_id: str, creds):
+        task = self._single_flight("refresh", user_id, lambda: self._refresh(user_id, creds))
+        if task in self._background:
+            return
+        self._background.add(task)
+
+        def _done(t):
+            self._background.discard(t)
+            if not t.cancelled() and t.exception() is not None:
+                logger.warning("Background token refresh failed for %s: %s", user_id, t.exception())
+                self._cache.invalidate_local(user_id)
+
+        task.add_done_callback(_done)
+
+    async def get(self, user_id: str):
+        creds = await self._cache.get(user_id)
+        if creds is None:
+            creds = await asyncio.shield(self._single_flight("load", user_id, lambda: self._load(user_id)))
+            if creds is None:
+                return None
+
+        if not creds.refresh_token:
+            return creds
+        if not creds.token or creds.expired:
+            await asyncio.shield(self._single_flight("refresh", user_id, lambda: self._refresh(user_id, creds)))
+        elif creds.expiry and creds.expiry - datetime.utcnow() < self._refresh_margin:
+            self._refresh_in_background(user_id, creds)
+        return creds
+
+    async def forget(self, user_id: str):
+        await self._cache.delete(user_id)
+        await self._tokens.delete(user_id)
+
+    def stats(self) -> dict:
+        return {**self._cache.stats(), "adopted_tokens": self.adopted}
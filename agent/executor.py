@@ -0,0 +1,97 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from agent.tools import execute_tool_batch, group_plans, is_ambiguous, is_retryable
+from config import settings
+from utils.tracing import span
+
+
+class _UserSlots:
+    """Per-user semaphores that are dropped once nobody holds or waits on them."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._slots = {}  # user_id -> [semaphore, holders]
+
+    @asynccontextmanager
+    async def hold(self, user_id: str | None):
+        entry = self._slots.get(user_id)
+        if entry is None:
+            entry = self._slots[user_id] = [asyncio.Semaphore(self.limit), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._slots[user_id]
+
+
+def plan_shape_error(plan) -> str | None:
+    """Why a plan cannot be executed as a tool call, or None."""
+    if not isinstance(plan, dict):
+        return "Plan is not a dictionary"
+    if not plan.get("function_name") or not isinstance(plan.get("arguments"), dict):
+        return "Invalid plan shape"
+    return None
+
+
+_global_slots = asyncio.Semaphore(settings.PLAN_MAX_CONCURRENCY)
+_user_slots = _UserSlots(settings.PLAN_MAX_CONCURRENCY_PER_USER)
+
+
+async def _run_group(indices: list, plans: list, user_id: str | None, keys: list | None):
+    group = [plans[i] for i in indices]
+    with span("executor.group", size=len(group)) as group_span:
+        queued = time.perf_counter()
+        async with _user_slots.hold(user_id), _global_slots:
+            if group_span is not None:
+                group_span.set(queued_ms=round((time.perf_counter() - queued) * 1000, 1))
+            try:
+                outcomes = await execute_tool_batch(group, user_id=user_id, keys=keys and [keys[i] for i in indices])
+            except Exception as e:
+                outcomes = [e] * len(group)
+
+    entries = []
+    for index, plan, outcome in zip(indices, group, outcomes):
+        if isinstance(outcome, Exception):
+            entry = {"plan": plan, "error": str(outcome)}
+            if is_retryable(outcome, plan.get("function_name") if isinstance(plan, dict) else None):
+                entry["retryable"] = True
+            elif is_ambiguous(outcome):
+                entry["error"] = f"May or may not have been applied, so not retried: {outcome}"
+            entries.append((index, entry))
+        else:
+            entries.append((index, {"plan": plan, "result": outcome}))
+    return entries
+
+
+async def iter_plan_results(plans: list, user_id: str | None, keys: list | None = None):
+    """Run independent plans concurrently, yielding (index, entry) as each one finishes.
+
+    Plans for the same batchable Google API share one batch HTTP request. Each
+    entry is {"plan": ..., "result": ...} or {"plan": ..., "error": ...}; errors
+    safe to retry also carry "retryable": True. keys, one per plan and stable
+    across retries, make the calls that support it idempotent.
+    """
+    tasks = [
+        asyncio.ensure_future(_run_group(indices, plans, user_id, keys))
+        for indices in group_plans(plans)
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            for index, entry in await next_done:
+                yield index, entry
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def execute_plans(plans: list, user_id: str | None) -> list:
+    """Run independent plans concurrently and return their entries in plan order."""
+    results = [None] * len(plans)
+    async for index, entry in iter_plan_results(plans, user_id):
+        results[index] = entry
+    return results
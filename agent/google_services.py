@@ -0,0 +1,91 @@
+import json
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+
+from config import settings
+from utils.cache import Cache
+
+# idle services kept per user, api and version; extra concurrent leases build fresh ones
+MAX_IDLE_PER_KEY = 4
+
+
+@lru_cache(maxsize=None)
+def _discovery_doc(api: str, version: str) -> str:
+    from googleapiclient.discovery_cache import get_static_doc
+
+    doc = get_static_doc(api, version)
+    if doc is None:
+        raise ValueError(f"No bundled discovery document for {api} {version}")
+    if settings.GOOGLE_API_ENDPOINT:
+        # rewrite the root rather than pass client_options: batch URIs are built from rootUrl
+        root = settings.GOOGLE_API_ENDPOINT.rstrip("/") + "/"
+        parsed = json.loads(doc)
+        parsed["rootUrl"] = root
+        parsed["mtlsRootUrl"] = root
+        parsed["baseUrl"] = root + parsed.get("servicePath", "")
+        doc = json.dumps(parsed)
+    return doc
+
+
+class ServicePool:
+    """Idle googleapiclient services per user, kept in the google_services cache (utils/cache.py).
+
+    Each user's entry maps (api, version) to the credentials the services
+    were built with and up to MAX_IDLE_PER_KEY idle services. A service wraps
+    a single httplib2 connection, which is not thread-safe, so callers lease
+    a service exclusively and hand it back when done. Services cannot leave
+    the process, but invalidate_user drops a user's services in every worker.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._cache = Cache("google_services", maxsize=maxsize, shared=False)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _acquire(self, user_id, api: str, version: str, creds):
+        with self._lock:
+            apis = self._cache.local.get(user_id)
+            entry = apis.get((api, version)) if apis is not None else None
+            if entry is not None:
+                cached_creds, services = entry
+                if cached_creds is not creds:
+                    # credentials were rotated; services built with the old ones are stale
+                    del apis[(api, version)]
+                elif services:
+                    self.hits += 1
+                    return services.pop()
+            self.misses += 1
+        from googleapiclient.discovery import build_from_document
+
+        return build_from_document(_discovery_doc(api, version), credentials=creds)
+
+    def _release(self, user_id, api: str, version: str, creds, service):
+        with self._lock:
+            apis = self._cache.local.get(user_id)
+            if apis is None:
+                apis = {}
+                self._cache.local.set(user_id, apis)
+            entry = apis.get((api, version))
+            if entry is None or entry[0] is not creds:
+                entry = apis[(api, version)] = (creds, [])
+            if len(entry[1]) < MAX_IDLE_PER_KEY:
+                entry[1].append(service)
+
+    @contextmanager
+    def lease(self, user_id: str | None, api: str, version: str, creds):
+        service = self._acquire(user_id, api, version, creds)
+        # a service whose request raised is not returned to the pool
+        yield service
+        self._release(user_id, api, version, creds, service)
+
+    async def invalidate_user(self, user_id: str):
+        await self._cache.delete(user_id)
+
+    def stats(self) -> dict:
+        return {**self._cache.stats(), "hits": self.hits, "misses": self.misses}
+
+
+service_pool = ServicePool(maxsize=settings.GOOGLE_SERVICE_POOL_SIZE)
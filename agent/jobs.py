@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import os
+import random
+import socket
+import uuid
+
+from agent.core import Agent
+from agent.executor import iter_plan_results, plan_shape_error
+from agent.summarizer import local_summary
+from config import settings
+from services.action_requests import (
+    claim_action_request,
+    finish_action_request,
+    record_plan_results,
+    renew_lease,
+    retry_action_request,
+)
+from services.messages import create_message
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+INTERRUPTED = "Interrupted while running; not retried to avoid repeating the action"
+
+_wakeup = None  # set by wake_workers() so an in-process worker claims new jobs at once
+
+
+def new_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def wake_workers():
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+def _backoff(attempt: int) -> float:
+    delay = min(settings.ACTION_JOB_BACKOFF_MAX_SECONDS, settings.ACTION_JOB_BACKOFF_SECONDS * 2 ** (attempt - 1))
+    return random.uniform(delay / 2, delay)
+
+
+async def run_action_request(job: dict, worker_id: str):
+    """Execute one claimed action request.
+
+    Plan progress is recorded under plan_results.<index>, keyed
+    <request id>:<index>, so a retry skips plans that already succeeded. A
+    plan found "started" was cut off mid-call; its side effect may or may not
+    have happened, so it fails rather than running twice. Plans that failed
+    with a transient error are retried with exponential backoff until
+    ACTION_JOB_MAX_ATTEMPTS; a send that may have reached Google is not (see
+    agent.tools.is_retryable), and Calendar inserts reuse an event id
+    derived from the key.
+    """
+    job_id = job["_id"]
+    user_id = job["user_id"]
+    plans = job.get("plans") or []
+    recorded = job.get("plan_results") or {}
+    attempt = job.get("attempts", 1)
+
+    results = [None] * len(plans)
+    to_run = []
+    failed_now = {}  # plans that fail without running: interrupted or malformed
+    for index, plan in enumerate(plans):
+        entry = recorded.get(str(index)) or {}
+        state = entry.get("state")
+        shape_error = plan_shape_error(plan)
+        if state == "done":
+            results[index] = {"plan": plan, "result": entry.get("result")}
+        elif state == "started" or (state == "failed" and not entry.get("retryable")):
+            error = entry.get("error") or INTERRUPTED
+            results[index] = {"plan": plan, "error": error}
+            if state == "started":
+                failed_now[index] = {"state": "failed", "key": entry.get("key"), "error": error}
+        elif shape_error is not None:
+            # stored as the planner returned it; never handed to the executor
+            results[index] = {"plan": plan, "error": shape_error}
+            failed_now[index] = {"state": "failed", "key": f"{job_id}:{index}", "error": shape_error}
+        elif attempt > settings.ACTION_JOB_MAX_ATTEMPTS:
+            results[index] = {"plan": plan, "error": entry.get("error") or "Gave up after repeated failures"}
+        else:
+            to_run.append(index)
+
+    if failed_now and not await record_plan_results(job_id, worker_id, failed_now):
+        return
+
+    if to_run:
+        started = {index: {"state": "started", "key": f"{job_id}:{index}"} for index in to_run}
+        if not await record_plan_results(job_id, worker_id, started):
+            return
+        keys = [started[index]["key"] for index in to_run]
+        async for position, entry in iter_plan_results([plans[i] for i in to_run], user_id, keys):
+            index = to_run[position]
+            results[index] = entry
+            state = {"state": "done", "result": entry["result"]} if "result" in entry else {
+                "state": "failed", "error": entry["error"], "retryable": bool(entry.get("retryable")),
+            }
+            state["key"] = f"{job_id}:{index}"
+            if not await record_plan_results(job_id, worker_id, {index: state}):
+                return
+
+    retryable = [index for index in to_run if results[index].get("retryable")]
+    if retryable and attempt < settings.ACTION_JOB_MAX_ATTEMPTS:
+        await retry_action_request(job_id, worker_id, _backoff(attempt), results[retryable[0]]["error"])
+        return
+
+    for entry in results:
+        if "result" in entry:
+            await create_message(user_id, "tool", entry)
+
+    errors = [entry["error"] for entry in results if "error" in entry]
+    if errors:
+        await finish_action_request(job_id, worker_id, "failed", {"error": errors[0], "results": results})
+        return
+
+    with span("summary.local"):
+        summary_text = local_summary(results, mode=job.get("summary_mode"))
+    if summary_text is None:
+        context = [{"role": "user", "content": job.get("user_message", "")}]
+        context += [{"role": "assistant", "content": {"tool_result": entry["result"]}} for entry in results]
+        try:
+            final_summary = await Agent().process_request(
+                message="Summarize actions taken",
+                user_id=user_id,
+                context=context,
+                mode="summarize",
+            )
+            summary_text = final_summary.get("message", "Done.")
+        except Exception as e:
+            summary_text = f"Summary generation failed: {e}"
+    # off the request path, so wait for the write before reporting the job done
+    await create_message(user_id, "assistant", summary_text, wait=True)
+    await finish_action_request(job_id, worker_id, "executed", {"results": results, "summary": summary_text})
+
+
+async def _keep_lease(job_id, worker_id: str):
+    interval = settings.ACTION_JOB_LEASE_SECONDS / 3
+    while True:
+        await asyncio.sleep(interval)
+        if not await renew_lease(job_id, worker_id, settings.ACTION_JOB_LEASE_SECONDS):
+            logger.warning("Lost the lease on action request %s", job_id)
+            return
+
+
+async def _run_leased(job: dict, worker_id: str):
+    heartbeat = asyncio.create_task(_keep_lease(job["_id"], worker_id))
+    try:
+        await run_action_request(job, worker_id)
+    except Exception:
+        # left running; the lease expires and another attempt picks it up
+        logger.exception("Action request %s failed in worker %s", job["_id"], worker_id)
+    finally:
+        heartbeat.cancel()
+
+
+async def run_worker(stop: asyncio.Event, concurrency: int | None = None, worker_id: str | None = None):
+    """Claim and run jobs until stop is set, then wait for the ones in flight."""
+    global _wakeup
+    worker_id = worker_id or new_worker_id()
+    slots = asyncio.Semaphore(concurrency or settings.ACTION_WORKER_CONCURRENCY)
+    wakeup = _wakeup = asyncio.Event()
+    running = set()
+    logger.info("Action worker %s started", worker_id)
+
+    while not stop.is_set():
+        await slots.acquire()
+        wakeup.clear()  # before claiming, so a wake-up during the claim is not lost
+        try:
+            job = await claim_action_request(worker_id, settings.ACTION_JOB_LEASE_SECONDS)
+        except Exception as e:
+            logger.warning("Claiming an action request failed: %s", e)
+            job = None
+        if job is None:
+            slots.release()
+            stopping = asyncio.ensure_future(stop.wait())
+            woken = asyncio.ensure_future(wakeup.wait())
+            await asyncio.wait(
+                [stopping, woken],
+                timeout=settings.ACTION_WORKER_POLL_SECONDS,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            stopping.cancel()
+            woken.cancel()
+            continue
+        task = asyncio.create_task(_run_leased(job, worker_id))
+        running.add(task)
+        task.add_done_callback(running.discard)
+        task.add_done_callback(lambda _t: slots.release())
+
+    if running:
+        await asyncio.gather(*running, return_exceptions=True)
+    logger.info("Action worker %s stopped", worker_id)
@@ -0,0 +1,284 @@
+"""Chat-completion calls with deadlines, retries, hedging and a fallback model.
+
+Each call gets a per-mode deadline. Within it LLM_MODEL is tried up to
+LLM_MAX_ATTEMPTS times, backing off with jitter after timeouts, 429s and 5xx
+responses (a Retry-After header is honoured). The last
+LLM_FALLBACK_RESERVE_SECONDS of the deadline belong to LLM_FALLBACK_MODEL,
+which gets one attempt when the primary has not answered by then. With
+LLM_HEDGE, a second identical request goes out once the first is slower than
+the mode's recent p95 (or LLM_HEDGE_AFTER_SECONDS) and the first answer
+wins. Streams are retried, hedged and failed over until their first chunk
+only; after that a failure ends the stream. Every attempt after the first
+is cleared with the caller's admit() first (agent/admission.py); when it
+says no, the hedge is skipped, or the call gives up with the last error.
+
+The SDK is heavy to import, so it is loaded when the client is opened: by the
+app lifespan (open_client), or on the first call anywhere else.
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+
+from config import settings
+from utils.metrics import LLM_EVENTS
+from utils.tracing import span
+
+_client = None
+_client_lock = threading.Lock()
+
+_DEADLINE_SETTINGS = {
+    "plan": "LLM_PLAN_DEADLINE_SECONDS",
+    "chat": "LLM_PLAN_DEADLINE_SECONDS",
+    "summarize": "LLM_SUMMARY_DEADLINE_SECONDS",
+    "condense": "LLM_CONDENSE_DEADLINE_SECONDS",
+}
+_P95_MIN_SAMPLES = 20
+
+
+def open_client():
+    """The shared AsyncOpenAI client, built (and the SDK imported) on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            from openai import AsyncOpenAI
+
+            # retries are ours (see module docstring), so the SDK's own are off
+            _client = AsyncOpenAI(
+                api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL or None, max_retries=0
+            )
+        return _client
+
+
+async def close_client():
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        await client.close()
+
+
+def deadline_for(mode: str) -> float:
+    return getattr(settings, _DEADLINE_SETTINGS.get(mode, "LLM_PLAN_DEADLINE_SECONDS"))
+
+
+def is_retryable(exc: BaseException) -> bool:
+    from openai import APIConnectionError, APIStatusError, APITimeoutError
+
+    if isinstance(exc, (TimeoutError, ConnectionError, APITimeoutError, APIConnectionError)):
+        return True
+    return isinstance(exc, APIStatusError) and (exc.status_code in (408, 409, 429) or exc.status_code >= 500)
+
+
+def _backoff(attempt: int, exc: BaseException) -> float:
+    from openai import APIStatusError
+
+    if isinstance(exc, APIStatusError):
+        try:
+            return float(exc.response.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            pass
+    return random.uniform(0, min(settings.LLM_BACKOFF_MAX_SECONDS, settings.LLM_BACKOFF_SECONDS * 2 ** (attempt - 1)))
+
+
+class _Latencies:
+    """Recent successful primary-model latencies per mode, for the hedging threshold."""
+
+    def __init__(self, size: int = 200):
+        self.size = size
+        self._samples = {}
+
+    def observe(self, mode: str, seconds: float):
+        self._samples.setdefault(mode, deque(maxlen=self.size)).append(seconds)
+
+    def p95(self, mode: str) -> float | None:
+        samples = self._samples.get(mode)
+        if not samples or len(samples) < _P95_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+
+latencies = _Latencies()
+
+
+def _hedge_after(mode: str) -> float | None:
+    if not settings.LLM_HEDGE:
+        return None
+    return settings.LLM_HEDGE_AFTER_SECONDS or latencies.p95(mode)
+
+
+def _drop(task: asyncio.Task, discard):
+    # a request that lost the race but still produced a result (an open stream) is released
+    if discard is not None and not task.cancelled() and task.exception() is None:
+        asyncio.ensure_future(discard(task.result()))
+
+
+async def _race(start, mode: str, timeout: float, hedge_after: float | None, discard=None, admit=None):
+    """Await start(hedge=False), adding start(hedge=True) if it is slower than hedge_after; first success wins."""
+    loop = asyncio.get_running_loop()
+    end = loop.time() + timeout
+    pending = {asyncio.ensure_future(start(False))}
+    error = None
+    try:
+        if hedge_after is not None and hedge_after < timeout:
+            done, _ = await asyncio.wait(pending, timeout=hedge_after)
+            if not done:
+                if admit is None or await admit():
+                    LLM_EVENTS.labels(mode=mode, event="hedge").inc()
+                    pending.add(asyncio.ensure_future(start(True)))
+                else:
+                    LLM_EVENTS.labels(mode=mode, event="hedge_refused").inc()
+        while pending:
+            remaining = end - loop.time()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            succeeded = [task for task in done if task.exception() is None]
+            if succeeded:
+                for extra in succeeded[1:]:
+                    _drop(extra, discard)
+                return succeeded[0].result()
+            for task in done:
+                error = task.exception()
+        if error is not None and not pending:
+            raise error
+        raise TimeoutError(f"No {mode} completion within {timeout:.1f}s")
+    finally:
+        for task in pending:
+            task.cancel()
+            task.add_done_callback(lambda t: _drop(t, discard))
+
+
+async def _with_policy(mode: str, start, model: str, discard=None, admit=None):
+    """Run start(model, attempt, hedge) under the deadline/retry/fallback policy; returns (model, result).
+
+    admit, if given, is awaited before every request after the first and returns False to skip it.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = deadline_for(mode)
+    end = loop.time() + deadline
+    fallback = settings.LLM_FALLBACK_MODEL if settings.LLM_FALLBACK_MODEL != model else ""
+    primary_end = end - (settings.LLM_FALLBACK_RESERVE_SECONDS if fallback else 0)
+    error = None
+
+    for attempt in range(1, settings.LLM_MAX_ATTEMPTS + 1):
+        remaining = primary_end - loop.time()
+        if remaining <= 0:
+            break
+        if attempt > 1 and admit is not None and not await admit():
+            LLM_EVENTS.labels(mode=mode, event="retry_refused").inc()
+            break
+        try:
+            return model, await _race(
+                lambda hedge: start(model, attempt, hedge), mode, remaining, _hedge_after(mode), discard, admit
+            )
+        except Exception as e:
+            if not is_retryable(e):
+                raise
+            error = e
+        if attempt == settings.LLM_MAX_ATTEMPTS:
+            break
+        delay = _backoff(attempt, error)
+        if loop.time() + delay >= primary_end:
+            break
+        LLM_EVENTS.labels(mode=mode, event="retry").inc()
+        await asyncio.sleep(delay)
+
+    remaining = end - loop.time()
+    if fallback and remaining > 0 and admit is not None and not await admit():
+        LLM_EVENTS.labels(mode=mode, event="fallback_refused").inc()
+        fallback = ""
+    if fallback and remaining > 0:
+        LLM_EVENTS.labels(mode=mode, event="fallback").inc()
+        try:
+            return fallback, await _race(lambda hedge: start(fallback, 1, hedge), mode, remaining, None, discard)
+        except Exception as e:
+            error = e
+            if not is_retryable(e):
+                raise
+    LLM_EVENTS.labels(mode=mode, event="deadline").inc()
+    if error is not None and not isinstance(error, TimeoutError):
+        raise error
+    raise TimeoutError(f"No {mode} completion within the {deadline:.0f}s deadline")
+
+
+async def complete(messages: list, mode: str, model: str | None = None, admit=None):
+    """One JSON chat completion (LLM_MODEL unless model is given); returns (model that answered, response).
+
+    admit() -> bool clears each retry, hedge or fallback request (see module docstring).
+    """
+    primary = model or settings.LLM_MODEL
+    client = open_client()
+
+    async def start(model: str, attempt: int, hedge: bool):
+        with span("llm.attempt", model=model, attempt=attempt, hedge=hedge):
+            started = time.perf_counter()
+            response = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                response_format={"type": "json_object"},
+            )
+            if model == primary:
+                latencies.observe(mode, time.perf_counter() - started)
+            return response
+
+    return await _with_policy(mode, start, primary, admit=admit)
+
+
+async def _close(opened):
+    await opened[0].close()
+
+
+async def open_stream(messages: list, mode: str, model: str | None = None, admit=None):
+    """Start a streamed JSON completion; returns (model, chunks), chunks being an async iterator.
+
+    The policy covers the wait for the first chunk; the rest of the stream
+    must arrive before the mode's deadline.
+    """
+    end = time.monotonic() + deadline_for(mode)
+    primary = model or settings.LLM_MODEL
+    client = open_client()
+
+    async def start(model: str, attempt: int, hedge: bool):
+        with span("llm.attempt", model=model, attempt=attempt, hedge=hedge, stream=True):
+            started = time.perf_counter()
+            stream = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                response_format={"type": "json_object"},
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            try:
+                first = await stream.__anext__()
+            except StopAsyncIteration:
+                await stream.close()
+                raise ConnectionError("Stream ended before the first chunk")
+            except BaseException:
+                await stream.close()
+                raise
+            if model == primary:
+                latencies.observe(mode, time.perf_counter() - started)
+            return stream, first
+
+    model, (stream, first) = await _with_policy(mode, start, primary, discard=_close, admit=admit)
+    return model, _chunks(stream, first, end, mode)
+
+
+async def _chunks(stream, first, end: float, mode: str):
+    try:
+        yield first
+        while True:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                LLM_EVENTS.labels(mode=mode, event="deadline").inc()
+                raise TimeoutError(f"{mode} stream did not finish within its deadline")
+            try:
+                chunk = await asyncio.wait_for(stream.__anext__(), remaining)
+            except StopAsyncIteration:
+                return
+            yield chunk
+    finally:
+        await stream.close()
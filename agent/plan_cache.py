@@ -0,0 +1,149 @@
+import copy
+import hashlib
+import json
+import re
+import threading
+import unicodedata
+from collections import OrderedDict, deque
+
+from agent.prompts import CHAT_PROMPT, PLANNING_PROMPT, SYSTEM_PROMPT
+from agent.router import REFERENTIAL_WORDS
+from config import settings
+from utils.cache import Cache
+
+# any prompt edit changes the version and so retires every cached plan
+PROMPT_VERSION = hashlib.sha256(
+    "\x00".join([SYSTEM_PROMPT, PLANNING_PROMPT, CHAT_PROMPT]).encode("utf-8")
+).hexdigest()[:16]
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+# plans built from these depend on the clock, not just on the message
+_TIME_WORDS = {
+    "now", "today", "tonight", "tomorrow", "yesterday", "morning", "afternoon", "evening",
+    "week", "weekend", "month", "minute", "minutes", "hour", "hours", "noon", "midnight",
+    "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday",
+}
+
+
+def normalize(message: str) -> str:
+    text = unicodedata.normalize("NFKC", message).lower()
+    text = " ".join(text.split())
+    return text.strip(" .!?,;:")
+
+
+def history_fingerprint(history: list | None) -> str:
+    """Digest of the prior context the planner sees (agent.context.build_context)."""
+    if not history:
+        return ""
+    raw = json.dumps(history, sort_keys=True, ensure_ascii=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _shingles(text: str, size: int = 3) -> frozenset:
+    text = f" {text} "
+    return frozenset(text[i:i + size] for i in range(max(1, len(text) - size + 1)))
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class PlanCache:
+    """Planner responses keyed by (user, mode, normalized message, history, prompt version).
+
+    The planner answers from the conversation so far, so a response is only
+    reused for the same prior context (history_fingerprint): a message like
+    "what was the last email I sent?" misses once anything was said since.
+
+    Lookups are exact-hash first; with near_duplicates enabled a miss falls back
+    to comparing character shingles against the user's recent chat replies
+    (never action plans, where one changed address matters).
+    Referential messages are never cached, and action plans are only stored
+    when neither the message nor the plan arguments are time-sensitive.
+    Entries are shared between workers when CACHE_BACKEND is; the
+    near-duplicate index of recent messages stays per process.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, near_duplicates: bool, threshold: float, per_user: int = 32):
+        self._entries = Cache("plan", maxsize=maxsize, ttl=ttl)
+        self.near_duplicates = near_duplicates
+        self.threshold = threshold
+        self._per_user = per_user
+        self._recent = OrderedDict()  # (user_id, mode, history) -> deque[(shingles, key)]
+        self._lock = threading.Lock()
+        self.near_hits = 0
+
+    def _key(self, user_id: str, mode: str, normalized: str, history: str) -> str:
+        raw = "\x00".join([user_id, mode, PROMPT_VERSION, history, normalized])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def cacheable_message(normalized: str) -> bool:
+        return bool(normalized) and not (set(_WORD_RE.findall(normalized)) & REFERENTIAL_WORDS)
+
+    @staticmethod
+    def _time_sensitive(normalized: str, response: dict) -> bool:
+        if set(_WORD_RE.findall(normalized)) & _TIME_WORDS:
+            return True
+        for plan in response.get("plans") or []:
+            args = plan.get("arguments") if isinstance(plan, dict) else None
+            if isinstance(args, dict) and args.get("start_time"):
+                return True
+        return False
+
+    async def get(self, user_id: str, mode: str, message: str, history: list | None = None) -> dict | None:
+        normalized = normalize(message)
+        if not self.cacheable_message(normalized):
+            return None
+        fingerprint = history_fingerprint(history)
+        hit = await self._entries.get(self._key(user_id, mode, normalized, fingerprint))
+        if hit is None and self.near_duplicates:
+            hit = await self._near_duplicate((user_id, mode, fingerprint), normalized)
+        return copy.deepcopy(hit) if hit is not None else None
+
+    async def _near_duplicate(self, scope: tuple, normalized: str):
+        shingles = _shingles(normalized)
+        with self._lock:
+            candidates = list(self._recent.get(scope, ()))
+        best_key, best_score = None, self.threshold
+        for other, key in candidates:
+            score = _jaccard(shingles, other)
+            if score >= best_score:
+                best_key, best_score = key, score
+        if best_key is None:
+            return None
+        hit = await self._entries.get(best_key)
+        if hit is not None:
+            self.near_hits += 1
+        return hit
+
+    async def put(self, user_id: str, mode: str, message: str, response: dict, history: list | None = None):
+        normalized = normalize(message)
+        if not self.cacheable_message(normalized):
+            return
+        if response.get("intent") == "action" and self._time_sensitive(normalized, response):
+            return
+        fingerprint = history_fingerprint(history)
+        key = self._key(user_id, mode, normalized, fingerprint)
+        await self._entries.set(key, copy.deepcopy(response))
+        if self.near_duplicates and response.get("intent") == "chat":
+            scope = (user_id, mode, fingerprint)
+            with self._lock:
+                recent = self._recent.pop(scope, None) or deque(maxlen=self._per_user)
+                recent.append((_shingles(normalized), key))
+                self._recent[scope] = recent
+                while len(self._recent) > self._entries.maxsize:
+                    self._recent.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {**self._entries.stats(), "near_hits": self.near_hits}
+
+
+plan_cache = PlanCache(
+    maxsize=settings.PLAN_CACHE_SIZE,
+    ttl=settings.PLAN_CACHE_TTL_SECONDS,
+    near_duplicates=settings.PLAN_CACHE_NEAR_DUPLICATE,
+    threshold=settings.PLAN_CACHE_NEAR_DUPLICATE_THRESHOLD,
+)
@@ -66,4 +66,17 @@ Return JSON:
 {{
   "message": "your reply"
 }}
-"""
\ No newline at end of file
+"""
+CONDENSE_PROMPT = """
+Update the running summary of an earlier conversation between the user and the WorkspaceAI assistant.
+Input JSON with the current summary and the turns to fold into it (oldest first):
+{message}
+
+Keep names, email addresses, dates, documents, events and open requests that later messages may refer to.
+Keep the summary under 200 words.
+
+Return JSON:
+{{
+  "summary": "the updated summary"
+}}
+"""
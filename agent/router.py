@@ -0,0 +1,183 @@
+"""Local intent router in front of the planner.
+
+Rules answer bare greetings, thanks and goodbyes with a canned reply and
+send anything that names a tool (email, doc, meeting, ...) or leans on the
+conversation so far ("ok", "yes", "do that") straight to the planner, since
+it may answer the planner's last question. Everything else is scored by a small naive Bayes classifier
+(word unigrams and bigrams, trained at import from the examples below);
+only a confident "chat" verdict on a short message skips the planner and
+goes to ROUTER_CHAT_MODEL with the chat prompt. Low confidence always means
+the full planner, so the router can save calls but never drop an action.
+"""
+import math
+import random
+import re
+from collections import Counter
+from dataclasses import dataclass
+
+from config import settings
+from utils.metrics import ROUTER_DECISIONS
+
+_CANNED = {
+    "greeting": [
+        "Hi! I can draft emails, create Google Docs and schedule calendar events. What would you like to do?",
+        "Hello! Tell me what to send, write or schedule and I'll set it up.",
+    ],
+    "thanks": [
+        "You're welcome! Anything else I can help with?",
+        "Happy to help — let me know if there's anything else.",
+    ],
+    "goodbye": [
+        "Goodbye! Come back any time.",
+    ],
+}
+
+_TRAILER = r"(?:\s+(?:there|again|so much|a lot|workspaceai|assistant|bot))*[\s!.,?:)]*$"
+_RULES = [
+    ("greeting", re.compile(
+        r"^(?:hi+|hello+|hey+|hiya|yo|howdy|greetings|good (?:morning|afternoon|evening))" + _TRAILER, re.I)),
+    ("thanks", re.compile(r"^(?:thanks?|thank you|thx|ty|cheers|much appreciated)" + _TRAILER, re.I)),
+    ("goodbye", re.compile(r"^(?:bye+|goodbye|see you(?: later)?|good ?night|later|cya)" + _TRAILER, re.I)),
+]
+# naming a tool or its object is never left to the classifier
+_ACTION_WORDS = re.compile(
+    r"\b(?:e-?mails?|mail|send|reply|forward|docs?|documents?|write up|draft|calendar|meetings?|"
+    r"schedule|reschedule|events?|invite|appointment|remind(?:er)?|book)\b",
+    re.I,
+)
+_WORD = re.compile(r"[a-z0-9']+")
+# words whose meaning depends on the conversation so far: references and answers to a question
+# (also keeps such messages out of agent/plan_cache.py)
+REFERENTIAL_WORDS = frozenset({
+    "it", "its", "that", "this", "these", "those", "them", "they", "he", "she", "him", "her",
+    "again", "too", "also", "same", "above", "previous", "yes", "no", "ok", "okay", "sure",
+    "yep", "yeah", "yup", "nope", "k", "alright", "fine", "cool", "great", "perfect", "sounds",
+    "go", "ahead", "proceed",
+})
+
+# (text, label) seed examples for the classifier
+_EXAMPLES = [
+    ("what can you do", "chat"),
+    ("what are you able to help me with", "chat"),
+    ("how does this work", "chat"),
+    ("who are you", "chat"),
+    ("are you a bot", "chat"),
+    ("what is the capital of france", "chat"),
+    ("explain what a project roadmap is", "chat"),
+    ("how should i prioritize my tasks this week", "chat"),
+    ("give me tips for running a good standup", "chat"),
+    ("what is a good way to plan the project", "chat"),
+    ("tell me something useful about time management", "chat"),
+    ("how do i write a good status update", "chat"),
+    ("what does okr stand for", "chat"),
+    ("can you explain agile in simple terms", "chat"),
+    ("how are you today", "chat"),
+    ("what time zone are you in", "chat"),
+    ("is it better to batch work or multitask", "chat"),
+    ("what did we talk about earlier", "chat"),
+    ("why did that fail", "chat"),
+    ("never mind", "chat"),
+    ("that makes sense", "chat"),
+    ("tell me a fun fact", "chat"),
+    ("what should i focus on first", "chat"),
+    ("summarize the benefits of async communication", "chat"),
+    ("how long should a one on one be", "chat"),
+    ("what is the difference between a goal and a milestone", "chat"),
+    ("can you help me think through a decision", "chat"),
+    ("what are best practices for naming files", "chat"),
+    ("set up a sync with the team tomorrow at 10", "action"),
+    ("let alex know the report is ready", "action"),
+    ("tell sam i will be late to the standup", "action"),
+    ("put a 30 minute block on friday for planning", "action"),
+    ("create notes for the kickoff", "action"),
+    ("make a page with the launch checklist", "action"),
+    ("add lunch with priya to my schedule next tuesday", "action"),
+    ("notify the team that the release is delayed", "action"),
+    ("write to jordan at jordan@example.com about the budget", "action"),
+    ("block two hours tomorrow morning for deep work", "action"),
+    ("start a new file called quarterly plan", "action"),
+    ("let my manager know i am out sick today", "action"),
+    ("set up a call with the vendor on monday at 3pm", "action"),
+    ("jot down these ideas in a new page", "action"),
+    ("ping chris that the deploy is done", "action"),
+    ("hold friday afternoon for the offsite", "action"),
+    ("create a checklist for onboarding", "action"),
+    ("message the design team that reviews moved to thursday", "action"),
+    ("add the dentist at 9am on the 14th", "action"),
+    ("put together a page summarizing the retro", "action"),
+    ("tell everyone the office is closed on monday", "action"),
+    ("set a sync with dana for next week", "action"),
+]
+
+
+def _features(text: str) -> list:
+    words = _WORD.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class NaiveBayes:
+    """Multinomial naive Bayes with Laplace smoothing."""
+
+    def __init__(self, examples: list):
+        counts = {}
+        docs = Counter()
+        vocabulary = set()
+        for text, label in examples:
+            features = _features(text)
+            counts.setdefault(label, Counter()).update(features)
+            docs[label] += 1
+            vocabulary.update(features)
+        # label -> (log prior, log likelihood per seen feature, log likelihood of an unseen one)
+        self.model = {}
+        for label, label_counts in counts.items():
+            denominator = sum(label_counts.values()) + len(vocabulary)
+            self.model[label] = (
+                math.log(docs[label] / sum(docs.values())),
+                {feature: math.log((count + 1) / denominator) for feature, count in label_counts.items()},
+                math.log(1 / denominator),
+            )
+
+    def predict(self, text: str) -> tuple[str, float]:
+        """(label, posterior probability)."""
+        features = _features(text)
+        scores = {}
+        for label, (prior, likelihood, unseen) in self.model.items():
+            scores[label] = prior + sum(likelihood.get(feature, unseen) for feature in features)
+        best = max(scores, key=scores.get)
+        norm = sum(math.exp(score - scores[best]) for score in scores.values())
+        return best, 1 / norm
+
+
+classifier = NaiveBayes(_EXAMPLES)
+
+
+@dataclass
+class Route:
+    target: str  # "canned" | "chat" | "planner"
+    reason: str  # which rule or classifier decided
+    confidence: float = 1.0
+    reply: str | None = None  # for "canned"
+
+
+def route(message: str) -> Route:
+    text = message.strip()
+    if not settings.ROUTER_ENABLED:
+        decision = Route("planner", "disabled")
+    elif _ACTION_WORDS.search(text):
+        decision = Route("planner", "rule_action")
+    else:
+        decision = None
+        for category, pattern in _RULES:
+            if pattern.match(text):
+                decision = Route("canned", f"rule_{category}", reply=random.choice(_CANNED[category]))
+                break
+        if decision is None and set(_WORD.findall(text.lower())) & REFERENTIAL_WORDS:
+            decision = Route("planner", "rule_history")
+        if decision is None:
+            label, confidence = classifier.predict(text)
+            if label == "chat" and confidence >= settings.ROUTER_CHAT_CONFIDENCE and len(text) <= settings.ROUTER_MAX_CHARS:
+                decision = Route("chat", "classifier", confidence)
+            else:
+                decision = Route("planner", "classifier" if label == "action" else "low_confidence", confidence)
+    ROUTER_DECISIONS.labels(route=decision.target, reason=decision.reason).inc()
+    return decision
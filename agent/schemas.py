@@ -1,4 +1,7 @@
+from typing import Literal
+
 from pydantic import BaseModel
 
 class ExecuteRequest(BaseModel):
-    message: str
\ No newline at end of file
+    message: str
+    summary_mode: Literal["local", "llm"] | None = None
\ No newline at end of file
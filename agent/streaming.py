@@ -0,0 +1,101 @@
+import json
+import re
+
+_INTENT_RE = re.compile(r'"intent"\s*:\s*"(\w+)"')
+_MESSAGE_RE = re.compile(r'"message"\s*:\s*"')
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+_HEX4 = re.compile(r"[0-9a-fA-F]{4}")
+_U_PREFIX = re.compile(r"(?:\\(?:u[0-9a-fA-F]{0,4})?)?")  # a possibly incomplete \uXXXX
+_REPLACEMENT = "\ufffd"  # for lone surrogates and malformed \\u escapes, which cannot be sent as UTF-8
+
+
+class MessageStreamer:
+    """Incrementally extracts the "message" string from a streamed JSON response.
+
+    With ``intent="chat"`` text is only released once the response declares that
+    intent, so action plans never leak partial text to the client.
+    """
+
+    def __init__(self, intent: str | None = None):
+        self.intent = intent
+        self.buffer = ""
+        self._start = None  # index of the first char of the message value
+        self._pos = 0  # next unread char of the message value
+        self._closed = False
+        self._pending = ""  # decoded text waiting for the intent to be known
+
+    def _intent_ok(self):
+        if self.intent is None:
+            return True
+        match = _INTENT_RE.search(self.buffer)
+        return bool(match) and match.group(1) == self.intent
+
+    def _decode(self) -> str:
+        out = []
+        buf = self.buffer
+        while self._pos < len(buf):
+            ch = buf[self._pos]
+            if ch == '"':
+                self._closed = True
+                break
+            if ch != "\\":
+                out.append(ch)
+                self._pos += 1
+                continue
+            if self._pos + 1 >= len(buf):
+                break
+            code = buf[self._pos + 1]
+            if code == "u":
+                if self._pos + 6 > len(buf):
+                    break
+                decoded = self._decode_u(buf, self._pos)
+                if decoded is None:
+                    break
+                text, self._pos = decoded
+                out.append(text)
+                continue
+            out.append(_ESCAPES.get(code, code))
+            self._pos += 2
+        return "".join(out)
+
+    @staticmethod
+    def _decode_u(buf: str, pos: int):
+        """(text, next pos) for the \\u escape at pos, or None until more input arrives.
+
+        A high surrogate waits for its low half so a pair is never split
+        across tokens.
+        """
+        if not _HEX4.fullmatch(buf, pos + 2, pos + 6):
+            return _REPLACEMENT, pos + 2
+        code = int(buf[pos + 2:pos + 6], 16)
+        if 0xDC00 <= code <= 0xDFFF:
+            return _REPLACEMENT, pos + 6
+        if not 0xD800 <= code <= 0xDBFF:
+            return chr(code), pos + 6
+        low = buf[pos + 6:pos + 12]
+        if not _U_PREFIX.fullmatch(low):
+            return _REPLACEMENT, pos + 6
+        if len(low) < 6:
+            return None
+        low_code = int(low[2:], 16)
+        if not 0xDC00 <= low_code <= 0xDFFF:
+            return _REPLACEMENT, pos + 6
+        return chr(0x10000 + ((code - 0xD800) << 10) + (low_code - 0xDC00)), pos + 12
+
+    def feed(self, chunk: str) -> str:
+        """Add a chunk of raw JSON and return any newly available message text."""
+        self.buffer += chunk
+        if self._start is None:
+            match = _MESSAGE_RE.search(self.buffer)
+            if not match:
+                return ""
+            self._start = self._pos = match.end()
+        if not self._closed:
+            self._pending += self._decode()
+        if not self._pending or not self._intent_ok():
+            return ""
+        text, self._pending = self._pending, ""
+        return text
+
+    def result(self) -> dict:
+        return json.loads(self.buffer or "{}")
@@ -0,0 +1,70 @@
+from config import settings
+
+
+def _join(items: list) -> str:
+    if len(items) <= 1:
+        return "".join(items)
+    return f"{', '.join(items[:-1])} and {items[-1]}"
+
+
+def _quoted(values: list) -> list:
+    return [f"“{value}”" for value in values]
+
+
+def _render(results: list) -> str | None:
+    """Summary for the known tool result shapes, or None if any result is unknown or failed."""
+    emails, docs, events = [], [], []
+    for entry in results:
+        res = entry.get("result") if isinstance(entry, dict) else None
+        if not isinstance(res, dict):
+            return None
+        if {"sent_to", "message_id"} <= res.keys():
+            emails.append(str(res["sent_to"]))
+        elif {"doc_id", "title"} <= res.keys():
+            docs.append(str(res["title"]))
+        elif {"event_id", "summary"} <= res.keys():
+            events.append(str(res["summary"]))
+        else:
+            return None
+
+    actions = []
+    if emails:
+        actions.append(f"sent {'an email' if len(emails) == 1 else 'emails'} to {_join(emails)}")
+    if docs:
+        actions.append(f"created {'the doc' if len(docs) == 1 else 'the docs'} {_join(_quoted(docs))}")
+    if events:
+        actions.append(f"added {_join(_quoted(events))} to your calendar")
+    if not actions:
+        return "Done — there was nothing to do."
+    if len(actions) > 1:
+        return f"Done — I {', '.join(actions[:-1])}, and {actions[-1]}."
+    return f"Done — I {actions[0]}."
+
+
+def _render_with_failures(results: list) -> str:
+    done = [entry for entry in results if isinstance(entry, dict) and "result" in entry]
+    failed = [entry for entry in results if not (isinstance(entry, dict) and "result" in entry)]
+    parts = []
+    if done:
+        parts.append(_render(done) or f"Done — I completed {len(done)} of {len(results)} actions.")
+    errors = [str(entry.get("error")) if isinstance(entry, dict) else "invalid plan" for entry in failed]
+    if errors:
+        noun = "action" if len(errors) == 1 else "actions"
+        parts.append(f"I couldn’t complete {len(errors)} {noun}: {'; '.join(errors)}")
+    return " ".join(parts)
+
+
+def local_summary(results: list, mode: str | None = None) -> str | None:
+    """Deterministic summary of executed plans, or None when the LLM should write it.
+
+    mode overrides SUMMARY_MODE ("local" or "llm") for one request. Unknown or
+    failed results only go to the LLM when SUMMARY_LLM_FALLBACK is enabled.
+    """
+    if (mode or settings.SUMMARY_MODE) == "llm":
+        return None
+    text = _render(results)
+    if text is None:
+        if settings.SUMMARY_LLM_FALLBACK:
+            return None
+        text = _render_with_failures(results)
+    return text
@@ -1,14 +1,25 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
 import os
+import socket
+import time
 import base64
-import json
 from email.mime.text import MIMEText
 from datetime import datetime, timedelta
+from typing import TYPE_CHECKING
 
-from googleapiclient.discovery import build
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
-from google_auth_oauthlib.flow import InstalledAppFlow
+from agent.credentials import CredentialManager
+from agent.google_services import service_pool
 from config import settings
+from utils.metrics import observe_tool
+from utils.oauth_client import oauth_client_config
+from utils.tracing import span
+
+# the Google client libraries load on the first tool call, not at app startup
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
 
 SCOPES = [
     "openid",
@@ -19,24 +30,15 @@ SCOPES = [
     "https://www.googleapis.com/auth/calendar.events",
 ]
 
-_creds_cache = {}
-
-def _load_client_config():
-    if os.path.exists("credentials.json"):
-        with open("credentials.json", "r", encoding="utf-8") as handle:
-            payload = json.load(handle)
-        return payload.get("web") or payload.get("installed") or {}
-    return {}
-
-def _get_creds_from_db(user_id: str):
+async def _get_creds_from_db(user_id: str):
     from db import users_collection
 
-    user = users_collection.find_one({"user_id": user_id})
+    user = await users_collection.find_one({"user_id": user_id}, {"google_tokens": 1})
     tokens = user.get("google_tokens") if user else None
     if not tokens:
         return None
 
-    client = _load_client_config()
+    client = oauth_client_config.get()
     info = {
         "token": tokens.get("token"),
         "refresh_token": tokens.get("refresh_token"),
@@ -44,76 +46,141 @@ def _get_creds_from_db(user_id: str):
         "client_id": tokens.get("client_id") or client.get("client_id"),
         "client_secret": tokens.get("client_secret") or client.get("client_secret"),
         "scopes": tokens.get("scopes") or SCOPES,
+        "expiry": tokens.get("expiry"),
     }
-    creds = Credentials.from_authorized_user_info(info, scopes=info["scopes"])
-    if creds.expired and creds.refresh_token:
-        creds.refresh(Request())
-        users_collection.update_one(
-            {"user_id": user_id},
-            {
-                "$set": {
-                    "google_tokens.token": creds.token,
-                    "google_tokens.expiry": creds.expiry.isoformat() if creds.expiry else None,
-                }
-            },
-        )
-    return creds
+    from google.oauth2.credentials import Credentials
+
+    return Credentials.from_authorized_user_info(info, scopes=info["scopes"])
+
+credential_manager = CredentialManager(
+    loader=_get_creds_from_db,
+    maxsize=settings.GOOGLE_CREDS_CACHE_SIZE,
+    ttl=settings.GOOGLE_CREDS_CACHE_TTL_SECONDS,
+    refresh_margin=settings.GOOGLE_CREDS_REFRESH_MARGIN_SECONDS,
+)
+
+# fallback credentials from GOOGLE_TOKEN_JSON_PATH or the local-server flow
+_file_creds = None
+
+def _run_local_server_flow():
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
+    path = oauth_client_config.path()
+    if path is None:
+        raise RuntimeError("No Google OAuth client file (credentials.json) for the local-server flow")
+    flow = InstalledAppFlow.from_client_secrets_file(path, SCOPES)
+    local_creds = flow.run_local_server(port=0)
+    with open(settings.GOOGLE_TOKEN_JSON_PATH, "w") as token_file:
+        token_file.write(local_creds.to_json())
+    return local_creds
 
-def _get_creds(user_id: str | None = None):
+async def _get_creds(user_id: str | None = None):
     if user_id:
-        cached = _creds_cache.get(user_id)
-        if cached is not None:
-            return cached
-        db_creds = _get_creds_from_db(user_id)
+        db_creds = await credential_manager.get(user_id)
         if db_creds is not None:
-            _creds_cache[user_id] = db_creds
             return db_creds
 
+    global _file_creds
+    if _file_creds is not None:
+        return _file_creds
+
     if os.path.exists(settings.GOOGLE_TOKEN_JSON_PATH):
-        file_creds = Credentials.from_authorized_user_file(
+        from google.oauth2.credentials import Credentials
+
+        _file_creds = Credentials.from_authorized_user_file(
             settings.GOOGLE_TOKEN_JSON_PATH, scopes=SCOPES
         )
-        _creds_cache["file"] = file_creds
-        return file_creds
+        return _file_creds
 
     allow_local_server = os.getenv("GOOGLE_OAUTH_LOCAL_SERVER", "").lower() in {"1", "true", "yes"}
     if allow_local_server:
-        flow = InstalledAppFlow.from_client_secrets_file("credentials.json", SCOPES)
-        local_creds = flow.run_local_server(port=0)
-        with open(settings.GOOGLE_TOKEN_JSON_PATH, "w") as token_file:
-            token_file.write(local_creds.to_json())
-        _creds_cache["file"] = local_creds
-        return local_creds
+        _file_creds = await asyncio.to_thread(_run_local_server_flow)
+        return _file_creds
 
     raise RuntimeError(
         "Missing Google OAuth token. Provide "
         f"{settings.GOOGLE_TOKEN_JSON_PATH} or set GOOGLE_OAUTH_LOCAL_SERVER=1 to run auth."
     )
 
+async def forget_user_credentials(user_id: str):
+    """Drop cached credentials (in every worker) and services after a user's Google tokens change."""
+    await credential_manager.forget(user_id)
+    await service_pool.invalidate_user(user_id)
+
+# tools that create something again on every call; Calendar inserts carry an id derived from the plan key instead
+NON_IDEMPOTENT_TOOLS = {"create_email", "create_doc"}
+
+def _not_sent(exc: Exception) -> bool:
+    """Failures that happen before the API request leaves (token refresh, connect, DNS)."""
+    from google.auth.exceptions import TransportError
+
+    return isinstance(exc, (TransportError, ConnectionRefusedError, socket.gaierror))
+
+def is_ambiguous(exc: Exception) -> bool:
+    """Failures after the request may have reached Google: it may or may not have been applied."""
+    from googleapiclient.errors import HttpError
+
+    if _not_sent(exc):
+        return False
+    if isinstance(exc, HttpError):
+        return exc.resp.status >= 500
+    return isinstance(exc, (TimeoutError, ConnectionError))
+
+def is_retryable(exc: Exception, fn: str | None = None) -> bool:
+    """Transient failures where running the same call again is expected to work without repeating it.
+
+    For NON_IDEMPOTENT_TOOLS only failures known to come before the request
+    was applied (429, or before it was sent) qualify.
+    """
+    from googleapiclient.errors import HttpError
+
+    if _not_sent(exc):
+        return True
+    if isinstance(exc, HttpError) and exc.resp.status == 429:
+        return True
+    if isinstance(exc, HttpError) and exc.resp.status not in (500, 502, 503, 504):
+        return False
+    return is_ambiguous(exc) and fn not in NON_IDEMPOTENT_TOOLS
+
+def event_id(key: str) -> str:
+    """Calendar event id for a plan key: base32hex, so a retried insert gets 409 instead of a duplicate."""
+    digest = base64.b32hexencode(hashlib.sha256(key.encode()).digest()).decode()
+    return digest.rstrip("=").lower()
+
+def _is_conflict(exc: Exception) -> bool:
+    from googleapiclient.errors import HttpError
+
+    return isinstance(exc, HttpError) and exc.resp.status == 409
+
 # ------------------- Tools -------------------
 
-def create_email(to: str, subject: str, body: str, user_id: str | None = None):
-    service = build("gmail", "v1", credentials=_get_creds(user_id))
+def _email_request(service, to: str, subject: str, body: str):
     message = MIMEText(body)
     message["to"] = to
     message["subject"] = subject
     raw = base64.urlsafe_b64encode(message.as_bytes()).decode()
     message_body = {"raw": raw}
-    sent = service.users().messages().send(userId="me", body=message_body).execute()
+    return service.users().messages().send(userId="me", body=message_body)
+
+def _email_result(sent: dict, to: str, **_):
     return {"sent_to": to, "message_id": sent["id"]}
 
+def create_email(to: str, subject: str, body: str, creds: Credentials | None = None, user_id: str | None = None):
+    with service_pool.lease(user_id, "gmail", "v1", creds) as service:
+        sent = _email_request(service, to, subject, body).execute()
+    return _email_result(sent, to)
 
-def create_doc(title: str, content: str = "", user_id: str | None = None):
-    service = build("docs", "v1", credentials=_get_creds(user_id))
-    doc = service.documents().create(body={"title": title}).execute()
-    doc_id = doc["documentId"]
-    if content:
-        requests = [{"insertText": {"location": {"index": 1}, "text": content}}]
-        service.documents().batchUpdate(documentId=doc_id, body={"requests": requests}).execute()
+
+def create_doc(title: str, content: str = "", creds: Credentials | None = None, user_id: str | None = None):
+    with service_pool.lease(user_id, "docs", "v1", creds) as service:
+        doc = service.documents().create(body={"title": title}).execute()
+        doc_id = doc["documentId"]
+        if content:
+            requests = [{"insertText": {"location": {"index": 1}, "text": content}}]
+            service.documents().batchUpdate(documentId=doc_id, body={"requests": requests}).execute()
     return {"doc_id": doc_id, "title": title}
 
-def create_calendar_event(summary: str, start_time: str = None, user_id: str | None = None):
-    service = build("calendar", "v3", credentials=_get_creds(user_id))
+def _calendar_event_request(service, summary: str, start_time: str = None, event_id: str | None = None):
     if not start_time:
         start_dt = datetime.utcnow() + timedelta(minutes=5)
     else:
@@ -124,18 +191,140 @@ def create_calendar_event(summary: str, start_time: str = None, user_id: str | N
         "start": {"dateTime": start_dt.isoformat(), "timeZone": "UTC"},
         "end": {"dateTime": end_dt.isoformat(), "timeZone": "UTC"}
     }
-    created = service.events().insert(calendarId="primary", body=event).execute()
+    if event_id:
+        event["id"] = event_id
+    return service.events().insert(calendarId="primary", body=event)
+
+def _calendar_event_result(created: dict, summary: str, **_):
     return {"event_id": created["id"], "summary": summary}
 
-def execute_tool(plan: dict, user_id: str | None = None):
+def create_calendar_event(
+    summary: str,
+    start_time: str = None,
+    event_id: str | None = None,
+    creds: Credentials | None = None,
+    user_id: str | None = None,
+):
+    with service_pool.lease(user_id, "calendar", "v3", creds) as service:
+        try:
+            created = _calendar_event_request(service, summary, start_time, event_id).execute()
+        except Exception as e:
+            # an earlier attempt with the same id already created it
+            if not (event_id and _is_conflict(e)):
+                raise
+            created = {"id": event_id}
+    return _calendar_event_result(created, summary)
+
+TOOLS = {
+    "create_email": create_email,
+    "create_doc": create_doc,
+    "create_calendar_event": create_calendar_event,
+}
+
+# tools that are a single API call: function_name -> (api, version, build request, shape result)
+BATCHABLE_TOOLS = {
+    "create_email": ("gmail", "v1", _email_request, _email_result),
+    "create_calendar_event": ("calendar", "v3", _calendar_event_request, _calendar_event_result),
+}
+
+def _tool_args(plan: dict, key: str | None) -> dict:
+    args = dict(plan["arguments"])
+    if key and plan["function_name"] == "create_calendar_event":
+        args["event_id"] = event_id(key)
+    return args
+
+async def execute_tool(plan: dict, user_id: str | None = None, key: str | None = None):
+    """Run one plan; key (stable across retries of the same plan) makes Calendar inserts idempotent."""
     fn = plan["function_name"]
-    args = plan["arguments"]
-
-    if fn == "create_email":
-        return create_email(**args, user_id=user_id)
-    elif fn == "create_doc":
-        return create_doc(**args, user_id=user_id)
-    elif fn == "create_calendar_event":
-        return create_calendar_event(**args, user_id=user_id)
-    else:
-        raise ValueError(f"Unknown function: {fn}")
\ No newline at end of file
+    args = _tool_args(plan, key)
+
+    tool = TOOLS.get(fn)
+    if tool is None:
+        raise ValueError(f"Unknown function: {fn}")
+    with span(f"tool.{fn}"):
+        with span("google.credentials"):
+            creds = await _get_creds(user_id)
+        started = time.perf_counter()
+        try:
+            # googleapiclient is blocking; keep it off the event loop
+            result = await asyncio.to_thread(tool, **args, creds=creds, user_id=user_id)
+        except Exception as e:
+            observe_tool(fn, time.perf_counter() - started, [e])
+            raise
+        observe_tool(fn, time.perf_counter() - started, [result])
+    return result
+
+def group_plans(plans: list) -> list[list[int]]:
+    """Group plan indices so that compatible plans can share one batch HTTP request."""
+    groups = []
+    batches = {}
+    for index, plan in enumerate(plans):
+        fn = plan.get("function_name") if isinstance(plan, dict) else None
+        if fn not in BATCHABLE_TOOLS:
+            groups.append([index])
+            continue
+        batch = batches.get(fn)
+        if batch is None or len(batch) >= settings.GOOGLE_BATCH_MAX_SIZE:
+            batch = batches[fn] = []
+            groups.append(batch)
+        batch.append(index)
+    return groups
+
+def _execute_batch(fn: str, arg_list: list, creds, user_id: str | None):
+    api, version, build_request, shape_result = BATCHABLE_TOOLS[fn]
+    outcomes = [None] * len(arg_list)
+
+    def callback(request_id, response, exception):
+        index = int(request_id)
+        if exception is not None and arg_list[index].get("event_id") and _is_conflict(exception):
+            response, exception = {"id": arg_list[index]["event_id"]}, None
+        if exception is not None:
+            outcomes[index] = exception
+            return
+        try:
+            outcomes[index] = shape_result(response, **arg_list[index])
+        except Exception as e:
+            outcomes[index] = e
+
+    with service_pool.lease(user_id, api, version, creds) as service:
+        batch = service.new_batch_http_request(callback=callback)
+        queued = 0
+        for index, args in enumerate(arg_list):
+            try:
+                batch.add(build_request(service, **args), request_id=str(index))
+                queued += 1
+            except Exception as e:
+                outcomes[index] = e
+        if queued:
+            try:
+                batch.execute()
+            except Exception as e:
+                outcomes = [e if outcome is None else outcome for outcome in outcomes]
+    return outcomes
+
+async def execute_tool_batch(plans: list, user_id: str | None = None, keys: list | None = None) -> list:
+    """Execute plans for the same batchable tool in one batch HTTP request.
+
+    Returns one outcome per plan, in order: the tool result, or the exception
+    raised for that plan. keys, one per plan, are passed on as in execute_tool.
+    """
+    keys = keys or [None] * len(plans)
+    if len(plans) == 1:
+        try:
+            return [await execute_tool(plans[0], user_id=user_id, key=keys[0])]
+        except Exception as e:
+            return [e]
+
+    fn = plans[0]["function_name"]
+    if fn not in BATCHABLE_TOOLS or any(plan["function_name"] != fn for plan in plans):
+        raise ValueError(f"Plans cannot be batched: {fn}")
+    with span(f"tool.{fn}", batch_size=len(plans)) as tool_span:
+        with span("google.credentials"):
+            creds = await _get_creds(user_id)
+        arg_list = [_tool_args(plan, key) for plan, key in zip(plans, keys)]
+        started = time.perf_counter()
+        outcomes = await asyncio.to_thread(_execute_batch, fn, arg_list, creds, user_id)
+        observe_tool(fn, time.perf_counter() - started, outcomes)
+        if tool_span is not None:
+            tool_span.set(failed=sum(1 for outcome in outcomes if isinstance(outcome, Exception)))
+    return outcomes
@@ -1,10 +1,24 @@
+import json
+import logging
+
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
+from agent.admission import AdmissionRejected
+from agent.context import build_context
 from agent.core import Agent
-from agent.tools import execute_tool
+from agent.streaming import MessageStreamer
+from agent.summarizer import local_summary
+from agent.executor import iter_plan_results, plan_shape_error
+from agent.plan_cache import plan_cache
+from agent.router import route
 from agent.schemas import ExecuteRequest
+from config import settings
 from dependencies.auth import get_current_user_id
 from services.messages import create_message
 from services.action_requests import create_action_request
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -20,34 +34,130 @@ def _needs_confirmation(plans: list) -> bool:
     return False
 
 
-@router.post("/respond")
-def execute_command(request: ExecuteRequest, user_id: str = Depends(get_current_user_id)):
-    message = request.message.strip()
-    if not message:
-        raise HTTPException(status_code=400, detail="Message is required")
+async def _routed_chat(agent: Agent, message: str, user_id: str, history: list, stream: bool):
+    """Answer small talk with ROUTER_CHAT_MODEL; yields token events, then ("reply", text or None)."""
+    streamed = False
+    try:
+        if stream:
+            streamer = MessageStreamer()
+            async for delta in agent.stream_request(
+                message=message,
+                user_id=user_id,
+                context=history,
+                mode="chat",
+                model=settings.ROUTER_CHAT_MODEL,
+            ):
+                text = streamer.feed(delta)
+                if text:
+                    streamed = True
+                    yield "token", {"text": text}
+            response = streamer.result()
+        else:
+            response = await agent.process_request(
+                message=message,
+                user_id=user_id,
+                context=history,
+                mode="chat",
+                model=settings.ROUTER_CHAT_MODEL,
+            )
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        if streamed:
+            raise HTTPException(status_code=500, detail=f"Agent chat failed: {e}")
+        yield "reply", None  # let the planner answer instead
+        return
+    yield "reply", (response.get("message") or None) if isinstance(response, dict) else None
+
+
+def _too_many_requests(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": e.retry_after_header})
+
 
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def _respond(message: str, user_id: str, stream: bool = False, summary_mode: str | None = None):
+    """Run one agent turn, yielding (event, data) pairs; the last one is ("done", response)."""
     # log user message (audit trail)
-    create_message(user_id, "user", message)
+    user_doc = await create_message(user_id, "user", message)
 
-    agent = Agent()
-    context = [{"role": "user", "content": message}]
+    # small talk skips the planner: a canned reply or the cheap chat model (agent/router.py)
+    with span("router") as router_span:
+        decision = route(message)
+        if router_span is not None:
+            router_span.set(route=decision.target, reason=decision.reason, confidence=round(decision.confidence, 3))
+    routed_reply = None
+    if decision.target == "canned":
+        routed_reply = decision.reply
+        if stream:
+            yield "token", {"text": routed_reply}
+    else:
+        agent = Agent()
+        # prior turns (recent history + rolling summary) for the planner
+        history = await build_context(user_id, exclude_id=user_doc["_id"])
+        # this turn only, for the post-execution summary
+        context = [{"role": "user", "content": message}]
 
-    # single plan call (no classify)
-    try:
-        plan_response = agent.process_request(
-            message=message,
-            user_id=user_id,
-            context=context,
-            mode="plan",
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Agent planning failed: {e}")
+    if decision.target == "chat":
+        try:
+            async for event, data in _routed_chat(agent, message, user_id, history, stream):
+                if event == "reply":
+                    routed_reply = data
+                else:
+                    yield event, data
+        except AdmissionRejected as e:
+            raise _too_many_requests(e)
+    if routed_reply is not None:
+        await create_message(user_id, "assistant", routed_reply)
+        yield "done", {"status": "completed", "results": [], "summary": routed_reply}
+        return
+
+    # single plan call (no classify), unless an equivalent plan is cached
+    plan_response = None
+    if settings.PLAN_CACHE_ENABLED:
+        with span("plan_cache.get") as cache_span:
+            plan_response = await plan_cache.get(user_id, "plan", message, history)
+            if cache_span is not None:
+                cache_span.set(hit=plan_response is not None)
+    if plan_response is not None:
+        if stream and plan_response.get("intent") == "chat":
+            yield "token", {"text": plan_response.get("message", "") or ""}
+    else:
+        try:
+            if stream:
+                streamer = MessageStreamer(intent="chat")
+                async for delta in agent.stream_request(
+                    message=message,
+                    user_id=user_id,
+                    context=history,
+                    mode="plan",
+                ):
+                    text = streamer.feed(delta)
+                    if text:
+                        yield "token", {"text": text}
+                plan_response = streamer.result()
+            else:
+                plan_response = await agent.process_request(
+                    message=message,
+                    user_id=user_id,
+                    context=history,
+                    mode="plan",
+                )
+        except AdmissionRejected as e:
+            raise _too_many_requests(e)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Agent planning failed: {e}")
+        if settings.PLAN_CACHE_ENABLED and plan_response.get("intent") in ("chat", "action"):
+            await plan_cache.put(user_id, "plan", message, plan_response, history)
 
     intent = plan_response.get("intent")
     if intent == "chat":
         reply = plan_response.get("message", "") or ""
-        create_message(user_id, "assistant", reply)
-        return {"status": "completed", "results": [], "summary": reply}
+        await create_message(user_id, "assistant", reply)
+        yield "done", {"status": "completed", "results": [], "summary": reply}
+        return
 
     if intent != "action":
         raise HTTPException(status_code=500, detail="Agent returned invalid intent")
@@ -58,6 +168,7 @@ def execute_command(request: ExecuteRequest, user_id: str = Depends(get_current_
 
     # SERVER-ENFORCED CONFIRMATION: do not trust the model to decide this.
     requires_confirmation = _needs_confirmation(plans)
+    yield "plan", {"plans": plans, "requires_confirmation": requires_confirmation}
 
     confirmation_message = (
         plan_response.get("confirmation_message")
@@ -66,58 +177,129 @@ def execute_command(request: ExecuteRequest, user_id: str = Depends(get_current_
 
     # confirmation path (store pending action request, do not execute yet)
     if requires_confirmation:
-        action_request_id = create_action_request(
+        action_request_id = await create_action_request(
             user_id=user_id,
             user_message=message,
             plans=plans,
             confirmation_message=confirmation_message,
         )
 
-        create_message(
+        await create_message(
             user_id,
             "assistant",
             f"{confirmation_message}\n\nReply with /confirm {action_request_id} to proceed, or /cancel {action_request_id}.",
         )
 
-        return {
+        response = {
             "status": "needs_confirmation",
             "action_request_id": action_request_id,
             "confirmation_message": confirmation_message,
             "plans": plans,
         }
+        yield "confirmation", response
+        yield "done", response
+        return
 
     # execute immediately (only for non-side-effect actions; can add read-only tools later)
-    results = []
-    for plan in plans:
-        if not isinstance(plan, dict):
-            results.append({"plan": plan, "error": "Plan is not a dictionary"})
+    results = [None] * len(plans)
+    runnable = []
+    for index, plan in enumerate(plans):
+        error = plan_shape_error(plan)
+        if error is not None:
+            results[index] = {"plan": plan, "error": error}
+            yield "tool_error", {"index": index, **results[index]}
             continue
 
-        fn = plan.get("function_name")
-        args = plan.get("arguments", {})
-        if not fn or not isinstance(args, dict):
-            results.append({"plan": plan, "error": "Invalid plan shape"})
-            continue
+        runnable.append(index)
+        yield "tool_start", {"index": index, "plan": plan}
+
+    async for position, entry in iter_plan_results([plans[i] for i in runnable], user_id):
+        index = runnable[position]
+        results[index] = entry
+        yield ("tool_result" if "result" in entry else "tool_error"), {"index": index, **entry}
+
+    for entry in results:
+        if "result" in entry:
+            await create_message(user_id, "tool", entry)
+            context.append({"role": "assistant", "content": {"tool_result": entry["result"]}})
 
+    # summarize: templated locally unless the LLM is requested or needed as fallback
+    with span("summary.local"):
+        summary_text = local_summary(results, mode=summary_mode)
+    if summary_text is not None:
+        if stream:
+            yield "token", {"text": summary_text}
+    else:
         try:
-            res = execute_tool(plan, user_id=user_id)
-            results.append({"plan": plan, "result": res})
-            create_message(user_id, "tool", {"plan": plan, "result": res})
-            context.append({"role": "assistant", "content": {"tool_result": res}})
+            if stream:
+                streamer = MessageStreamer()
+                async for delta in agent.stream_request(
+                    message="Summarize actions taken",
+                    user_id=user_id,
+                    context=context,
+                    mode="summarize",
+                ):
+                    text = streamer.feed(delta)
+                    if text:
+                        yield "token", {"text": text}
+                final_summary = streamer.result()
+            else:
+                final_summary = await agent.process_request(
+                    message="Summarize actions taken",
+                    user_id=user_id,
+                    context=context,
+                    mode="summarize",
+                )
+            summary_text = final_summary.get("message", "") or ""
         except Exception as e:
-            results.append({"plan": plan, "error": str(e)})
+            summary_text = f"Summary generation failed: {e}"
+
+    await create_message(user_id, "assistant", summary_text)
+    yield "done", {"status": "completed", "results": results, "summary": summary_text}
 
-    # summarize
-    try:
-        final_summary = agent.process_request(
-            message="Summarize actions taken",
-            user_id=user_id,
-            context=context,
-            mode="summarize",
-        )
-        summary_text = final_summary.get("message", "") or ""
-    except Exception as e:
-        summary_text = f"Summary generation failed: {e}"
 
-    create_message(user_id, "assistant", summary_text)
-    return {"status": "completed", "results": results, "summary": summary_text}
\ No newline at end of file
+def _validate_message(request: ExecuteRequest) -> str:
+    message = request.message.strip()
+    if not message:
+        raise HTTPException(status_code=400, detail="Message is required")
+    return message
+
+
+@router.post("/respond")
+async def execute_command(request: ExecuteRequest, user_id: str = Depends(get_current_user_id)):
+    message = _validate_message(request)
+    response = None
+    async for event, data in _respond(message, user_id, summary_mode=request.summary_mode):
+        if event == "done":
+            response = data
+    return response
+
+
+@router.post("/respond/stream")
+async def execute_command_stream(request: ExecuteRequest, user_id: str = Depends(get_current_user_id)):
+    """Server-Sent Events variant of /respond.
+
+    Events: token (reply/summary text), plan, confirmation, tool_start,
+    tool_result, tool_error, done (same body as /respond) and error.
+    """
+    message = _validate_message(request)
+
+    async def events():
+        try:
+            async for event, data in _respond(message, user_id, stream=True, summary_mode=request.summary_mode):
+                yield _sse(event, data)
+        except HTTPException as e:
+            error = {"status_code": e.status_code, "detail": e.detail}
+            if e.headers and "Retry-After" in e.headers:
+                error["retry_after"] = int(e.headers["Retry-After"])
+            yield _sse("error", error)
+        except Exception:
+            # the 200 and earlier events are already sent; end the stream with an error event, not a cut connection
+            logger.exception("Streamed response failed for user %s", user_id)
+            yield _sse("error", {"status_code": 500, "detail": "Internal server error"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
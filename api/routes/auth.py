@@ -3,16 +3,15 @@ from fastapi.responses import RedirectResponse
 from pydantic import BaseModel
 from uuid import uuid4
 from datetime import datetime
-import json
+import asyncio
 import os
 
-from google.oauth2 import id_token as google_id_token
-from google.auth.transport import requests as google_requests
-from google_auth_oauthlib.flow import Flow
-
+from agent.tools import forget_user_credentials
+from dependencies.auth import invalidate_user_cache
 from models.user import UserCreate, UserInDB
-from utils.security import hash_password, verify_password
+from utils.security import PasswordHasherBusy, password_hasher
 from utils.jwt import create_access_token
+from utils.oauth_client import oauth_client_config
 from db import users_collection
 from config import settings
 
@@ -38,25 +37,8 @@ FRONTEND_REDIRECT_URL = os.getenv(
     "FRONTEND_REDIRECT_URL", "http://localhost:5173"
 )
 
-def _load_client_config():
-    candidate_paths = []
-    if settings.GOOGLE_TOKEN_JSON_PATH:
-        candidate_paths.append(settings.GOOGLE_TOKEN_JSON_PATH)
-    candidate_paths.append(os.path.join(os.path.dirname(__file__), "..", "..", "credentials.json"))
-    candidate_paths.append(os.path.join(os.getcwd(), "credentials.json"))
-
-    for path in candidate_paths:
-        try:
-            if path and os.path.exists(path):
-                with open(path, "r", encoding="utf-8") as handle:
-                    payload = json.load(handle)
-                return payload.get("web") or payload.get("installed") or {}
-        except (OSError, json.JSONDecodeError):
-            continue
-    return {}
-
 def _build_web_config():
-    client_config = _load_client_config()
+    client_config = oauth_client_config.get()
     return {
         "client_id": client_config.get("client_id") or settings.GOOGLE_OAUTH_CLIENT_ID,
         "client_secret": client_config.get("client_secret"),
@@ -64,23 +46,35 @@ def _build_web_config():
         "token_uri": client_config.get("token_uri") or "https://oauth2.googleapis.com/token",
     }
 
+def _hasher_busy() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Too many sign-in requests, try again shortly",
+        headers={"Retry-After": "1"},
+    )
+
 @router.post("/register")
-def register_user(user: UserCreate):
-    existing = users_collection.find_one({"username": user.username})
+async def register_user(user: UserCreate):
+    existing = await users_collection.find_one({"username": user.username}, {"_id": 1})
     if existing:
         raise HTTPException(status_code=400, detail="Username already exists")
 
     user_id = str(uuid4())
+    try:
+        password_hash = await password_hasher.hash(user.password)
+    except PasswordHasherBusy:
+        raise _hasher_busy()
 
     user_in_db = UserInDB(
         user_id=user_id,
         username=user.username,
-        password_hash=hash_password(user.password),
+        password_hash=password_hash,
         email=user.email,
         created_at=datetime.utcnow(),
     )
 
-    users_collection.insert_one(user_in_db.model_dump())
+    await users_collection.insert_one(user_in_db.model_dump())
+    await invalidate_user_cache(user_id)
 
     return {"status": "registered", "user_id": user_id}
 
@@ -89,40 +83,59 @@ class LoginRequest(BaseModel):
     password: str
 
 @router.post("/login")
-def login(payload: LoginRequest):
-    user = users_collection.find_one({"username": payload.username})
+async def login(payload: LoginRequest):
+    user = await users_collection.find_one({"username": payload.username})
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
     stored_hash = user.get("password_hash") or ""
-    if not stored_hash or not verify_password(payload.password, stored_hash):
+    if not stored_hash:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    try:
+        valid, new_hash = await password_hasher.verify_and_update(payload.password, stored_hash)
+    except PasswordHasherBusy:
+        raise _hasher_busy()
+    if not valid:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        # cost changed since this hash was made (BCRYPT_ROUNDS)
+        await users_collection.update_one(
+            {"user_id": user["user_id"], "password_hash": stored_hash},
+            {"$set": {"password_hash": new_hash}},
+        )
 
+    await invalidate_user_cache(user["user_id"])
     token = create_access_token(user["user_id"])
     return {"status": "ok", "access_token": token, "user_id": user["user_id"]}
 
 @router.post("/google")
-def verify_google_token(payload: GoogleTokenRequest):
-    if not settings.GOOGLE_OAUTH_CLIENT_ID:
+async def verify_google_token(payload: GoogleTokenRequest):
+    client_id = oauth_client_config.client_id()
+    if not client_id:
         raise HTTPException(
             status_code=500,
             detail="GOOGLE_OAUTH_CLIENT_ID is not configured on the server",
         )
 
+    # the Google auth libraries are slow to import and only needed on these routes
+    from google.auth.transport import requests as google_requests
+    from google.oauth2 import id_token as google_id_token
+
     try:
-        id_info = google_id_token.verify_oauth2_token(
+        id_info = await asyncio.to_thread(
+            google_id_token.verify_oauth2_token,
             payload.id_token,
             google_requests.Request(),
-            settings.GOOGLE_OAUTH_CLIENT_ID,
+            client_id,
         )
     except ValueError:
         raise HTTPException(status_code=401, detail="Invalid Google ID token")
 
     user_id = id_info.get("sub") or str(uuid4())
     email = id_info.get("email")
-    existing = users_collection.find_one({"user_id": user_id})
+    existing = await users_collection.find_one({"user_id": user_id}, {"_id": 1})
     if not existing:
-        users_collection.insert_one(
+        await users_collection.insert_one(
             {
                 "user_id": user_id,
                 "username": email or user_id,
@@ -134,6 +147,7 @@ def verify_google_token(payload: GoogleTokenRequest):
                 "picture": id_info.get("picture"),
             }
         )
+        await invalidate_user_cache(user_id)
 
     token = create_access_token(user_id)
 
@@ -159,6 +173,8 @@ def google_authorize(user_id: str):
             detail="Missing Google OAuth client credentials (client_id/client_secret)",
         )
 
+    from google_auth_oauthlib.flow import Flow
+
     flow = Flow.from_client_config(
         {"web": web_config},
         scopes=SCOPES,
@@ -173,7 +189,7 @@ def google_authorize(user_id: str):
     return {"auth_url": auth_url}
 
 @router.get("/google/callback")
-def google_callback(code: str, state: str | None = None, user_id: str | None = None):
+async def google_callback(code: str, state: str | None = None, user_id: str | None = None):
     resolved_user_id = state or user_id
     if not resolved_user_id:
         raise HTTPException(status_code=400, detail="Missing user_id/state for Google callback")
@@ -185,18 +201,20 @@ def google_callback(code: str, state: str | None = None, user_id: str | None = N
             detail="Missing Google OAuth client credentials (client_id/client_secret)",
         )
 
+    from google_auth_oauthlib.flow import Flow
+
     flow = Flow.from_client_config(
         {"web": web_config},
         scopes=SCOPES,
         redirect_uri=DEFAULT_REDIRECT_URI,
     )
     try:
-        flow.fetch_token(code=code)
+        await asyncio.to_thread(flow.fetch_token, code=code)
     except Exception as exc:
         raise HTTPException(status_code=400, detail=f"Token exchange failed: {exc}") from exc
 
     creds = flow.credentials
-    users_collection.update_one(
+    await users_collection.update_one(
         {"user_id": resolved_user_id},
         {
             "$set": {
@@ -213,6 +231,8 @@ def google_callback(code: str, state: str | None = None, user_id: str | None = N
         },
         upsert=True,
     )
+    await forget_user_credentials(resolved_user_id)
+    await invalidate_user_cache(resolved_user_id)
 
     redirect_url = (
         f"{FRONTEND_REDIRECT_URL}"
@@ -223,8 +243,8 @@ def google_callback(code: str, state: str | None = None, user_id: str | None = N
     return RedirectResponse(url=redirect_url, status_code=302)
 
 @router.get("/google/status")
-def google_status(user_id: str):
-    user = users_collection.find_one({"user_id": user_id})
+async def google_status(user_id: str):
+    user = await users_collection.find_one({"user_id": user_id}, {"google_tokens": 1})
     tokens = user.get("google_tokens") if user else None
     connected = bool(tokens and tokens.get("token"))
     return {"connected": connected}
\ No newline at end of file
@@ -1,58 +1,88 @@
+import asyncio
+import time
+from typing import Literal
+
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from dependencies.auth import get_current_user_id
-from agent.tools import execute_tool
-from agent.core import Agent
-from services.action_requests import get_action_request, mark_action_request
+from agent.jobs import wake_workers
+from config import settings
+from services.action_requests import (
+    cancel_action_request,
+    enqueue_action_request,
+    get_action_request,
+    is_expired,
+)
 from services.messages import create_message
 
 router = APIRouter()
 
+FINAL_STATUSES = {"executed", "failed", "canceled"}
+
 class ConfirmRequest(BaseModel):
     action_request_id: str
     approved: bool
+    summary_mode: Literal["local", "llm"] | None = None
+    # block until the job finishes (up to ACTION_CONFIRM_WAIT_SECONDS) and return its result
+    wait: bool = False
 
-@router.post("/confirm")
-def confirm_action(payload: ConfirmRequest, user_id: str = Depends(get_current_user_id)):
-    req = get_action_request(user_id=user_id, action_request_id=payload.action_request_id)
-    if not req:
-        raise HTTPException(status_code=404, detail="Action request not found")
+def _status_payload(req: dict) -> dict:
+    status = "expired" if is_expired(req) else req.get("status")
+    payload = {"status": status, "action_request_id": str(req["_id"]), "attempts": req.get("attempts", 0)}
+    if status == "executed":
+        payload.update(status="completed", results=req.get("results", []), summary=req.get("summary", ""))
+    elif status == "failed":
+        payload.update(error=req.get("error"), results=req.get("results", []))
+    elif status == "queued" and req.get("last_error"):
+        payload.update(retry_at=req.get("run_after"), last_error=req.get("last_error"))
+    return payload
+
+async def _wait_for(action_request_id: str, user_id: str) -> dict:
+    deadline = time.monotonic() + settings.ACTION_CONFIRM_WAIT_SECONDS
+    delay = 0.05
+    while True:
+        req = await get_action_request(user_id=user_id, action_request_id=action_request_id)
+        if not req:
+            # deleted (TTL or retention) while we waited
+            raise HTTPException(status_code=404, detail="Action request not found")
+        if req.get("status") in FINAL_STATUSES or time.monotonic() >= deadline:
+            return req
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 1.0)
 
-    if req.get("status") != "pending":
-        raise HTTPException(status_code=400, detail=f"Action request is not pending (status={req.get('status')})")
+async def _not_pending(action_request_id: str, user_id: str) -> HTTPException:
+    # only on the rejection path: find out why the transition did not match
+    req = await get_action_request(user_id=user_id, action_request_id=action_request_id)
+    if not req:
+        return HTTPException(status_code=404, detail="Action request not found")
+    if is_expired(req):
+        return HTTPException(status_code=410, detail="Action request expired")
+    return HTTPException(status_code=400, detail=f"Action request is not pending (status={req.get('status')})")
 
+@router.post("/confirm")
+async def confirm_action(payload: ConfirmRequest, user_id: str = Depends(get_current_user_id)):
+    # pending -> canceled | queued in one conditional update, so concurrent confirms can't both win
     if not payload.approved:
-        mark_action_request(payload.action_request_id, user_id, "canceled")
-        create_message(user_id, "assistant", "Okay — I won’t do that.")
+        if await cancel_action_request(payload.action_request_id, user_id) is None:
+            raise await _not_pending(payload.action_request_id, user_id)
+        await create_message(user_id, "assistant", "Okay — I won’t do that.")
         return {"status": "canceled", "summary": "Okay — I won’t do that."}
 
-    # approved -> execute
-    mark_action_request(payload.action_request_id, user_id, "approved")
-
-    plans = req.get("plans") or []
-    results = []
-    context = [{"role": "user", "content": req.get("user_message", "")}]
-
-    for plan in plans:
-        try:
-            res = execute_tool(plan, user_id=user_id)
-            results.append({"plan": plan, "result": res})
-            context.append({"role": "assistant", "content": {"tool_result": res}})
-            create_message(user_id, "tool", {"plan": plan, "result": res})
-        except Exception as e:
-            results.append({"plan": plan, "error": str(e)})
-            mark_action_request(payload.action_request_id, user_id, "failed", {"error": str(e)})
-            raise HTTPException(status_code=500, detail=f"Tool execution failed: {e}")
-
-    agent = Agent()
-    final_summary = agent.process_request(
-        message="Summarize actions taken",
-        user_id=user_id,
-        context=context,
-        mode="summarize",
-    )
-    summary_text = final_summary.get("message", "Done.")
-    create_message(user_id, "assistant", summary_text)
-    mark_action_request(payload.action_request_id, user_id, "executed", {"results": results})
-
-    return {"status": "completed", "results": results, "summary": summary_text}
\ No newline at end of file
+    # approved -> queue for a worker (agent/jobs.py); poll GET /confirm/{id} for the outcome
+    if await enqueue_action_request(payload.action_request_id, user_id, payload.summary_mode) is None:
+        raise await _not_pending(payload.action_request_id, user_id)
+    wake_workers()
+    if not payload.wait:
+        return {"status": "queued", "action_request_id": payload.action_request_id}
+
+    req = await _wait_for(payload.action_request_id, user_id)
+    if req.get("status") == "failed":
+        raise HTTPException(status_code=500, detail=f"Tool execution failed: {req.get('error')}")
+    return _status_payload(req)
+
+@router.get("/confirm/{action_request_id}")
+async def confirm_status(action_request_id: str, user_id: str = Depends(get_current_user_id)):
+    req = await get_action_request(user_id=user_id, action_request_id=action_request_id)
+    if not req:
+        raise HTTPException(status_code=404, detail="Action request not found")
+    return _status_payload(req)
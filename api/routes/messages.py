@@ -10,17 +10,34 @@ class MessageCreate(BaseModel):
     content: dict | str
 
 @router.post("/messages")
-def post_message(payload: MessageCreate, user_id: str = Depends(get_current_user_id)):
-    doc = create_message(user_id=user_id, role=payload.role, content=payload.content)
+async def post_message(payload: MessageCreate, user_id: str = Depends(get_current_user_id)):
+    doc = await create_message(user_id=user_id, role=payload.role, content=payload.content, wait=True)
     return {"status": "ok", "message_id": str(doc["_id"])}
 
 @router.get("/messages")
-def get_messages(limit: int = 50, user_id: str = Depends(get_current_user_id)):
-    return {"status": "ok", "messages": list_messages(user_id=user_id, limit=min(limit, 200))}
+async def get_messages(
+    limit: int = 50,
+    before: str | None = None,
+    after: str | None = None,
+    fields: str | None = None,
+    user_id: str = Depends(get_current_user_id),
+):
+    # before and after together select the window between two cursors (services/messages.py)
+    try:
+        page = await list_messages(
+            user_id=user_id,
+            limit=max(1, min(limit, 200)),
+            before=before,
+            after=after,
+            fields=[f.strip() for f in fields.split(",") if f.strip()] if fields else None,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "ok", **page}
 
 @router.get("/messages/{message_id}")
-def get_one_message(message_id: str, user_id: str = Depends(get_current_user_id)):
-    msg = get_message(user_id=user_id, message_id=message_id)
+async def get_one_message(message_id: str, user_id: str = Depends(get_current_user_id)):
+    msg = await get_message(user_id=user_id, message_id=message_id)
     if not msg:
         raise HTTPException(status_code=404, detail="Message not found")
     return {"status": "ok", "message": msg}
\ No newline at end of file
@@ -0,0 +1,66 @@
+"""The API app wired for benchmarking: in-memory MongoDB plus seeded users.
+
+    MONGODB_DRIVER=memory uvicorn bench.app:app
+
+Seeds BENCH_USERS users (bench-user-0 ... bench-user-N-1) at startup, each
+with the password BENCH_PASSWORD and Google tokens whose token_uri points at
+GOOGLE_API_ENDPOINT. The load driver mints JWTs for the same user ids (see
+bench.loadgen).
+"""
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+import db
+from bench.memory_mongo import MemoryClient
+from utils.security import hash_password
+
+db.DRIVERS.setdefault("memory", MemoryClient)
+
+from config import settings  # noqa: E402
+from main import app  # noqa: E402
+
+BENCH_USERS = int(os.getenv("BENCH_USERS", "100"))
+BENCH_PASSWORD = "bench-password"
+
+
+def user_id_for(index: int) -> str:
+    return f"bench-user-{index}"
+
+
+async def seed_users(count: int):
+    root = (settings.GOOGLE_API_ENDPOINT or "https://oauth2.googleapis.com").rstrip("/")
+    expiry = (datetime.utcnow() + timedelta(days=1)).isoformat()
+    password_hash = hash_password(BENCH_PASSWORD)
+    for index in range(count):
+        user_id = user_id_for(index)
+        await db.users_collection.update_one(
+            {"user_id": user_id},
+            {"$set": {
+                "user_id": user_id,
+                "username": user_id,
+                "password_hash": password_hash,
+                "google_tokens": {
+                    "token": f"bench-token-{index}",
+                    "refresh_token": f"bench-refresh-{index}",
+                    "token_uri": f"{root}/token",
+                    "client_id": "bench-client",
+                    "client_secret": "bench-secret",
+                    "expiry": expiry,
+                },
+            }},
+            upsert=True,
+        )
+
+
+_app_lifespan = app.router.lifespan_context
+
+
+@asynccontextmanager
+async def _bench_lifespan(app_):
+    async with _app_lifespan(app_) as state:
+        await seed_users(BENCH_USERS)
+        yield state
+
+
+app.router.lifespan_context = _bench_lifespan
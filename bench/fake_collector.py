@@ -0,0 +1,64 @@
+"""Local stand-in for an OTLP/HTTP trace collector (JSON encoding).
+
+Receives spans on POST /v1/traces and appends them, flattened to the same
+shape as the app's JSONL exporter, to FAKE_COLLECTOR_PATH (default
+collector_traces.jsonl), so python -m bench.traces reads either file.
+
+    uvicorn bench.fake_collector:app --port 4318
+"""
+import json
+import os
+
+from fastapi import FastAPI, Request
+
+PATH = os.getenv("FAKE_COLLECTOR_PATH", "collector_traces.jsonl")
+
+app = FastAPI(title="fake-collector")
+counters = {"requests": 0, "spans": 0}
+
+
+def _value(value: dict):
+    if "intValue" in value:
+        return int(value["intValue"])
+    if "doubleValue" in value:
+        return float(value["doubleValue"])
+    if "boolValue" in value:
+        return bool(value["boolValue"])
+    return value.get("stringValue")
+
+
+def flatten(payload: dict) -> list:
+    spans = []
+    for resource_spans in payload.get("resourceSpans") or []:
+        for scope_spans in resource_spans.get("scopeSpans") or []:
+            for item in scope_spans.get("spans") or []:
+                start_ns, end_ns = int(item["startTimeUnixNano"]), int(item["endTimeUnixNano"])
+                status = item.get("status") or {}
+                spans.append({
+                    "trace_id": item["traceId"],
+                    "span_id": item["spanId"],
+                    "parent_id": item.get("parentSpanId") or None,
+                    "name": item["name"],
+                    "start_ns": start_ns,
+                    "end_ns": end_ns,
+                    "duration_ms": (end_ns - start_ns) / 1e6,
+                    "attributes": {attr["key"]: _value(attr["value"]) for attr in item.get("attributes") or []},
+                    "error": status.get("message") if status.get("code") == 2 else None,
+                })
+    return spans
+
+
+@app.get("/health")
+def health():
+    return {"status": "ok", **counters}
+
+
+@app.post("/v1/traces")
+async def traces(request: Request):
+    spans = flatten(await request.json())
+    counters["requests"] += 1
+    counters["spans"] += len(spans)
+    with open(PATH, "a", encoding="utf-8") as handle:
+        for item in spans:
+            handle.write(json.dumps(item) + "\n")
+    return {"partialSuccess": {}}
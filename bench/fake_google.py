@@ -0,0 +1,157 @@
+"""Local stand-in for the Gmail, Docs and Calendar endpoints the tools call.
+
+Point the app at it with GOOGLE_API_ENDPOINT=http://127.0.0.1:<port>/; seeded
+bench users carry a token_uri on the same host, so token refreshes land here
+too. Batch requests (multipart/mixed, as built by googleapiclient) are
+unpacked and answered part by part after a single delay. A calendar insert
+with an event id that was already used gets 409, like the real API.
+
+    uvicorn bench.fake_google:app --port 9102
+
+Knobs (environment):
+    FAKE_GOOGLE_LATENCY_MS   delay per HTTP request, batch included (default 150)
+    FAKE_GOOGLE_JITTER_MS    uniform +/- jitter on that delay (default 50)
+    FAKE_GOOGLE_ERROR_RATE   fraction of API calls (and batch parts) answered 503 (default 0)
+"""
+import asyncio
+import itertools
+import json
+import os
+import random
+import re
+import uuid
+from email.parser import BytesParser, Parser
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+
+LATENCY_MS = float(os.getenv("FAKE_GOOGLE_LATENCY_MS", "150"))
+JITTER_MS = float(os.getenv("FAKE_GOOGLE_JITTER_MS", "50"))
+ERROR_RATE = float(os.getenv("FAKE_GOOGLE_ERROR_RATE", "0"))
+
+app = FastAPI(title="fake-google")
+_ids = itertools.count(1)
+_event_ids = set()
+counters = {"requests": 0, "batches": 0, "batched_parts": 0, "token_refreshes": 0, "injected_errors": 0}
+
+
+def _delay() -> float:
+    return max(0.0, LATENCY_MS + random.uniform(-JITTER_MS, JITTER_MS)) / 1000
+
+
+def _next_id(prefix: str) -> str:
+    return f"{prefix}{next(_ids):08d}"
+
+
+def _send_message(body: dict, **_):
+    if not body.get("raw"):
+        return 400, {"error": {"code": 400, "message": "Missing raw message"}}
+    return 200, {"id": _next_id("msg"), "threadId": _next_id("thr"), "labelIds": ["SENT"]}
+
+
+def _create_document(body: dict, **_):
+    return 200, {"documentId": _next_id("doc"), "title": body.get("title", "Untitled")}
+
+
+def _update_document(body: dict, document_id: str, **_):
+    return 200, {"documentId": document_id, "replies": [{} for _ in body.get("requests", [])]}
+
+
+def _insert_event(body: dict, calendar_id: str, **_):
+    event_id = body.get("id") or _next_id("evt")
+    if event_id in _event_ids:
+        return 409, {"error": {"code": 409, "message": "The requested identifier already exists.", "status": "ALREADY_EXISTS"}}
+    _event_ids.add(event_id)
+    return 200, {
+        "id": event_id,
+        "status": "confirmed",
+        "htmlLink": f"https://calendar.example/{calendar_id}/{event_id}",
+        "summary": body.get("summary"),
+        "start": body.get("start"),
+        "end": body.get("end"),
+    }
+
+
+# (method, path pattern) -> handler(body, **path params) -> (status, payload)
+ROUTES = [
+    ("POST", re.compile(r"^/gmail/v1/users/(?P<user_id>[^/]+)/messages/send$"), _send_message),
+    ("POST", re.compile(r"^/v1/documents$"), _create_document),
+    ("POST", re.compile(r"^/v1/documents/(?P<document_id>[^/:]+):batchUpdate$"), _update_document),
+    ("POST", re.compile(r"^/calendar/v3/calendars/(?P<calendar_id>[^/]+)/events$"), _insert_event),
+]
+
+
+def dispatch(method: str, path: str, raw_body: bytes) -> tuple[int, dict]:
+    path = path.split("?", 1)[0]
+    if ERROR_RATE and random.random() < ERROR_RATE:
+        counters["injected_errors"] += 1
+        return 503, {"error": {"code": 503, "message": "Injected backend error", "status": "UNAVAILABLE"}}
+    for route_method, pattern, handler in ROUTES:
+        match = pattern.match(path)
+        if route_method == method and match:
+            try:
+                body = json.loads(raw_body) if raw_body.strip() else {}
+            except ValueError:
+                return 400, {"error": {"code": 400, "message": "Invalid JSON body"}}
+            return handler(body, **match.groupdict())
+    return 404, {"error": {"code": 404, "message": f"No fake for {method} {path}"}}
+
+
+def _split_parts(content_type: str, body: bytes) -> list:
+    message = BytesParser().parsebytes(b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body)
+    return message.get_payload() if message.is_multipart() else []
+
+
+def _answer_part(part) -> str:
+    payload = part.get_payload()
+    if isinstance(payload, list):
+        payload = payload[0].as_string()
+    request_line, _, rest = payload.lstrip("\r\n").partition("\n")
+    method, path, _version = request_line.strip().split(" ", 2)
+    inner = Parser().parsestr(rest)
+    status, result = dispatch(method, path, (inner.get_payload() or "").encode())
+    content_id = part.get("Content-ID", "")
+    response_id = f"<response-{content_id[1:]}" if content_id.startswith("<") else content_id
+    reason = "OK" if status == 200 else "Error"
+    body = json.dumps(result)
+    return (
+        "Content-Type: application/http\r\n"
+        f"Content-ID: {response_id}\r\n\r\n"
+        f"HTTP/1.1 {status} {reason}\r\n"
+        "Content-Type: application/json; charset=UTF-8\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n"
+        f"{body}\r\n"
+    )
+
+
+@app.get("/health")
+def health():
+    return {"status": "ok", **counters}
+
+
+@app.post("/token")
+async def token():
+    counters["token_refreshes"] += 1
+    await asyncio.sleep(_delay())
+    return {"access_token": f"fake-{uuid.uuid4().hex}", "expires_in": 3600, "token_type": "Bearer"}
+
+
+@app.post("/batch")
+@app.post("/batch/{api_path:path}")
+async def batch(request: Request, api_path: str = ""):
+    counters["requests"] += 1
+    counters["batches"] += 1
+    parts = _split_parts(request.headers.get("content-type", ""), await request.body())
+    counters["batched_parts"] += len(parts)
+    await asyncio.sleep(_delay())
+    boundary = f"batch_{uuid.uuid4().hex}"
+    body = "".join(f"--{boundary}\r\n{_answer_part(part)}" for part in parts) + f"--{boundary}--\r\n"
+    return Response(content=body, media_type=f"multipart/mixed; boundary={boundary}")
+
+
+@app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE"])
+async def api(path: str, request: Request):
+    counters["requests"] += 1
+    await asyncio.sleep(_delay())
+    status, result = dispatch(request.method, "/" + path, await request.body())
+    return JSONResponse(result, status_code=status)
@@ -0,0 +1,196 @@
+"""Local stand-in for the OpenAI chat-completions API.
+
+Answers each prompt the agent sends (plan, chat, summarize, condense) with a
+canned JSON reply after a configurable delay, streaming it in chunks when
+asked. Plans are chosen from keywords in the user request:
+"email"/"mail" -> create_email, "doc" -> create_doc,
+"calendar"/"meeting"/"event" -> create_calendar_event; several keywords give
+several plans, anything else is a chat reply.
+
+    uvicorn bench.fake_openai:app --port 9101
+
+Knobs (environment):
+    FAKE_OPENAI_LATENCY_MS   time to first token (default 400)
+    FAKE_OPENAI_JITTER_MS    uniform +/- jitter on that delay (default 100)
+    FAKE_OPENAI_TOKEN_MS     delay between streamed chunks (default 15)
+    FAKE_OPENAI_MINI_FACTOR  latency multiplier for "mini"/"nano" models (default 0.4)
+    FAKE_OPENAI_ERROR_RATE   fraction of requests answered 503 (default 0)
+    FAKE_OPENAI_SLOW_RATE    fraction of requests delayed by FAKE_OPENAI_SLOW_MS more (default 0)
+    FAKE_OPENAI_SLOW_MS      extra delay for those (default 5000)
+    FAKE_OPENAI_FAULT_MODEL  inject errors and slowness for this model only (default: all)
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+LATENCY_MS = float(os.getenv("FAKE_OPENAI_LATENCY_MS", "400"))
+JITTER_MS = float(os.getenv("FAKE_OPENAI_JITTER_MS", "100"))
+TOKEN_MS = float(os.getenv("FAKE_OPENAI_TOKEN_MS", "15"))
+MINI_FACTOR = float(os.getenv("FAKE_OPENAI_MINI_FACTOR", "0.4"))
+ERROR_RATE = float(os.getenv("FAKE_OPENAI_ERROR_RATE", "0"))
+SLOW_RATE = float(os.getenv("FAKE_OPENAI_SLOW_RATE", "0"))
+SLOW_MS = float(os.getenv("FAKE_OPENAI_SLOW_MS", "5000"))
+FAULT_MODEL = os.getenv("FAKE_OPENAI_FAULT_MODEL", "")
+CHUNK_CHARS = 12
+
+_ADDRESS_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.]+")
+
+app = FastAPI(title="fake-openai")
+counters = {"requests": 0, "injected_errors": 0, "slowed": 0}
+models = {}  # model -> requests
+
+
+def _delay(model: str = "") -> float:
+    delay = max(0.0, LATENCY_MS + random.uniform(-JITTER_MS, JITTER_MS))
+    if "mini" in model or "nano" in model:
+        delay *= MINI_FACTOR
+    if SLOW_RATE and (not FAULT_MODEL or model == FAULT_MODEL) and random.random() < SLOW_RATE:
+        counters["slowed"] += 1
+        delay += SLOW_MS
+    return delay / 1000
+
+
+def _injected_error(model: str) -> bool:
+    if ERROR_RATE and (not FAULT_MODEL or model == FAULT_MODEL) and random.random() < ERROR_RATE:
+        counters["injected_errors"] += 1
+        return True
+    return False
+
+
+def _section(prompt: str, header: str) -> str:
+    """Text between a prompt header line and the next blank line."""
+    start = prompt.find(header)
+    if start < 0:
+        return ""
+    body = prompt[start + len(header):].strip("\n")
+    return body.split("\n\n", 1)[0].strip()
+
+
+def _plans(request: str) -> list:
+    text = request.lower()
+    plans = []
+    if "email" in text or "mail" in text:
+        match = _ADDRESS_RE.search(request)
+        plans.append({
+            "function_name": "create_email",
+            "arguments": {
+                "to": match.group(0) if match else "someone@example.com",
+                "subject": "Quick update",
+                "body": f"Hi, following up on: {request}",
+            },
+        })
+    if "doc" in text:
+        plans.append({
+            "function_name": "create_doc",
+            "arguments": {"title": "Notes", "content": request},
+        })
+    if "calendar" in text or "meeting" in text or "event" in text:
+        plans.append({
+            "function_name": "create_calendar_event",
+            "arguments": {"summary": "Team sync"},
+        })
+    return plans
+
+
+def reply_for(prompt: str) -> dict:
+    """The canned JSON reply for one agent prompt."""
+    if "User request:" in prompt:
+        request = _section(prompt, "User request:")
+        plans = _plans(request)
+        if not plans:
+            return {"intent": "chat", "message": f"Sure — here is a short answer about: {request[:80]}"}
+        return {
+            "intent": "action",
+            "requires_confirmation": True,
+            "confirmation_message": f"Should I run {len(plans)} action(s) for you?",
+            "plans": plans,
+        }
+    if "Update the running summary" in prompt:
+        return {"summary": "The user has been asking the assistant for emails, docs and meetings."}
+    if "We are preparing a final response" in prompt:
+        return {"message": "All done — your actions completed."}
+    message = _section(prompt, "User message:")
+    return {"message": f"Happy to help with: {message[:80]}"}
+
+
+def _usage(messages: list, content: str) -> dict:
+    prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4
+    completion_tokens = len(content) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+@app.get("/health")
+def health():
+    return {"status": "ok", **counters, "models": models}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages") or []
+    prompt = str(messages[-1].get("content", "")) if messages else ""
+    content = json.dumps(reply_for(prompt))
+    model = body.get("model", "gpt-4.1")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+    counters["requests"] += 1
+    models[model] = models.get(model, 0) + 1
+
+    if _injected_error(model):
+        await asyncio.sleep(_delay(model) / 4)
+        return JSONResponse(
+            {"error": {"message": "Injected overload", "type": "server_error", "code": None}},
+            status_code=503,
+        )
+    await asyncio.sleep(_delay(model))
+
+    if not body.get("stream"):
+        return JSONResponse({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": _usage(messages, content),
+        })
+
+    include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+    def chunk(delta: dict, finish_reason=None, usage=None, choices=True) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if choices else [],
+        }
+        if usage is not None:
+            payload["usage"] = usage
+        return f"data: {json.dumps(payload)}\n\n"
+
+    async def events():
+        yield chunk({"role": "assistant", "content": ""})
+        for start in range(0, len(content), CHUNK_CHARS):
+            yield chunk({"content": content[start:start + CHUNK_CHARS]})
+            await asyncio.sleep(TOKEN_MS / 1000)
+        yield chunk({}, finish_reason="stop")
+        if include_usage:
+            yield chunk({}, usage=_usage(messages, content), choices=False)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
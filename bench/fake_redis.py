@@ -0,0 +1,217 @@
+"""Local stand-in for Redis, enough for CACHE_BACKEND=redis (utils/cache.py).
+
+Speaks RESP2 (HELLO 3 is refused) and implements the commands the cache
+uses: GET, SET with EX/PX/NX/XX, DEL, EXISTS, PTTL/TTL, PUBLISH and
+SUBSCRIBE, plus PING, DBSIZE, FLUSHALL and INFO. Keys expire lazily and in
+a once-a-second sweep; past FAKE_REDIS_MAXKEYS the least recently used key
+is evicted, like maxmemory-policy allkeys-lru.
+
+    python -m bench.fake_redis --port 6390
+
+Knobs (environment):
+    FAKE_REDIS_MAXKEYS      keys kept before LRU eviction (default 100000)
+    FAKE_REDIS_LATENCY_MS   delay before each reply (default 0)
+"""
+import argparse
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+MAXKEYS = int(os.getenv("FAKE_REDIS_MAXKEYS", "100000"))
+LATENCY_MS = float(os.getenv("FAKE_REDIS_LATENCY_MS", "0"))
+
+_data = OrderedDict()  # key -> (value, expires_at monotonic | None)
+_subscribers = {}  # channel -> set of writers
+counters = {"commands": 0, "hits": 0, "misses": 0, "evictions": 0, "expired": 0, "published": 0, "delivered": 0}
+
+
+class _Error(Exception):
+    pass
+
+
+def _encode(value) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, _Error):
+        return f"-{value}\r\n".encode()
+    if isinstance(value, bool):
+        return b"+OK\r\n" if value else b"$-1\r\n"
+    if isinstance(value, int):
+        return f":{value}\r\n".encode()
+    if isinstance(value, str):
+        value = value.encode()
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    return b"*%d\r\n" % len(value) + b"".join(_encode(item) for item in value)
+
+
+async def _read_command(reader: asyncio.StreamReader) -> list | None:
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        return line.split()
+    args = []
+    for _ in range(int(line[1:])):
+        size = int((await reader.readline())[1:])
+        args.append((await reader.readexactly(size + 2))[:-2])
+    return args
+
+
+def _live(key: bytes):
+    item = _data.get(key)
+    if item is None:
+        return None
+    if item[1] is not None and item[1] <= time.monotonic():
+        del _data[key]
+        counters["expired"] += 1
+        return None
+    _data.move_to_end(key)
+    return item
+
+
+def _sweep():
+    now = time.monotonic()
+    for key in [key for key, (_value, expires_at) in _data.items() if expires_at is not None and expires_at <= now]:
+        del _data[key]
+        counters["expired"] += 1
+
+
+def _set(args: list):
+    key, value, options = args[0], args[1], [arg.upper() for arg in args[2:]]
+    ttl = None
+    for flag, scale in ((b"EX", 1.0), (b"PX", 0.001)):
+        if flag in options:
+            ttl = float(args[2 + options.index(flag) + 1]) * scale
+    exists = _live(key) is not None
+    if (b"NX" in options and exists) or (b"XX" in options and not exists):
+        return None
+    _data[key] = (value, time.monotonic() + ttl if ttl is not None else None)
+    _data.move_to_end(key)
+    while len(_data) > MAXKEYS:
+        _data.popitem(last=False)
+        counters["evictions"] += 1
+    return True
+
+
+def _pttl(key: bytes) -> int:
+    item = _live(key)
+    if item is None:
+        return -2
+    return -1 if item[1] is None else max(0, int((item[1] - time.monotonic()) * 1000))
+
+
+def _info() -> str:
+    return "".join(f"{name}:{value}\r\n" for name, value in {**counters, "keys": len(_data)}.items())
+
+
+def _publish(channel: bytes, message: bytes) -> int:
+    counters["published"] += 1
+    writers = _subscribers.get(channel, set())
+    for writer in list(writers):
+        writer.write(_encode([b"message", channel, message]))
+    counters["delivered"] += len(writers)
+    return len(writers)
+
+
+def execute(args: list):
+    name = args[0].upper()
+    args = args[1:]
+    counters["commands"] += 1
+    if name == b"PING":
+        return args[0] if args else b"PONG"
+    if name == b"GET":
+        item = _live(args[0])
+        counters["hits" if item else "misses"] += 1
+        return item[0] if item else None
+    if name == b"SET":
+        return _set(args)
+    if name == b"DEL":
+        return sum(_data.pop(key, None) is not None for key in args)
+    if name == b"EXISTS":
+        return sum(_live(key) is not None for key in args)
+    if name == b"PTTL":
+        return _pttl(args[0])
+    if name == b"TTL":
+        ttl = _pttl(args[0])
+        return ttl if ttl < 0 else ttl // 1000
+    if name == b"PUBLISH":
+        return _publish(args[0], args[1])
+    if name == b"DBSIZE":
+        return len(_data)
+    if name == b"FLUSHALL":
+        _data.clear()
+        return True
+    if name == b"INFO":
+        return _info()
+    if name == b"HELLO":
+        if args and args[0] != b"2":
+            return _Error("NOPROTO this server only speaks RESP2")
+        return [b"server", b"fake-redis", b"proto", 2]
+    if name in (b"SELECT", b"CLIENT"):
+        return True
+    return _Error(f"ERR unknown command '{name.decode(errors='replace')}'")
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    channels = set()
+    try:
+        while True:
+            args = await _read_command(reader)
+            if args is None:
+                break
+            if not args:
+                continue
+            if LATENCY_MS:
+                await asyncio.sleep(LATENCY_MS / 1000)
+            name = args[0].upper()
+            if name in (b"SUBSCRIBE", b"UNSUBSCRIBE"):
+                for channel in args[1:]:
+                    if name == b"SUBSCRIBE":
+                        channels.add(channel)
+                        _subscribers.setdefault(channel, set()).add(writer)
+                    else:
+                        channels.discard(channel)
+                        _subscribers.get(channel, set()).discard(writer)
+                    writer.write(_encode([name.lower(), channel, len(channels)]))
+            else:
+                writer.write(_encode(execute(args)))
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        for channel in channels:
+            _subscribers.get(channel, set()).discard(writer)
+        writer.close()
+
+
+async def _sweeper():
+    while True:
+        await asyncio.sleep(1)
+        _sweep()
+
+
+async def serve(host: str, port: int):
+    server = await asyncio.start_server(_handle, host, port)
+    sweeper = asyncio.create_task(_sweeper())
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        sweeper.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Import-time budget for the API process.
+
+    python -m bench.import_time --budget-ms 1500
+
+Imports the app module (main by default) in fresh interpreters under
+-X importtime and reports the median cumulative import time with the
+slowest top-level imports. Exits 1 when the median is over budget or when
+one of the modules kept off the startup path (--lazy) was imported anyway,
+so a stray top-level import fails CI before it slows down every worker.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# heavy, rarely needed at startup; each is imported where it is first used
+LAZY = ["openai", "googleapiclient", "google_auth_oauthlib", "google.auth", "google.oauth2", "passlib", "redis"]
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def profile(module: str) -> list[tuple[str, int, int, int]]:
+    """(name, depth, self us, cumulative us) for the modules `import module` loaded, module last."""
+    env = {"OPENAI_API_KEY": "import-time", "MONGODB_URL": "memory://", **os.environ}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, (len(indent) - 1) // 2, int(self_us), int(cumulative_us)))
+    # children are printed before their parent; interpreter startup (site, ...) comes first
+    end = max(i for i, row in enumerate(rows) if row[0] == module and row[1] == 0)
+    start = max([i + 1 for i, row in enumerate(rows[:end]) if row[1] == 0] + [0])
+    return rows[start:end + 1]
+
+
+def _lazy_prefix(name: str, lazy: list) -> str | None:
+    return next((prefix for prefix in lazy if name == prefix or name.startswith(prefix + ".")), None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--budget-ms", type=float, default=1500, help="maximum median import time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    parser.add_argument("--lazy", action="append", default=None, metavar="MODULE",
+                        help=f"module that must not be imported at startup (default: {', '.join(LAZY)})")
+    args = parser.parse_args()
+    lazy = args.lazy if args.lazy is not None else LAZY
+
+    # the first run also warms the bytecode cache
+    profile(args.module)
+    runs = [profile(args.module) for _ in range(args.runs)]
+    median_ms = statistics.median(rows[-1][3] for rows in runs) / 1000
+
+    last = runs[-1]
+    print(f"import {args.module}: median {median_ms:.0f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    print("slowest imports:")
+    direct = sorted((row for row in last if row[1] == 1), key=lambda row: -row[3])
+    for name, _depth, _self, cumulative in direct[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    failed = False
+    eager = sorted({_lazy_prefix(name, lazy) for name, *_ in last} - {None})
+    if eager:
+        failed = True
+        print(f"FAIL: imported at startup but meant to load lazily: {', '.join(eager)}")
+    if median_ms > args.budget_ms:
+        failed = True
+        print(f"FAIL: {median_ms:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""Load driver for /api/respond, /api/respond/stream, /api/confirm and /api/messages.
+
+    python -m bench.loadgen --url http://127.0.0.1:8000 --duration 30 --concurrency 50
+
+Runs a weighted mix of scenarios as closed-loop virtual users, or at a fixed
+arrival rate with --rate (latency is then measured from the scheduled start,
+so a stalled server is not hidden by the driver slowing down). Reports
+requests per second and p50/p95/p99 per operation. JWTs are minted locally
+with utils.jwt, so JWT_SECRET must match the server's.
+
+Scenarios:
+    chat     POST /api/respond with a conversational message
+    smalltalk POST /api/respond with a greeting or thanks (answered by the local router)
+    action   POST /api/respond that plans an email, POST /api/confirm, then poll
+             GET /api/confirm/{id} until the job finishes (recorded as action_done)
+    stream   POST /api/respond/stream read to the end (also records time to first event)
+    history  GET /api/messages?limit=20
+    login    POST /auth/login (bcrypt verify) as a seeded bench user
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import defaultdict
+
+import httpx
+
+DEFAULT_MIX = "chat=4,action=2,stream=1,history=3"
+
+_counter = itertools.count()
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+
+def parse_mix(spec: str) -> dict:
+    mix = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.samples = defaultdict(list)  # first few error bodies per operation
+        self.recording = False
+
+    def record(self, op: str, seconds: float, status: int | None, detail: str = ""):
+        if not self.recording:
+            return
+        self.statuses[op][status or "exc"] += 1
+        if status is None or status >= 400:
+            self.errors[op] += 1
+            if len(self.samples[op]) < 3:
+                self.samples[op].append(f"{status or 'exc'}: {detail[:300]}")
+        else:
+            self.latencies[op].append(seconds)
+
+    def report(self, elapsed: float) -> dict:
+        ops = {}
+        total = 0
+        for op in sorted(set(self.latencies) | set(self.errors)):
+            values = sorted(self.latencies[op])
+            count = len(values) + self.errors[op]
+            total += count
+            ops[op] = {
+                "count": count,
+                "errors": self.errors[op],
+                "rps": count / elapsed if elapsed else 0.0,
+                "p50_ms": percentile(values, 50) * 1000,
+                "p95_ms": percentile(values, 95) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+                "max_ms": (values[-1] if values else 0.0) * 1000,
+                "statuses": {str(k): v for k, v in self.statuses[op].items()},
+                "error_samples": self.samples[op],
+            }
+        return {"elapsed_s": elapsed, "requests": total, "rps": total / elapsed if elapsed else 0.0, "ops": ops}
+
+
+class Driver:
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, users: int, vocabulary: int):
+        from utils.jwt import create_access_token
+
+        self.client = client
+        self.recorder = recorder
+        self.tokens = [create_access_token(f"bench-user-{i}") for i in range(users)]
+        # vocabulary > 0 repeats that many distinct messages per scenario (plan cache hits)
+        self.vocabulary = vocabulary
+
+    def _headers(self) -> dict:
+        return {"Authorization": f"Bearer {random.choice(self.tokens)}"}
+
+    def _nonce(self) -> int:
+        return random.randrange(self.vocabulary) if self.vocabulary else next(_counter)
+
+    async def _call(self, op: str, method: str, path: str, headers: dict, started: float | None = None, **kwargs):
+        started = time.perf_counter() if started is None else started
+        try:
+            response = await self.client.request(method, path, headers=headers, **kwargs)
+        except httpx.HTTPError as exc:
+            self.recorder.record(op, time.perf_counter() - started, None, repr(exc))
+            return None
+        detail = response.text if response.status_code >= 400 else ""
+        self.recorder.record(op, time.perf_counter() - started, response.status_code, detail)
+        return response
+
+    async def chat(self, started=None):
+        body = {"message": f"What is a good way to plan week {self._nonce()} of the project?"}
+        await self._call("respond_chat", "POST", "/api/respond", self._headers(), started, json=body)
+
+    async def smalltalk(self, started=None):
+        body = {"message": random.choice(SMALLTALK)}
+        await self._call("respond_smalltalk", "POST", "/api/respond", self._headers(), started, json=body)
+
+    async def action(self, started=None):
+        headers = self._headers()
+        body = {"message": f"Email alex{self._nonce()}@example.com that the report is ready"}
+        response = await self._call("respond_action", "POST", "/api/respond", headers, started, json=body)
+        if response is None or response.status_code != 200:
+            return
+        action_request_id = response.json().get("action_request_id")
+        if not action_request_id:
+            return
+        confirmed = time.perf_counter()
+        response = await self._call(
+            "confirm", "POST", "/api/confirm", headers,
+            json={"action_request_id": action_request_id, "approved": True},
+        )
+        if response is None or response.status_code != 200:
+            return
+        status = response.json().get("status")
+        while status in ("queued", "running"):
+            await asyncio.sleep(0.05)
+            try:
+                poll = await self.client.get(f"/api/confirm/{action_request_id}", headers=headers)
+            except httpx.HTTPError as exc:
+                self.recorder.record("action_done", time.perf_counter() - confirmed, None, repr(exc))
+                return
+            status = poll.json().get("status") if poll.status_code == 200 else None
+            detail = poll.text
+        if status is not None and status not in ("queued", "running"):
+            ok = 200 if status == "completed" else 500
+            self.recorder.record("action_done", time.perf_counter() - confirmed, ok, "" if ok == 200 else detail)
+
+    async def stream(self, started=None):
+        started = time.perf_counter() if started is None else started
+        body = {"message": f"Tell me something useful about topic {self._nonce()}"}
+        status, detail = None, ""
+        try:
+            async with self.client.stream(
+                "POST", "/api/respond/stream", headers=self._headers(), json=body
+            ) as response:
+                status = response.status_code
+                first = True
+                async for line in response.aiter_lines():
+                    if first and line.startswith("event:"):
+                        self.recorder.record("stream_first_event", time.perf_counter() - started, status)
+                        first = False
+                    if line == "event: error":
+                        status = 500
+                    elif status == 500 and line.startswith("data:") and not detail:
+                        detail = line[5:].strip()
+        except httpx.HTTPError as exc:
+            status, detail = None, repr(exc)
+        self.recorder.record("respond_stream", time.perf_counter() - started, status, detail)
+
+    async def history(self, started=None):
+        await self._call("messages", "GET", "/api/messages", self._headers(), started, params={"limit": 20})
+
+    async def login(self, started=None):
+        body = {"username": f"bench-user-{random.randrange(len(self.tokens))}", "password": "bench-password"}
+        await self._call("login", "POST", "/auth/login", {}, started, json=body)
+
+
+SCENARIOS = ("chat", "smalltalk", "action", "stream", "history", "login")
+SMALLTALK = ("hi", "Hello there!", "thanks!", "Thank you so much", "ok", "bye")
+
+
+async def run_load(
+    url: str,
+    duration: float,
+    concurrency: int,
+    mix: dict,
+    users: int,
+    warmup: float = 0.0,
+    rate: float | None = None,
+    vocabulary: int = 0,
+    timeout: float = 60.0,
+) -> dict:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits, trust_env=False) as client:
+        driver = Driver(client, recorder, users, vocabulary)
+        names = list(mix)
+        weights = [mix[name] for name in names]
+
+        def pick():
+            return getattr(driver, random.choices(names, weights)[0])
+
+        start = time.perf_counter()
+        measure_from = start + warmup
+        stop_at = measure_from + duration
+
+        async def mark_measurement():
+            await asyncio.sleep(warmup)
+            recorder.recording = True
+
+        marker = asyncio.create_task(mark_measurement())
+
+        if rate:
+            slots = asyncio.Semaphore(concurrency)
+            tasks = set()
+
+            async def one(scenario, scheduled):
+                async with slots:
+                    await scenario(started=scheduled)
+
+            for n in itertools.count():
+                scheduled = start + n / rate
+                if scheduled >= stop_at:
+                    break
+                await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+                task = asyncio.create_task(one(pick(), scheduled))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(tasks)
+        else:
+            async def user_loop():
+                while time.perf_counter() < stop_at:
+                    await pick()()
+
+            await asyncio.gather(*(user_loop() for _ in range(concurrency)))
+
+        await marker
+        elapsed = time.perf_counter() - measure_from
+    return recorder.report(elapsed)
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"{'operation':<20}{'count':>8}{'errors':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}",
+    ]
+    for op, row in report["ops"].items():
+        lines.append(
+            f"{op:<20}{row['count']:>8}{row['errors']:>8}{row['rps']:>9.1f}"
+            f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['max_ms']:>10.1f}"
+        )
+    for op, row in report["ops"].items():
+        for sample in row["error_samples"]:
+            lines.append(f"  {op} error {sample}")
+    lines.append(f"total: {report['requests']} requests in {report['elapsed_s']:.1f}s = {report['rps']:.1f} req/s")
+    return "\n".join(lines)
+
+
+def add_load_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="unmeasured seconds before the run")
+    parser.add_argument("--concurrency", type=int, default=50, help="virtual users / max in-flight requests")
+    parser.add_argument("--rate", type=float, default=None, help="fixed arrival rate (scenarios/s) instead of closed loop")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"weighted scenarios (default {DEFAULT_MIX})")
+    parser.add_argument("--users", type=int, default=100, help="distinct bench users to spread load over")
+    parser.add_argument("--vocabulary", type=int, default=0, help="distinct messages per scenario (0 = all unique)")
+    parser.add_argument("--json", dest="json_path", default=None, help="also write the report to this file")
+
+
+def write_report(report: dict, json_path: str | None):
+    print(format_report(report))
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    add_load_arguments(parser)
+    args = parser.parse_args()
+    report = asyncio.run(run_load(
+        args.url, args.duration, args.concurrency, parse_mix(args.mix), args.users,
+        warmup=args.warmup, rate=args.rate, vocabulary=args.vocabulary,
+    ))
+    write_report(report, args.json_path)
+
+
+if __name__ == "__main__":
+    main()
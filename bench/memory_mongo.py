@@ -0,0 +1,376 @@
+"""In-memory stand-in for the async MongoDB client, registered as MONGODB_DRIVER=memory.
+
+Covers the query and update subset the app uses. Every operation runs
+synchronously on the event loop after an optional simulated round trip
+(BENCH_MONGO_LATENCY_MS), so single-document updates are atomic as they are
+on a real server. State lives in the process; run the app with one worker.
+"""
+import asyncio
+import copy
+import os
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+_MISSING = object()
+
+
+def _stored(value):
+    # BSON keeps millisecond precision and returns naive UTC datetimes
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.replace(microsecond=value.microsecond // 1000 * 1000)
+    if isinstance(value, dict):
+        return {key: _stored(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_stored(item) for item in value]
+    return value
+
+
+def _get(doc, path: str):
+    current = doc
+    for part in path.split("."):
+        if isinstance(current, dict) and part in current:
+            current = current[part]
+        else:
+            return _MISSING
+    return current
+
+
+def _set(doc, path: str, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _unset(doc, path: str):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+
+def _compare(value, op: str, arg) -> bool:
+    if value is _MISSING or value is None:
+        return False
+    try:
+        if op == "$lt":
+            return value < arg
+        if op == "$lte":
+            return value <= arg
+        if op == "$gt":
+            return value > arg
+        return value >= arg
+    except TypeError:
+        return False
+
+
+def _match_value(value, condition) -> bool:
+    if isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition):
+        for op, arg in condition.items():
+            arg = _stored(arg)
+            if op == "$eq" and not _match_value(value, arg):
+                return False
+            if op == "$ne" and _match_value(value, arg):
+                return False
+            if op == "$in" and not any(_match_value(value, item) for item in arg):
+                return False
+            if op == "$nin" and any(_match_value(value, item) for item in arg):
+                return False
+            if op in ("$lt", "$lte", "$gt", "$gte") and not _compare(value, op, arg):
+                return False
+            if op == "$exists" and (value is not _MISSING) != bool(arg):
+                return False
+        return True
+    condition = _stored(condition)
+    if value is _MISSING:
+        return condition is None
+    if isinstance(value, list) and not isinstance(condition, list):
+        return condition in value
+    return value == condition
+
+
+def matches(doc: dict, query: dict | None) -> bool:
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif not _match_value(_get(doc, key), condition):
+            return False
+    return True
+
+
+def _apply_update(doc: dict, update: dict, inserting: bool = False):
+    for op, fields in update.items():
+        for path, value in fields.items():
+            value = _stored(copy.deepcopy(value))
+            if op == "$set" or (op == "$setOnInsert" and inserting):
+                _set(doc, path, value)
+            elif op == "$unset":
+                _unset(doc, path)
+            elif op == "$currentDate":
+                _set(doc, path, _stored(datetime.now(timezone.utc)))
+            elif op == "$inc":
+                current = _get(doc, path)
+                _set(doc, path, (0 if current is _MISSING else current) + value)
+            elif op == "$push":
+                current = _get(doc, path)
+                _set(doc, path, ([] if current is _MISSING else list(current)) + [value])
+            elif op not in ("$setOnInsert",):
+                raise NotImplementedError(f"Unsupported update operator: {op}")
+
+
+def _project(doc: dict, projection) -> dict:
+    if not projection:
+        return copy.deepcopy(doc)
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    include_id = projection.get("_id", 1)
+    fields = {key: value for key, value in projection.items() if key != "_id"}
+    if fields and all(fields.values()):
+        out = {key: copy.deepcopy(doc[key]) for key in fields if key in doc}
+    else:
+        out = {key: copy.deepcopy(value) for key, value in doc.items() if key not in fields}
+    if include_id and "_id" in doc:
+        out["_id"] = doc["_id"]
+    else:
+        out.pop("_id", None)
+    return out
+
+
+def _sort_key(spec):
+    def key(doc):
+        values = []
+        for field, _direction in spec:
+            value = _get(doc, field)
+            values.append((value is not _MISSING and value is not None, value if value is not _MISSING else None))
+        return values
+    return key
+
+
+def _sorted(docs: list, spec) -> list:
+    if isinstance(spec, str):
+        spec = [(spec, 1)]
+    for field, direction in reversed(list(spec)):
+        docs = sorted(docs, key=_sort_key([(field, direction)]), reverse=direction == -1)
+    return docs
+
+
+class MemoryCursor:
+    def __init__(self, collection, query, projection):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort = None
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key, direction=None):
+        self._sort = key if isinstance(key, list) else [(key, direction or 1)]
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    async def to_list(self, length=None):
+        await self._collection._round_trip()
+        docs = [doc for doc in self._collection._docs if matches(doc, self._query)]
+        if self._sort:
+            docs = _sorted(docs, self._sort)
+        docs = docs[self._skip:]
+        limit = min(filter(None, [self._limit, length]), default=0)
+        if limit:
+            docs = docs[:limit]
+        return [_project(doc, self._projection) for doc in docs]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in await self.to_list():
+            yield doc
+
+
+class MemoryCollection:
+    def __init__(self, client, name: str):
+        self._client = client
+        self.name = name
+        self._docs = []
+        self._unique = []  # field lists with a unique index
+
+    async def _round_trip(self):
+        await self._client._round_trip()
+
+    def _check_unique(self, doc: dict, ignore=None):
+        for fields in self._unique + [["_id"]]:
+            key = [_get(doc, field) for field in fields]
+            for other in self._docs:
+                if other is not ignore and [_get(other, field) for field in fields] == key:
+                    raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} {fields}")
+
+    def _insert(self, doc: dict):
+        doc.setdefault("_id", ObjectId())
+        stored = _stored(copy.deepcopy(doc))
+        self._check_unique(stored)
+        self._docs.append(stored)
+        return stored
+
+    def _first(self, query, sort=None):
+        docs = [doc for doc in self._docs if matches(doc, query)]
+        if sort:
+            docs = _sorted(docs, sort)
+        return docs[0] if docs else None
+
+    def _upsert_doc(self, query: dict, update: dict) -> dict:
+        doc = {}
+        for key, value in query.items():
+            if not key.startswith("$") and not (isinstance(value, dict) and any(k.startswith("$") for k in value)):
+                _set(doc, key, copy.deepcopy(value))
+        _apply_update(doc, update, inserting=True)
+        return self._insert(doc)
+
+    def _update(self, doc: dict, update: dict):
+        updated = copy.deepcopy(doc)
+        _apply_update(updated, update)
+        self._check_unique(updated, ignore=doc)
+        doc.clear()
+        doc.update(updated)
+
+    async def insert_one(self, doc: dict):
+        await self._round_trip()
+        stored = self._insert(doc)
+        return SimpleNamespace(inserted_id=stored["_id"], acknowledged=True)
+
+    async def insert_many(self, docs: list, ordered: bool = True):
+        await self._round_trip()
+        ids, errors = [], []
+        for index, doc in enumerate(docs):
+            try:
+                ids.append(self._insert(doc)["_id"])
+            except DuplicateKeyError as exc:
+                errors.append({"index": index, "code": 11000, "errmsg": str(exc)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(ids)})
+        return SimpleNamespace(inserted_ids=ids, acknowledged=True)
+
+    async def find_one(self, query=None, projection=None, sort=None):
+        await self._round_trip()
+        doc = self._first(query, sort)
+        return _project(doc, projection) if doc is not None else None
+
+    def find(self, query=None, projection=None):
+        return MemoryCursor(self, query, projection)
+
+    async def count_documents(self, query: dict):
+        await self._round_trip()
+        return sum(1 for doc in self._docs if matches(doc, query))
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False):
+        await self._round_trip()
+        doc = self._first(query)
+        if doc is not None:
+            self._update(doc, update)
+            return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+        if upsert:
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=self._upsert_doc(query, update)["_id"])
+        return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+
+    async def update_many(self, query: dict, update: dict):
+        await self._round_trip()
+        docs = [doc for doc in self._docs if matches(doc, query)]
+        for doc in docs:
+            self._update(doc, update)
+        return SimpleNamespace(matched_count=len(docs), modified_count=len(docs), upserted_id=None)
+
+    async def find_one_and_update(
+        self, query: dict, update: dict, projection=None, sort=None, upsert: bool = False,
+        return_document=ReturnDocument.BEFORE,
+    ):
+        await self._round_trip()
+        doc = self._first(query, sort)
+        if doc is None:
+            if not upsert:
+                return None
+            doc = self._upsert_doc(query, update)
+            return _project(doc, projection) if return_document == ReturnDocument.AFTER else None
+        before = _project(doc, projection)
+        self._update(doc, update)
+        return _project(doc, projection) if return_document == ReturnDocument.AFTER else before
+
+    async def delete_one(self, query: dict):
+        await self._round_trip()
+        doc = self._first(query)
+        if doc is not None:
+            self._docs.remove(doc)
+        return SimpleNamespace(deleted_count=int(doc is not None))
+
+    async def delete_many(self, query: dict):
+        await self._round_trip()
+        before = len(self._docs)
+        self._docs = [doc for doc in self._docs if not matches(doc, query)]
+        return SimpleNamespace(deleted_count=before - len(self._docs))
+
+    async def create_index(self, keys, unique: bool = False, name: str | None = None, **_options):
+        if isinstance(keys, str):
+            keys = [(keys, 1)]
+        if unique:
+            self._unique.append([field for field, _direction in keys])
+        return name or "_".join(f"{field}_{direction}" for field, direction in keys)
+
+
+class MemoryDatabase:
+    def __init__(self, client, name: str):
+        self._client = client
+        self.name = name
+        self._collections = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = MemoryCollection(self._client, name)
+        return collection
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+
+class MemoryClient:
+    """Drop-in for AsyncIOMotorClient(url, **options); connection options are ignored."""
+
+    def __init__(self, url: str = "memory://", latency_ms: float | None = None, **_options):
+        if latency_ms is None:
+            latency_ms = float(os.getenv("BENCH_MONGO_LATENCY_MS", "0"))
+        self.latency = latency_ms / 1000
+        self._databases = {}
+
+    async def _round_trip(self):
+        # always yield, as a network call would
+        await asyncio.sleep(self.latency)
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        database = self._databases.get(name)
+        if database is None:
+            database = self._databases[name] = MemoryDatabase(self, name)
+        return database
+
+    def close(self):
+        pass
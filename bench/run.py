@@ -0,0 +1,182 @@
+"""Run the whole benchmark on one machine with no network access.
+
+    python -m bench.run --duration 30 --concurrency 50 --mix chat=4,action=2,stream=1,history=3
+
+Starts the fake OpenAI and Google servers and the API (bench.app, in-memory
+MongoDB unless --mongodb-url is given) as uvicorn subprocesses on free local
+ports, drives load with bench.loadgen, prints the report and shuts
+everything down. Extra APP settings can be passed as --env NAME=VALUE, e.g.
+--env PLAN_CACHE_ENABLED=false to compare a change against the baseline.
+With --trace-sample-rate, sampled requests are exported to a fake OTLP
+collector and summarized after the report (see bench.traces).
+--cache-backend redis starts bench.fake_redis for the shared cache tier.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from bench.loadgen import add_load_arguments, parse_mix, run_load, write_report
+from bench.traces import summarize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_SECRET = "bench-jwt-secret"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start(module: str, port: int, env: dict, *extra: str) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", module, "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log", *extra],
+        cwd=ROOT,
+        env=env,
+    )
+
+
+def _wait_ready(url: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"{url} exited with status {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0, trust_env=False).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise SystemExit(f"{url} did not become ready within {timeout:.0f}s")
+
+
+def _wait_port(port: int, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"server for port {port} exited with status {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1.0).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise SystemExit(f"port {port} did not open within {timeout:.0f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_load_arguments(parser)
+    parser.add_argument("--openai-latency-ms", type=float, default=400)
+    parser.add_argument("--openai-token-ms", type=float, default=15)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0, help="fraction of completions failing with 503")
+    parser.add_argument("--openai-slow-rate", type=float, default=0.0, help="fraction of completions delayed by --openai-slow-ms")
+    parser.add_argument("--openai-slow-ms", type=float, default=5000)
+    parser.add_argument("--openai-fault-model", default="", help="inject OpenAI faults for this model only")
+    parser.add_argument("--google-latency-ms", type=float, default=150)
+    parser.add_argument("--google-error-rate", type=float, default=0.0, help="fraction of Google calls failing with 503")
+    parser.add_argument("--mongo-latency-ms", type=float, default=1, help="simulated round trip of the in-memory store")
+    parser.add_argument("--mongodb-url", default=None, help="use a real (local) MongoDB instead of the in-memory store")
+    parser.add_argument("--cache-backend", choices=["memory", "mongo", "redis"], default=None,
+                        help="CACHE_BACKEND for the app; redis runs against bench.fake_redis")
+    parser.add_argument("--trace-sample-rate", type=float, default=0.0, help="trace this fraction of requests")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE", help="extra app setting")
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    openai_port, google_port, app_port, collector_port = _free_port(), _free_port(), _free_port(), _free_port()
+    redis_port = _free_port()
+    trace_path = os.path.join(tempfile.mkdtemp(prefix="bench-traces-"), "traces.jsonl")
+    base_env = {
+        **os.environ,
+        "NO_PROXY": "127.0.0.1,localhost",
+        "no_proxy": "127.0.0.1,localhost",
+        "FAKE_OPENAI_LATENCY_MS": str(args.openai_latency_ms),
+        "FAKE_OPENAI_TOKEN_MS": str(args.openai_token_ms),
+        "FAKE_OPENAI_ERROR_RATE": str(args.openai_error_rate),
+        "FAKE_OPENAI_SLOW_RATE": str(args.openai_slow_rate),
+        "FAKE_OPENAI_SLOW_MS": str(args.openai_slow_ms),
+        "FAKE_OPENAI_FAULT_MODEL": args.openai_fault_model,
+        "FAKE_GOOGLE_LATENCY_MS": str(args.google_latency_ms),
+        "FAKE_GOOGLE_ERROR_RATE": str(args.google_error_rate),
+        "FAKE_COLLECTOR_PATH": trace_path,
+    }
+    app_env = {
+        **base_env,
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+        "GOOGLE_API_ENDPOINT": f"http://127.0.0.1:{google_port}/",
+        "MONGODB_DRIVER": "memory",
+        "MONGODB_URL": "memory://",
+        "MONGODB_TLS": "false",
+        "BENCH_MONGO_LATENCY_MS": str(args.mongo_latency_ms),
+        "BENCH_USERS": str(args.users),
+        "JWT_SECRET": BENCH_SECRET,
+    }
+    if args.trace_sample_rate:
+        app_env.update({
+            "TRACE_SAMPLE_RATE": str(args.trace_sample_rate),
+            "TRACE_EXPORTER": "otlp",
+            "TRACE_OTLP_ENDPOINT": f"http://127.0.0.1:{collector_port}/v1/traces",
+        })
+    if args.cache_backend:
+        app_env["CACHE_BACKEND"] = args.cache_backend
+    if args.cache_backend == "redis":
+        app_env["CACHE_REDIS_URL"] = f"redis://127.0.0.1:{redis_port}/0"
+    if args.mongodb_url:
+        app_env.update({"MONGODB_DRIVER": "motor", "MONGODB_URL": args.mongodb_url})
+    for item in args.env:
+        name, _, value = item.partition("=")
+        app_env[name] = value
+
+    # the driver mints JWTs with the app's secret
+    os.environ.update({key: app_env[key] for key in ("JWT_SECRET", "OPENAI_API_KEY", "MONGODB_URL")})
+
+    processes = []
+    try:
+        processes.append(_start("bench.fake_openai:app", openai_port, base_env))
+        # pooled googleapiclient services hold idle connections; Google keeps them open for minutes
+        processes.append(_start("bench.fake_google:app", google_port, base_env, "--timeout-keep-alive", "600"))
+        _wait_ready(f"http://127.0.0.1:{openai_port}/health", processes[0])
+        _wait_ready(f"http://127.0.0.1:{google_port}/health", processes[1])
+        if args.trace_sample_rate:
+            processes.append(_start("bench.fake_collector:app", collector_port, base_env))
+            _wait_ready(f"http://127.0.0.1:{collector_port}/health", processes[-1])
+        if args.cache_backend == "redis":
+            processes.append(subprocess.Popen(
+                [sys.executable, "-m", "bench.fake_redis", "--port", str(redis_port)], cwd=ROOT, env=base_env
+            ))
+            _wait_port(redis_port, processes[-1])
+        app_process = _start("bench.app:app", app_port, app_env)
+        processes.insert(0, app_process)  # stopped first, so it flushes its spans to the collector
+        _wait_ready(f"http://127.0.0.1:{app_port}/health", app_process)
+
+        report = asyncio.run(run_load(
+            f"http://127.0.0.1:{app_port}", args.duration, args.concurrency, mix, args.users,
+            warmup=args.warmup, rate=args.rate, vocabulary=args.vocabulary,
+        ))
+        report["google"] = httpx.get(f"http://127.0.0.1:{google_port}/health", trust_env=False).json()
+        report["openai"] = httpx.get(f"http://127.0.0.1:{openai_port}/health", trust_env=False).json()
+        write_report(report, args.json_path)
+    finally:
+        for process in processes:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+    if args.trace_sample_rate and os.path.exists(trace_path):
+        print()
+        print(summarize(trace_path))
+        print(f"\nspans: {trace_path}")
+
+
+if __name__ == "__main__":
+    main()
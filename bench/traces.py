@@ -0,0 +1,93 @@
+"""Summarize exported spans (TRACE_EXPORTER=jsonl output or the fake collector's file).
+
+    python -m bench.traces traces.jsonl --slowest 3
+
+Prints latency per span name across all traces, then the slowest requests
+as indented span trees with start offsets, so a slow request's time split
+is visible at a glance.
+"""
+import argparse
+import json
+from collections import defaultdict
+
+from bench.loadgen import percentile
+
+
+def load(path: str) -> dict:
+    traces = defaultdict(list)
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            if line.strip():
+                item = json.loads(line)
+                traces[item["trace_id"]].append(item)
+    return traces
+
+
+def _roots(spans: list) -> list:
+    ids = {item["span_id"] for item in spans}
+    return [item for item in spans if item["parent_id"] not in ids]
+
+
+def span_table(traces: dict) -> str:
+    durations = defaultdict(list)
+    for spans in traces.values():
+        for item in spans:
+            durations[item["name"]].append(item["duration_ms"])
+    lines = [f"{'span':<40}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}"]
+    for name, values in sorted(durations.items(), key=lambda kv: -percentile(sorted(kv[1]), 95)):
+        values.sort()
+        lines.append(
+            f"{name[:39]:<40}{len(values):>8}{percentile(values, 50):>10.1f}"
+            f"{percentile(values, 95):>10.1f}{values[-1]:>10.1f}"
+        )
+    return "\n".join(lines)
+
+
+def render_tree(spans: list) -> str:
+    children = defaultdict(list)
+    for item in spans:
+        children[item["parent_id"]].append(item)
+    roots = sorted(_roots(spans), key=lambda item: item["start_ns"])
+    origin = roots[0]["start_ns"] if roots else 0
+    lines = []
+
+    def walk(item, depth):
+        attrs = " ".join(f"{k}={v}" for k, v in item["attributes"].items())
+        error = f" ERROR {item['error']}" if item.get("error") else ""
+        lines.append(
+            f"{(item['start_ns'] - origin) / 1e6:>9.1f} ms  {'  ' * depth}{item['name']} "
+            f"{item['duration_ms']:.1f} ms {attrs}{error}".rstrip()
+        )
+        for child in sorted(children[item["span_id"]], key=lambda c: c["start_ns"]):
+            walk(child, depth + 1)
+
+    for root in roots:
+        walk(root, 0)
+    return "\n".join(lines)
+
+
+def summarize(path: str, slowest: int = 3) -> str:
+    traces = load(path)
+    if not traces:
+        return "no spans"
+    parts = [f"{len(traces)} traces", span_table(traces)]
+
+    def total(spans):
+        roots = _roots(spans)
+        return max((item["duration_ms"] for item in roots), default=0.0)
+
+    for trace_id, spans in sorted(traces.items(), key=lambda kv: -total(kv[1]))[:slowest]:
+        parts.append(f"\ntrace {trace_id} ({total(spans):.1f} ms)\n{render_tree(spans)}")
+    return "\n".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path")
+    parser.add_argument("--slowest", type=int, default=3, help="slowest traces to print as trees")
+    args = parser.parse_args()
+    print(summarize(args.path, args.slowest))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,3 @@
-import json
-import os
-
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
 
@@ -8,33 +5,103 @@ load_dotenv()  # Load .env file
 
 class Settings(BaseSettings):
     OPENAI_API_KEY: str
+    OPENAI_BASE_URL: str = ""  # e.g. a local stand-in (see bench/)
+    LLM_MODEL: str = "gpt-4.1"
+    LLM_FALLBACK_MODEL: str = "gpt-4.1-mini"  # answers when the primary runs out of time; "" disables
+    LLM_FALLBACK_RESERVE_SECONDS: float = 6.0  # part of each deadline kept back for the fallback
+    LLM_PLAN_DEADLINE_SECONDS: float = 30.0  # plan and chat
+    LLM_SUMMARY_DEADLINE_SECONDS: float = 20.0
+    LLM_CONDENSE_DEADLINE_SECONDS: float = 60.0
+    LLM_MAX_ATTEMPTS: int = 3  # per model, for timeouts, 429s and 5xx
+    LLM_BACKOFF_SECONDS: float = 0.5
+    LLM_BACKOFF_MAX_SECONDS: float = 4.0
+    LLM_HEDGE: bool = False  # send a second request when the first is slower than usual
+    LLM_HEDGE_AFTER_SECONDS: float = 0.0  # 0: the observed p95 for the mode
+    # local pre-router (agent/router.py): canned replies and cheap chat before the planner
+    ROUTER_ENABLED: bool = True
+    ROUTER_CHAT_MODEL: str = "gpt-4.1-mini"
+    ROUTER_CHAT_CONFIDENCE: float = 0.97  # below this the planner decides
+    ROUTER_MAX_CHARS: int = 200  # longer messages always go to the planner
     GOOGLE_TOKEN_JSON_PATH: str = ""
     MONGODB_URL: str
-    GOOGLE_OAUTH_CLIENT_ID: str = ""
+    MONGODB_DRIVER: str = "motor"  # motor | pymongo
+    MONGODB_DB_NAME: str = "workspace_ai"
+    MONGODB_TLS: bool = True
+    MONGODB_MAX_POOL_SIZE: int = 50
+    MONGODB_MIN_POOL_SIZE: int = 0
+    MONGODB_MAX_IDLE_TIME_MS: int = 300_000
+    MONGODB_CONNECT_TIMEOUT_MS: int = 5_000
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS: int = 5_000
+    MONGODB_TIMEOUT_MS: int = 10_000
+    MONGODB_READ_PREFERENCE: str = "primary"
+    MONGODB_CREATE_INDEXES: bool = True
+    GOOGLE_OAUTH_CLIENT_ID: str = ""  # else the client_id in credentials.json (utils/oauth_client.py)
     FRONTEND_ORIGINS: str = "http://localhost:5173"
+    GOOGLE_API_ENDPOINT: str = ""  # overrides the Google API root URL, batch endpoints included
+    GOOGLE_SERVICE_POOL_SIZE: int = 256  # users whose built Google services are kept (agent/google_services.py)
+    GOOGLE_CREDS_CACHE_SIZE: int = 1024
+    GOOGLE_CREDS_CACHE_TTL_SECONDS: int = 3600
+    GOOGLE_CREDS_REFRESH_MARGIN_SECONDS: int = 300
+    GOOGLE_BATCH_MAX_SIZE: int = 50
+    # caches (utils/cache.py): memory keeps them per process; mongo or redis share them between workers
+    CACHE_BACKEND: str = "memory"  # memory | mongo | redis
+    CACHE_REDIS_URL: str = "redis://127.0.0.1:6379/0"
+    CACHE_LOCAL_TTL_SECONDS: float = 10.0  # in-process copies of shared entries; bounds staleness if an invalidation is lost
+    CACHE_INVALIDATION_POLL_SECONDS: float = 1.0  # mongo: how often workers pick up each other's invalidations
+    PLAN_MAX_CONCURRENCY: int = 32
+    SUMMARY_MODE: str = "local"  # local | llm
+    PLAN_CACHE_ENABLED: bool = True
+    PLAN_CACHE_SIZE: int = 4096
+    PLAN_CACHE_TTL_SECONDS: int = 600
+    PLAN_CACHE_NEAR_DUPLICATE: bool = False
+    PLAN_CACHE_NEAR_DUPLICATE_THRESHOLD: float = 0.85
+    CONTEXT_TOKEN_BUDGET: int = 3000
+    CONTEXT_MAX_TURNS: int = 40
+    CONTEXT_SUMMARY_MIN_TURNS: int = 8
+    CONTEXT_SUMMARY_BATCH: int = 100
+    SUMMARY_LLM_FALLBACK: bool = False
+    PLAN_MAX_CONCURRENCY_PER_USER: int = 4
+    # token-bucket admission for OpenAI calls (agent/admission.py); a limit of 0 is off
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_BACKEND: str = "local"  # local (per process) | mongo (shared by all workers)
+    ADMISSION_USER_RPM: int = 30
+    ADMISSION_USER_TPM: int = 60_000
+    ADMISSION_GLOBAL_RPM: int = 3_000
+    ADMISSION_GLOBAL_TPM: int = 1_500_000
+    ADMISSION_MAX_WAIT_SECONDS: float = 2.0  # queue this long for capacity, then answer 429
+    ADMISSION_COMPLETION_TOKENS: int = 400  # completion estimate reserved up front, settled from usage
+    # buffer message inserts and write them in batches (services/messages.py)
+    MESSAGE_WRITE_BEHIND: bool = True
+    MESSAGE_WRITE_BATCH_SIZE: int = 100
+    MESSAGE_WRITE_FLUSH_MS: float = 20.0
+    MESSAGE_WRITE_MAX_PENDING: int = 5000
+    ACTION_WORKER_IN_PROCESS: bool = True  # run confirmed actions in the API process; else run worker.py
+    ACTION_WORKER_CONCURRENCY: int = 16
+    ACTION_WORKER_POLL_SECONDS: float = 0.5
+    ACTION_JOB_LEASE_SECONDS: int = 60
+    ACTION_JOB_MAX_ATTEMPTS: int = 5
+    ACTION_JOB_BACKOFF_SECONDS: float = 2.0
+    ACTION_JOB_BACKOFF_MAX_SECONDS: float = 300.0
+    ACTION_CONFIRM_WAIT_SECONDS: float = 30.0  # upper bound for POST /confirm with wait=true
+    ACTION_REQUEST_PENDING_TTL_SECONDS: int = 3600  # unconfirmed requests expire (TTL index); 0 keeps them
+    ACTION_REQUEST_RETENTION_DAYS: int = 30  # finished requests are deleted after this; 0 keeps them
+
+    TRACE_SAMPLE_RATE: float = 0.0  # fraction of requests traced; 0 disables tracing
+    TRACE_UPSTREAM_MAX_PER_SECOND: int = 10  # extra traces per second for a sampled incoming traceparent
+    TRACE_EXPORTER: str = "jsonl"  # jsonl | otlp
+    TRACE_JSONL_PATH: str = "traces.jsonl"
+    TRACE_OTLP_ENDPOINT: str = "http://127.0.0.1:4318/v1/traces"
+    TRACE_SERVICE_NAME: str = "workspaceai-backend"
 
     JWT_SECRET: str = "dev-secret"
     JWT_ALGORITHM: str = "HS256"
     JWT_EXPIRE_MINUTES: int = 60 * 24 * 7
+    AUTH_CACHE_SIZE: int = 10_000
+    AUTH_USER_CACHE_TTL_SECONDS: int = 60
+    AUTH_USER_NEGATIVE_TTL_SECONDS: int = 5
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = -1  # processes per app worker; -1 = half the CPUs, 0 = thread pool
+    PASSWORD_HASH_MAX_PENDING: int = 32  # beyond this, register/login answer 503
 
 settings = Settings()
 
-if not settings.GOOGLE_OAUTH_CLIENT_ID:
-    candidate_paths = []
-    if settings.GOOGLE_TOKEN_JSON_PATH:
-        candidate_paths.append(settings.GOOGLE_TOKEN_JSON_PATH)
-    candidate_paths.append(os.path.join(os.path.dirname(__file__), "credentials.json"))
-
-    for path in candidate_paths:
-        if not path or not os.path.exists(path):
-            continue
-        try:
-            with open(path, "r", encoding="utf-8") as handle:
-                payload = json.load(handle)
-            web_config = payload.get("web") or payload.get("installed") or {}
-            client_id = web_config.get("client_id")
-            if client_id:
-                settings.GOOGLE_OAUTH_CLIENT_ID = client_id
-                break
-        except (OSError, json.JSONDecodeError):
-            continue
\ No newline at end of file
@@ -1,15 +1,116 @@
-import certifi
-from pymongo import MongoClient
+import inspect
+
 from config import settings
+from utils.metrics import MongoCommandMetrics
+
+
+def _motor_client(url: str, **options):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    return AsyncIOMotorClient(url, **options)
+
+
+def _pymongo_client(url: str, **options):
+    from pymongo import AsyncMongoClient
+
+    return AsyncMongoClient(url, **options)
+
+
+# MONGODB_DRIVER -> factory(url, **options) returning an async client
+DRIVERS = {
+    "motor": _motor_client,
+    "pymongo": _pymongo_client,
+}
+
+_client = None
+_db = None
+
+
+def _client_options() -> dict:
+    options = {
+        "maxPoolSize": settings.MONGODB_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGODB_MIN_POOL_SIZE,
+        "maxIdleTimeMS": settings.MONGODB_MAX_IDLE_TIME_MS,
+        "connectTimeoutMS": settings.MONGODB_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        "timeoutMS": settings.MONGODB_TIMEOUT_MS,
+        "readPreference": settings.MONGODB_READ_PREFERENCE,
+        "event_listeners": [MongoCommandMetrics()],
+    }
+    if settings.MONGODB_TLS:
+        import certifi
+
+        options["tls"] = True
+        options["tlsCAFile"] = certifi.where()
+    return options
+
+
+async def connect_db():
+    global _client, _db
+    if _client is None:
+        factory = DRIVERS.get(settings.MONGODB_DRIVER)
+        if factory is None:
+            raise RuntimeError(f"Unknown MONGODB_DRIVER: {settings.MONGODB_DRIVER}")
+        _client = factory(settings.MONGODB_URL, **_client_options())
+        _db = _client[settings.MONGODB_DB_NAME]
+    return _db
+
+
+async def close_db():
+    global _client, _db
+    if _client is not None:
+        closed = _client.close()
+        if inspect.isawaitable(closed):
+            await closed
+    _client = None
+    _db = None
+
+
+async def ensure_indexes():
+    db = get_db()
+    # message history pages: filter by user, keyset on (created_at, _id)
+    await db["messages"].create_index(
+        [("user_id", 1), ("created_at", -1), ("_id", -1)], name="user_created_at"
+    )
+    await db["action_requests"].create_index(
+        [("user_id", 1), ("status", 1), ("created_at", -1)], name="user_status_created_at"
+    )
+    # job queue claims: due queued jobs and running jobs whose lease expired
+    await db["action_requests"].create_index([("status", 1), ("run_after", 1)], name="status_run_after")
+    await db["action_requests"].create_index([("status", 1), ("lease_expires_at", 1)], name="status_lease")
+    # lapsed pending requests and finished ones past retention (services/action_requests.py)
+    await db["action_requests"].create_index([("expires_at", 1)], name="expires_at_ttl", expireAfterSeconds=0)
+    await db["conversation_summaries"].create_index([("user_id", 1)], name="user_id", unique=True)
+    await db["users"].create_index([("user_id", 1)], name="user_id")
+    await db["users"].create_index([("username", 1)], name="username")
+    # idle admission buckets are full again, so their documents can go
+    await db["rate_limits"].create_index([("expires_at", 1)], name="expires_at_ttl", expireAfterSeconds=0)
+    # shared cache tier (CACHE_BACKEND=mongo): expiry, size trimming, invalidation polling
+    await db["cache"].create_index([("expires_at", 1)], name="expires_at_ttl", expireAfterSeconds=0)
+    await db["cache"].create_index([("cache", 1), ("updated_at", 1)], name="cache_updated_at")
+    await db["cache_invalidations"].create_index([("at", 1)], name="at_ttl", expireAfterSeconds=60)
+
+
+def get_db():
+    if _db is None:
+        raise RuntimeError("Database is not connected; call connect_db() first")
+    return _db
+
+
+class _Collection:
+    """Resolves to the live collection so modules can import it before startup."""
+
+    def __init__(self, name: str):
+        self.name = name
 
-client = MongoClient(
-    settings.MONGODB_URL,
-    tls=True,
-    tlsCAFile=certifi.where()
-)
+    def __getattr__(self, attr):
+        return getattr(get_db()[self.name], attr)
 
-db = client["workspace_ai"]
 
-users_collection = db["users"]
-messages_collection = db["messages"]
-action_requests_collection = db["action_requests"]
\ No newline at end of file
+users_collection = _Collection("users")
+messages_collection = _Collection("messages")
+action_requests_collection = _Collection("action_requests")
+conversation_summaries_collection = _Collection("conversation_summaries")
+rate_limits_collection = _Collection("rate_limits")
+cache_collection = _Collection("cache")
+cache_invalidations_collection = _Collection("cache_invalidations")
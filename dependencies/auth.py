@@ -1,21 +1,63 @@
+import hashlib
+import time
+
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from config import settings
 from db import users_collection
-from utils.jwt import decode_access_token
+from utils.cache import Cache
+from utils.jwt import decode_access_token_claims
+from utils.tracing import span
 
 bearer = HTTPBearer(auto_error=False)
 
-def get_current_user_id(
+# sha256(token) -> user_id, kept until the token's exp; decoding is cheap, so per process
+_token_cache = Cache("auth_tokens", maxsize=settings.AUTH_CACHE_SIZE, shared=False)
+# user_id -> bool (user exists), short-lived so deleted users drop out quickly
+_user_cache = Cache("auth_users", maxsize=settings.AUTH_CACHE_SIZE)
+
+async def invalidate_user_cache(user_id: str):
+    await _user_cache.delete(user_id)
+
+def auth_cache_stats() -> dict:
+    return {"auth_tokens": _token_cache.stats, "auth_users": _user_cache.stats}
+
+async def _user_id_from_token(token: str) -> str:
+    key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    user_id = await _token_cache.get(key)
+    if user_id is not None:
+        return user_id
+    claims = decode_access_token_claims(token)
+    user_id = claims["sub"]
+    exp = claims.get("exp")
+    if exp:
+        ttl = float(exp) - time.time()
+        if ttl > 0:
+            await _token_cache.set(key, user_id, ttl=ttl)
+    return user_id
+
+async def _user_exists(user_id: str) -> bool:
+    exists = await _user_cache.get(user_id)
+    if exists is not None:
+        return exists
+    exists = await users_collection.find_one({"user_id": user_id}, {"_id": 1}) is not None
+    ttl = settings.AUTH_USER_CACHE_TTL_SECONDS if exists else settings.AUTH_USER_NEGATIVE_TTL_SECONDS
+    await _user_cache.set(user_id, exists, ttl=ttl)
+    return exists
+
+async def get_current_user_id(
     creds: HTTPAuthorizationCredentials = Depends(bearer),
 ) -> str:
     if not creds or creds.scheme.lower() != "bearer":
         raise HTTPException(status_code=401, detail="Missing Authorization header")
     try:
-        user_id = decode_access_token(creds.credentials)
+        with span("auth.jwt"):
+            user_id = await _user_id_from_token(creds.credentials)
     except ValueError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    user = users_collection.find_one({"user_id": user_id})
-    if not user:
+    with span("auth.user_lookup", user_id=user_id):
+        exists = await _user_exists(user_id)
+    if not exists:
         raise HTTPException(status_code=401, detail="User not found")
-    return user_id
\ No newline at end of file
+    return user_id
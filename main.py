@@ -1,4 +1,7 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 
 from api.routes.agent import router as agent_router
@@ -6,9 +9,63 @@ from api.routes.auth import router as auth_router
 from api.routes.messages import router as messages_router
 from api.routes.confirm import router as confirm_router
 
+from agent.admission import admission
+from agent.google_services import service_pool
+from agent.jobs import run_worker
+from agent.llm import close_client, open_client
+from agent.plan_cache import plan_cache
+from agent.tools import credential_manager
 from config import settings
+from db import connect_db, close_db, ensure_indexes
+from dependencies.auth import auth_cache_stats
+from services.messages import message_writer
+from utils.cache import cache_backend
+from utils.metrics import cache_stats, render_metrics
+from utils.oauth_client import oauth_client_config
+from utils.security import password_hasher
+from utils.tracing import TracingMiddleware, shutdown_tracing, tracing_stats
+
+cache_stats.register("google_services", service_pool.stats)
+cache_stats.register("google_credentials", credential_manager.stats)
+cache_stats.register("plan", plan_cache.stats)
+for _name, _stats in auth_cache_stats().items():
+    cache_stats.register(_name, _stats)
+cache_stats.register("trace_export", tracing_stats)
+cache_stats.register("password_hasher", password_hasher.stats)
+cache_stats.register("message_writer", message_writer.stats)
+cache_stats.register("admission", admission.stats)
+cache_stats.register("oauth_client_config", oauth_client_config.stats)
+cache_stats.register("cache_backend", cache_backend.stats)
+
+
+async def _start_db():
+    await connect_db()
+    if settings.MONGODB_CREATE_INDEXES:
+        await ensure_indexes()
+
 
-app = FastAPI(title="AI Workspace Automation Agent", version="0.1.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # the OpenAI SDK is imported in a thread while Mongo connects
+    await asyncio.gather(_start_db(), asyncio.to_thread(open_client))
+    await cache_backend.start()
+    stop_worker = asyncio.Event()
+    worker = asyncio.create_task(run_worker(stop_worker)) if settings.ACTION_WORKER_IN_PROCESS else None
+    try:
+        yield
+    finally:
+        if worker is not None:
+            stop_worker.set()
+            await worker
+        await message_writer.close()
+        await close_client()
+        await cache_backend.close()
+        await close_db()
+        password_hasher.shutdown()
+        shutdown_tracing()
+
+
+app = FastAPI(title="AI Workspace Automation Agent", version="0.1.0", lifespan=lifespan)
 
 origins = [origin.strip() for origin in settings.FRONTEND_ORIGINS.split(",") if origin.strip()]
 
@@ -19,6 +76,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# outermost, so the root span covers CORS handling and the whole streamed body
+app.add_middleware(TracingMiddleware)
 
 app.include_router(agent_router, prefix="/api")
 app.include_router(messages_router, prefix="/api")
@@ -28,4 +87,10 @@ app.include_router(auth_router, prefix="/auth")
 
 @app.get("/health")
 def health_check():
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+
+@app.get("/metrics")
+def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
\ No newline at end of file
@@ -1,28 +1,168 @@
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument
+from config import settings
 from db import action_requests_collection
+from utils.tracing import span
 
-def create_action_request(user_id: str, user_message: str, plans: list, confirmation_message: str):
+# expires_at drives the TTL index: a pending request lapses after
+# ACTION_REQUEST_PENDING_TTL_SECONDS, a finished one is kept for
+# ACTION_REQUEST_RETENTION_DAYS, and queued/running jobs never expire.
+
+def _retention(now: datetime) -> dict:
+    if settings.ACTION_REQUEST_RETENTION_DAYS > 0:
+        return {"$set": {"expires_at": now + timedelta(days=settings.ACTION_REQUEST_RETENTION_DAYS)}}
+    return {"$unset": {"expires_at": ""}}
+
+def is_expired(req: dict) -> bool:
+    expires_at = req.get("expires_at")
+    if req.get("status") != "pending" or expires_at is None:
+        return False
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    return expires_at <= datetime.now(timezone.utc)
+
+async def create_action_request(user_id: str, user_message: str, plans: list, confirmation_message: str):
+    now = datetime.now(timezone.utc)
     doc = {
         "user_id": user_id,
-        "status": "pending",  # pending | approved | canceled | executed | failed
+        "status": "pending",  # pending | queued | running | canceled | executed | failed
         "user_message": user_message,
         "plans": plans,
         "confirmation_message": confirmation_message,
-        "created_at": datetime.now(timezone.utc),
-        "updated_at": datetime.now(timezone.utc),
+        "created_at": now,
+        "updated_at": now,
     }
-    res = action_requests_collection.insert_one(doc)
+    if settings.ACTION_REQUEST_PENDING_TTL_SECONDS > 0:
+        doc["expires_at"] = now + timedelta(seconds=settings.ACTION_REQUEST_PENDING_TTL_SECONDS)
+    with span("mongo.create_action_request"):
+        res = await action_requests_collection.insert_one(doc)
     return str(res.inserted_id)
 
-def get_action_request(user_id: str, action_request_id: str):
-    return action_requests_collection.find_one({"_id": ObjectId(action_request_id), "user_id": user_id})
+def _object_id(action_request_id: str) -> ObjectId | None:
+    # ids come from the URL or request body; a malformed one matches nothing
+    try:
+        return ObjectId(action_request_id)
+    except (InvalidId, TypeError):
+        return None
+
+async def get_action_request(user_id: str, action_request_id: str):
+    _id = _object_id(action_request_id)
+    if _id is None:
+        return None
+    with span("mongo.get_action_request"):
+        return await action_requests_collection.find_one({"_id": _id, "user_id": user_id})
+
+async def transition_action_request(
+    action_request_id: str, user_id: str, from_status: str, to_status: str, update: dict | None = None
+):
+    """Move a request from from_status to to_status in one conditional update.
+
+    Returns the updated document, or None when the request does not exist,
+    belongs to someone else, is no longer in from_status or, if pending, has
+    expired. update holds extra operators ($set, $unset, ...) to apply.
+    """
+    _id = _object_id(action_request_id)
+    if _id is None:
+        return None
+    now = datetime.now(timezone.utc)
+    query = {"_id": _id, "user_id": user_id, "status": from_status}
+    if from_status == "pending":
+        # the TTL monitor only runs once a minute; don't act on a lapsed request meanwhile
+        query["$or"] = [{"expires_at": {"$gt": now}}, {"expires_at": {"$exists": False}}]
+    update = {op: dict(fields) for op, fields in (update or {}).items()}
+    update.setdefault("$set", {}).update(status=to_status, updated_at=now)
+    with span("mongo.transition_action_request", from_status=from_status, to_status=to_status):
+        return await action_requests_collection.find_one_and_update(
+            query, update, return_document=ReturnDocument.AFTER
+        )
+
+async def cancel_action_request(action_request_id: str, user_id: str):
+    return await transition_action_request(
+        action_request_id, user_id, "pending", "canceled", _retention(datetime.now(timezone.utc))
+    )
+
+# ------------------- Job queue -------------------
+# An approved request is a job: queued -> running (leased by one worker) ->
+# executed | failed, or back to queued with a later run_after to retry.
+# Writes from a worker are conditional on it still holding the lease.
+
+async def enqueue_action_request(action_request_id: str, user_id: str, summary_mode: str | None = None):
+    """Approve a pending request (pending -> queued); None if it was not pending."""
+    now = datetime.now(timezone.utc)
+    return await transition_action_request(action_request_id, user_id, "pending", "queued", {
+        "$set": {
+            "summary_mode": summary_mode,
+            "attempts": 0,
+            "run_after": now,
+            "queued_at": now,
+        },
+        "$unset": {"expires_at": ""},
+    })
+
+async def claim_action_request(worker_id: str, lease_seconds: float):
+    """Atomically lease the next due job (or one whose lease expired), or return None."""
+    now = datetime.now(timezone.utc)
+    return await action_requests_collection.find_one_and_update(
+        {"$or": [
+            {"status": "queued", "run_after": {"$lte": now}},
+            {"status": "running", "lease_expires_at": {"$lt": now}},
+        ]},
+        {
+            "$set": {
+                "status": "running",
+                "lease_owner": worker_id,
+                "lease_expires_at": now + timedelta(seconds=lease_seconds),
+                "updated_at": now,
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("run_after", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+def _leased(job_id, worker_id: str) -> dict:
+    return {"_id": ObjectId(str(job_id)), "status": "running", "lease_owner": worker_id}
+
+async def renew_lease(job_id, worker_id: str, lease_seconds: float) -> bool:
+    res = await action_requests_collection.update_one(
+        _leased(job_id, worker_id),
+        {"$set": {"lease_expires_at": datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)}},
+    )
+    return res.matched_count == 1
+
+async def record_plan_results(job_id, worker_id: str, entries: dict) -> bool:
+    """Store per-plan state under plan_results.<index>; entries maps index -> state dict."""
+    update = {f"plan_results.{index}": entry for index, entry in entries.items()}
+    update["updated_at"] = datetime.now(timezone.utc)
+    res = await action_requests_collection.update_one(_leased(job_id, worker_id), {"$set": update})
+    return res.matched_count == 1
+
+async def retry_action_request(job_id, worker_id: str, delay_seconds: float, error: str) -> bool:
+    now = datetime.now(timezone.utc)
+    res = await action_requests_collection.update_one(
+        _leased(job_id, worker_id),
+        {
+            "$set": {
+                "status": "queued",
+                "run_after": now + timedelta(seconds=delay_seconds),
+                "last_error": error,
+                "updated_at": now,
+            },
+            "$unset": {"lease_owner": "", "lease_expires_at": ""},
+        },
+    )
+    return res.matched_count == 1
 
-def mark_action_request(action_request_id: str, user_id: str, status: str, extra: dict | None = None):
-    update = {"status": status, "updated_at": datetime.now(timezone.utc)}
+async def finish_action_request(job_id, worker_id: str, status: str, extra: dict | None = None) -> bool:
+    now = datetime.now(timezone.utc)
+    retention = _retention(now)
+    update = {"status": status, "updated_at": now, **retention.get("$set", {})}
     if extra:
         update.update(extra)
-    action_requests_collection.update_one(
-        {"_id": ObjectId(action_request_id), "user_id": user_id},
-        {"$set": update},
-    )
\ No newline at end of file
+    res = await action_requests_collection.update_one(
+        _leased(job_id, worker_id),
+        {"$set": update, "$unset": {"lease_owner": "", "lease_expires_at": "", **retention.get("$unset", {})}},
+    )
+    return res.matched_count == 1
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from db import cache_collection, cache_invalidations_collection
+
+# one document per entry: {"_id": "<cache>:<key>", "cache", "value": <json>, "expires_at", "updated_at"}.
+# expires_at is absent for entries without a TTL; the TTL index drops expired ones.
+
+def _id(cache: str, key: str) -> str:
+    return f"{cache}:{key}"
+
+def _live(now: datetime) -> dict:
+    return {"$or": [{"expires_at": {"$gt": now}}, {"expires_at": {"$exists": False}}]}
+
+def _fields(cache: str, value: str, ttl: float | None, now: datetime) -> tuple[dict, dict]:
+    fields = {"cache": cache, "value": value, "updated_at": now}
+    if ttl is None:
+        return fields, {"expires_at": ""}
+    return {**fields, "expires_at": now + timedelta(seconds=ttl)}, {}
+
+async def get_entry(cache: str, key: str) -> tuple[str, float | None] | None:
+    """(value, seconds left or None) of a live entry."""
+    now = datetime.now(timezone.utc)
+    doc = await cache_collection.find_one({"_id": _id(cache, key), **_live(now)}, {"value": 1, "expires_at": 1})
+    if doc is None:
+        return None
+    expires_at = doc.get("expires_at")
+    if expires_at is None:
+        return doc["value"], None
+    return doc["value"], (expires_at.replace(tzinfo=timezone.utc) - now).total_seconds()
+
+async def put_entry(cache: str, key: str, value: str, ttl: float | None):
+    fields, unset = _fields(cache, value, ttl, datetime.now(timezone.utc))
+    update = {"$set": fields}
+    if unset:
+        update["$unset"] = unset
+    await cache_collection.update_one({"_id": _id(cache, key)}, update, upsert=True)
+
+async def add_entry(cache: str, key: str, value: str, ttl: float) -> bool:
+    """Store the entry unless a live one exists; True when this call stored it."""
+    now = datetime.now(timezone.utc)
+    fields, _unset = _fields(cache, value, ttl, now)
+    try:
+        await cache_collection.insert_one({"_id": _id(cache, key), **fields})
+        return True
+    except DuplicateKeyError:
+        pass
+    # an expired entry the TTL monitor has not removed yet does not count
+    res = await cache_collection.update_one(
+        {"_id": _id(cache, key), "expires_at": {"$lte": now}}, {"$set": fields}
+    )
+    return res.matched_count > 0
+
+async def delete_entry(cache: str, key: str):
+    await cache_collection.delete_one({"_id": _id(cache, key)})
+
+async def trim_entries(cache: str, maxsize: int) -> int:
+    """Delete the least recently written entries of a cache beyond maxsize."""
+    excess = await cache_collection.count_documents({"cache": cache}) - maxsize
+    if excess <= 0:
+        return 0
+    oldest = await cache_collection.find({"cache": cache}, {"_id": 1}).sort("updated_at", 1).limit(excess).to_list(excess)
+    res = await cache_collection.delete_many({"_id": {"$in": [doc["_id"] for doc in oldest]}})
+    return res.deleted_count
+
+async def publish_invalidation(cache: str, key: str, origin: str):
+    # "at" is the server's clock, so readers need not trust their own
+    await cache_invalidations_collection.update_one(
+        {"_id": ObjectId()},
+        {"$set": {"cache": cache, "key": key, "origin": origin}, "$currentDate": {"at": True}},
+        upsert=True,
+    )
+
+async def invalidations_since(at: datetime | None) -> list:
+    query = {"at": {"$gte": at}} if at is not None else {}
+    return await cache_invalidations_collection.find(query).sort("at", 1).to_list(None)
@@ -0,0 +1,24 @@
+from datetime import datetime, timezone
+from pymongo.errors import DuplicateKeyError
+from db import conversation_summaries_collection
+
+async def get_conversation_summary(user_id: str):
+    return await conversation_summaries_collection.find_one({"user_id": user_id})
+
+async def save_conversation_summary(user_id: str, summary: str, covered_until: str, previous: str | None):
+    """Store the rolling summary unless another worker already advanced it past previous."""
+    try:
+        res = await conversation_summaries_collection.update_one(
+            {"user_id": user_id, "covered_until": previous},
+            {
+                "$set": {
+                    "summary": summary,
+                    "covered_until": covered_until,
+                    "updated_at": datetime.now(timezone.utc),
+                }
+            },
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return False
+    return res.matched_count > 0 or res.upserted_id is not None
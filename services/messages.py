@@ -1,36 +1,303 @@
+import asyncio
+import base64
+import contextvars
+import logging
 from datetime import datetime, timezone
 from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import BulkWriteError, ConnectionFailure
+from config import settings
 from db import messages_collection
+from utils.tracing import span
 
-def create_message(user_id: str, role: str, content):
+logger = logging.getLogger(__name__)
+
+# fields a caller may ask for; _id, user_id and created_at are always returned
+MESSAGE_FIELDS = ("role", "content")
+
+_WRITE_ATTEMPTS = 3
+
+
+class MessageWriter:
+    """Write-behind buffer for message inserts.
+
+    Documents get their _id client-side and are queued; a background task
+    writes them with insert_many once MESSAGE_WRITE_BATCH_SIZE are waiting or
+    MESSAGE_WRITE_FLUSH_MS after the first one. A full queue makes submit()
+    wait (backpressure). Because the _id is assigned up front, a batch retried
+    after a dropped connection cannot duplicate messages: duplicate-key errors
+    mean the first attempt landed.
+    """
+
+    def __init__(self, batch_size: int, flush_ms: float, max_pending: int):
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = max(0.0, flush_ms) / 1000
+        self.max_pending = max_pending
+        self._loop = None
+        self._queue = None
+        self._task = None
+        self._pending = {}  # user_id -> {_id: (doc, future)} not yet acknowledged
+        self.batches = 0
+        self.written = 0
+        self.failed = 0
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._task is not None and self._loop is loop and not self._task.done():
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        # empty context: the flush task must not inherit the caller's trace span
+        self._task = loop.create_task(self._run(), context=contextvars.Context())
+
+    async def submit(self, doc: dict) -> asyncio.Future:
+        """Queue doc (which must carry _id); the future resolves to the _id once written."""
+        self._ensure_started()
+        future = self._loop.create_future()
+        pending = self._pending.setdefault(doc["user_id"], {})
+        pending[doc["_id"]] = (doc, future)
+        future.add_done_callback(lambda f: self._settled(doc, f))
+        await self._queue.put((doc, future))
+        return future
+
+    def _settled(self, doc: dict, future: asyncio.Future):
+        pending = self._pending.get(doc["user_id"])
+        if pending is not None:
+            pending.pop(doc["_id"], None)
+            if not pending:
+                del self._pending[doc["user_id"]]
+        if not future.cancelled():
+            future.exception()  # retrieved here; the failure is logged in _write
+
+    def pending_for(self, user_id: str) -> list:
+        """Queued documents for user_id that are not yet acknowledged."""
+        return [doc for doc, _ in (self._pending.get(user_id) or {}).values()]
+
+    async def wait_for(self, user_id: str):
+        """Wait until every message queued so far for user_id is written (or failed)."""
+        futures = [future for _, future in (self._pending.get(user_id) or {}).values()]
+        if futures:
+            await asyncio.gather(*futures, return_exceptions=True)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        closing = False
+        while not closing:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), remaining)
+                    except TimeoutError:
+                        break
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+            try:
+                await self._write(batch)
+            except Exception as e:
+                self._fail(batch, range(len(batch)), e)
+
+    async def _write(self, batch: list):
+        docs = [doc for doc, _ in batch]
+        failures = {}
+        for attempt in range(1, _WRITE_ATTEMPTS + 1):
+            try:
+                await messages_collection.insert_many(docs, ordered=False)
+            except BulkWriteError as e:
+                # 11000: already inserted by an earlier attempt of this batch
+                failures = {
+                    err["index"]: err.get("errmsg", "write error")
+                    for err in e.details.get("writeErrors", []) if err.get("code") != 11000
+                }
+            except ConnectionFailure as e:
+                if attempt < _WRITE_ATTEMPTS:
+                    await asyncio.sleep(0.1 * 2 ** attempt)
+                    continue
+                failures = {index: str(e) for index in range(len(batch))}
+            break
+        self.batches += 1
+        self.written += len(batch) - len(failures)
+        if failures:
+            self._fail(batch, failures, RuntimeError(next(iter(failures.values()))))
+        for index, (doc, future) in enumerate(batch):
+            if index not in failures and not future.done():
+                future.set_result(doc["_id"])
+
+    def _fail(self, batch: list, indexes, error: Exception):
+        indexes = list(indexes)
+        self.failed += len(indexes)
+        logger.error("Dropped %d of %d buffered message writes: %s", len(indexes), len(batch), error)
+        for index in indexes:
+            future = batch[index][1]
+            if not future.done():
+                future.set_exception(error)
+
+    async def close(self):
+        """Flush everything queued and stop the background task."""
+        if self._task is None or self._task.done() or self._loop is not asyncio.get_running_loop():
+            return
+        await self._queue.put(None)
+        await self._task
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "unacknowledged": sum(len(pending) for pending in self._pending.values()),
+            "batches": self.batches,
+            "written": self.written,
+            "failed": self.failed,
+            "max_pending": self.max_pending,
+        }
+
+
+message_writer = MessageWriter(
+    batch_size=settings.MESSAGE_WRITE_BATCH_SIZE,
+    flush_ms=settings.MESSAGE_WRITE_FLUSH_MS,
+    max_pending=settings.MESSAGE_WRITE_MAX_PENDING,
+)
+
+async def create_message(user_id: str, role: str, content, wait: bool = False):
+    """Store a message and return it with its _id.
+
+    With MESSAGE_WRITE_BEHIND the insert is buffered (see MessageWriter) and
+    this returns once the message is queued; wait=True returns only after it
+    is written. Reads through this module see a user's queued messages.
+    """
+    now = datetime.now(timezone.utc)
     doc = {
+        "_id": ObjectId(),
         "user_id": user_id,
         "role": role,  # "user" | "assistant" | "tool"
         "content": content,
-        "created_at": datetime.now(timezone.utc),
+        # BSON keeps milliseconds; truncate so queued and stored copies sort alike
+        "created_at": now.replace(microsecond=now.microsecond // 1000 * 1000),
     }
-    res = messages_collection.insert_one(doc)
-    doc["_id"] = res.inserted_id
+    with span("mongo.create_message", role=role, buffered=settings.MESSAGE_WRITE_BEHIND):
+        if not settings.MESSAGE_WRITE_BEHIND:
+            await messages_collection.insert_one(doc)
+            return doc
+        future = await message_writer.submit(doc)
+        if wait:
+            await future
     return doc
 
 def serialize_message(doc: dict) -> dict:
+    out = {"id": str(doc["_id"]), "user_id": doc["user_id"]}
+    for field in MESSAGE_FIELDS:
+        if field in doc:
+            out[field] = doc[field]
+    out["created_at"] = doc["created_at"].isoformat() if doc.get("created_at") else None
+    return out
+
+def encode_cursor(doc: dict) -> str:
+    created_at = doc["created_at"]
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    raw = f"{int(created_at.timestamp() * 1000)}:{doc['_id']}"
+    return base64.urlsafe_b64encode(raw.encode("ascii")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[datetime, ObjectId]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        millis, oid = base64.urlsafe_b64decode(padded.encode("ascii")).decode("ascii").split(":", 1)
+        return datetime.fromtimestamp(int(millis) / 1000, tz=timezone.utc), ObjectId(oid)
+    except (ValueError, InvalidId, UnicodeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+def _keyset(op: str, cursor: str) -> dict:
+    created_at, oid = decode_cursor(cursor)
     return {
-        "id": str(doc["_id"]),
-        "user_id": doc["user_id"],
-        "role": doc["role"],
-        "content": doc["content"],
-        "created_at": doc["created_at"].isoformat() if doc.get("created_at") else None,
+        "$or": [
+            {"created_at": {op: created_at}},
+            {"created_at": created_at, "_id": {op: oid}},
+        ]
     }
 
-def list_messages(user_id: str, limit: int = 50):
+async def list_messages(
+    user_id: str,
+    limit: int = 50,
+    before: str | None = None,
+    after: str | None = None,
+    fields: list[str] | None = None,
+    oldest_first: bool = False,
+):
+    """Newest-first page of a user's messages.
+
+    before/after are cursors from a previous page: before pages back into
+    older history, after returns the messages right after the cursor; both
+    together select a window. oldest_first takes the oldest matching
+    messages even without an after cursor. Raises ValueError for a malformed
+    cursor.
+    """
+    await message_writer.wait_for(user_id)
+    bounds = []
+    if before:
+        bounds.append(_keyset("$lt", before))
+    if after:
+        bounds.append(_keyset("$gt", after))
+    query = {"user_id": user_id}
+    if bounds:
+        query["$and"] = bounds
+    # with an after cursor, take the oldest messages past it (then flip to newest-first)
+    direction = 1 if after or oldest_first else -1
+
+    projection = {"user_id": 1, "created_at": 1}
+    for field in fields or MESSAGE_FIELDS:
+        if field in MESSAGE_FIELDS:
+            projection[field] = 1
+
+    cur = (
+        messages_collection
+        .find(query, projection)
+        .sort([("created_at", direction), ("_id", direction)])
+        .limit(limit)
+    )
+    docs = await cur.to_list(length=limit)
+    if direction == 1:
+        docs.reverse()
+    return {
+        "messages": [serialize_message(d) for d in docs],
+        "next_before": encode_cursor(docs[-1]) if docs else before,
+        "next_after": encode_cursor(docs[0]) if docs else after,
+    }
+
+def _stored_copy(doc: dict) -> dict:
+    # as the driver returns it: naive UTC created_at
+    created_at = doc["created_at"]
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return {"_id": doc["_id"], "role": doc["role"], "content": doc["content"], "created_at": created_at}
+
+async def recent_messages(user_id: str, limit: int):
+    """Raw message documents, newest first, including ones still queued for writing."""
+    # taken before the read: anything no longer queued by then is already stored
+    queued = [_stored_copy(doc) for doc in message_writer.pending_for(user_id)]
     cur = (
         messages_collection
-        .find({"user_id": user_id})
-        .sort("created_at", -1)
+        .find({"user_id": user_id}, {"role": 1, "content": 1, "created_at": 1})
+        .sort([("created_at", -1), ("_id", -1)])
         .limit(limit)
     )
-    return [serialize_message(d) for d in cur]
+    docs = await cur.to_list(length=limit)
+    if not queued:
+        return docs
+    stored = {doc["_id"] for doc in docs}
+    docs += [doc for doc in queued if doc["_id"] not in stored]
+    docs.sort(key=lambda doc: (doc["created_at"], doc["_id"]), reverse=True)
+    return docs[:limit]
 
-def get_message(user_id: str, message_id: str):
-    doc = messages_collection.find_one({"_id": ObjectId(message_id), "user_id": user_id})
-    return serialize_message(doc) if doc else None
\ No newline at end of file
+async def get_message(user_id: str, message_id: str):
+    await message_writer.wait_for(user_id)
+    doc = await messages_collection.find_one({"_id": ObjectId(message_id), "user_id": user_id})
+    return serialize_message(doc) if doc else None
@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta, timezone
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from db import rate_limits_collection
+
+# one document per limit: {"_id": key, "tat": <epoch seconds>, "expires_at"}. tat is the
+# GCRA "theoretical arrival time"; once it is in the past the limit is idle, so the
+# TTL index may drop the document shortly after.
+_IDLE_SECONDS = 60
+
+def _expires_at(tat: float) -> datetime:
+    return datetime.fromtimestamp(tat, tz=timezone.utc) + timedelta(seconds=_IDLE_SECONDS)
+
+async def advance_tat(key: str, increment: float, now: float, limit: float) -> float | None:
+    """Atomically move key's tat to max(tat, now) + increment unless that passes limit.
+
+    Returns the new tat, or None when the key is too far ahead (or moved
+    concurrently; read it with get_tat to tell).
+    """
+    doc = await rate_limits_collection.find_one_and_update(
+        {"_id": key, "tat": {"$gt": now, "$lte": limit - increment}},
+        {"$inc": {"tat": increment}, "$set": {"expires_at": _expires_at(limit)}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if doc is not None:
+        return doc["tat"]
+    try:
+        res = await rate_limits_collection.update_one(
+            {"_id": key, "$or": [{"tat": {"$lte": now}}, {"tat": {"$exists": False}}]},
+            {"$set": {"tat": now + increment, "expires_at": _expires_at(now + increment)}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return None
+    return now + increment if res.matched_count > 0 or res.upserted_id is not None else None
+
+async def get_tat(key: str) -> float | None:
+    doc = await rate_limits_collection.find_one({"_id": key}, {"tat": 1})
+    return (doc or {}).get("tat")
+
+async def rewind_tat(key: str, seconds: float):
+    """Hand back capacity (or, with a negative value, take more) without a limit check."""
+    await rate_limits_collection.update_one({"_id": key, "tat": {"$exists": True}}, {"$inc": {"tat": -seconds}})
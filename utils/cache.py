@@ -0,0 +1,413 @@
+"""Caches: an in-process LRU per cache, optionally backed by a tier shared by all workers.
+
+CACHE_BACKEND=memory keeps every cache in its process. With mongo or redis,
+values of shared caches are also stored there (JSON) and each worker keeps
+a local copy for at most CACHE_LOCAL_TTL_SECONDS. Deletes are broadcast, so
+other workers drop their copies: redis uses pub/sub, mongo a collection that
+workers poll every CACHE_INVALIDATION_POLL_SECONDS. Caches created with
+shared=False hold values that cannot leave the process (e.g. credential
+objects) but get the same broadcast deletes.
+
+The shared tier is an optimization: when it fails, lookups miss and writes
+are dropped rather than failing the request.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import timedelta
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+# shared entries of a cache are trimmed to its maxsize after this many writes (mongo)
+_TRIM_EVERY = 256
+# invalidations written this close together may become visible out of order (mongo)
+_POLL_OVERLAP = timedelta(seconds=5)
+_REDIS_PREFIX = "workspaceai:cache:"
+_REDIS_CHANNEL = "workspaceai:cache:invalidate"
+
+
+class LRUCache:
+    """Thread-safe LRU cache with an optional per-entry TTL (seconds)."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at | None, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                expires_at, value = item
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl: float | None = None):
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def _store(self, key, value, ttl: float | None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def add(self, key, value, ttl: float | None = None) -> bool:
+        """Set key unless it holds a live value; True when this call set it."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and (item[0] is None or item[0] > time.monotonic()):
+                return False
+            self._store(key, value, ttl)
+            return True
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, _MISSING)
+        return default if item is _MISSING else item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
+
+
+class Cache:
+    """A named cache with TTLs and LRU eviction at maxsize; see the module docstring."""
+
+    def __init__(self, name: str, maxsize: int, ttl: float | None = None, shared: bool = True, backend=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.backend = backend or cache_backend
+        self.shared = shared and self.backend.shared
+        # this process's tier; code running in threads may use it directly when shared=False
+        self.local = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._writes = 0
+        self._trims = set()
+        self.shared_hits = 0
+        self.errors = 0
+        self.backend.register(self)
+
+    def _local_ttl(self, ttl: float | None) -> float | None:
+        if not self.shared:
+            return ttl
+        return settings.CACHE_LOCAL_TTL_SECONDS if ttl is None else min(ttl, settings.CACHE_LOCAL_TTL_SECONDS)
+
+    def _failed(self, operation: str, exc: Exception):
+        self.errors += 1
+        if self.errors % 100 == 1:
+            logger.warning("Cache %s: shared %s failed (%d so far): %s", self.name, operation, self.errors, exc)
+
+    async def get(self, key: str, default=None):
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING or not self.shared:
+            return default if value is _MISSING else value
+        try:
+            entry = await self.backend.get(self.name, key)
+            if entry is None:
+                return default
+            raw, ttl = entry
+            value = json.loads(raw)
+        except Exception as e:
+            self._failed("get", e)
+            return default
+        self.shared_hits += 1
+        self.local.set(key, value, ttl=self._local_ttl(ttl))
+        return value
+
+    async def set(self, key: str, value, ttl: float | None = None):
+        """Store a value derived from the source of truth; other workers' copies are left alone."""
+        ttl = self.ttl if ttl is None else ttl
+        self.local.set(key, value, ttl=self._local_ttl(ttl))
+        if not self.shared:
+            return
+        try:
+            await self.backend.set(self.name, key, json.dumps(value, separators=(",", ":")), ttl)
+        except Exception as e:
+            self._failed("set", e)
+            return
+        self._writes += 1
+        if self._writes % _TRIM_EVERY == 0:
+            task = asyncio.ensure_future(self._trim())
+            self._trims.add(task)
+            task.add_done_callback(self._trims.discard)
+
+    async def _trim(self):
+        try:
+            await self.backend.trim(self.name, self.maxsize)
+        except Exception as e:
+            self._failed("trim", e)
+
+    async def add(self, key: str, value, ttl: float) -> bool:
+        """Set key unless it holds a value, atomically across workers when shared (a lease or lock)."""
+        if not self.shared:
+            return self.local.add(key, value, ttl)
+        try:
+            return await self.backend.add(self.name, key, json.dumps(value, separators=(",", ":")), ttl)
+        except Exception as e:
+            self._failed("add", e)
+            # without the shared tier nobody can coordinate; let the caller go ahead
+            return True
+
+    async def delete(self, key: str):
+        """Drop key here, in the shared tier and in every other worker."""
+        self.local.pop(key)
+        try:
+            if self.shared:
+                await self.backend.delete(self.name, key)
+            await self.backend.publish(self.name, key)
+        except Exception as e:
+            self._failed("delete", e)
+
+    def invalidate_local(self, key: str | None = None):
+        """Drop this process's copy of key (all keys when None)."""
+        if key is None:
+            self.local.clear()
+        else:
+            self.local.pop(key)
+
+    def stats(self) -> dict:
+        return {**self.local.stats(), "shared_hits": self.shared_hits, "errors": self.errors}
+
+
+class _Backend:
+    shared = False
+
+    def __init__(self):
+        self.origin = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._caches = {}
+        self._listener = None
+        self._listening = True
+        self.sent = 0
+        self.received = 0
+        self.errors = 0
+
+    def register(self, cache: Cache):
+        self._caches[cache.name] = cache
+
+    def _invalidated(self, name: str, key: str, origin: str):
+        if origin == self.origin:
+            return
+        cache = self._caches.get(name)
+        if cache is not None:
+            self.received += 1
+            cache.invalidate_local(key)
+
+    def _lost_invalidations(self, exc: Exception):
+        # whatever was broadcast meanwhile is unknown, so no local copy can be trusted
+        self.errors += 1
+        if self._listening:
+            logger.warning("Cache invalidations interrupted, dropping local copies until they resume: %s", exc)
+        self._listening = False
+        for cache in self._caches.values():
+            cache.invalidate_local()
+
+    async def _listen(self):
+        pass
+
+    async def start(self):
+        if self.shared and self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    async def publish(self, name: str, key: str):
+        pass
+
+    async def trim(self, name: str, maxsize: int):
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "invalidations_sent": self.sent,
+            "invalidations_received": self.received,
+            "listener_errors": self.errors,
+        }
+
+
+class MemoryBackend(_Backend):
+    """No shared tier: every cache lives in its process."""
+
+
+class MongoBackend(_Backend):
+    """Shared tier in the cache collection; invalidations are polled (services/cache_entries.py)."""
+
+    shared = True
+
+    async def get(self, name: str, key: str):
+        from services.cache_entries import get_entry
+
+        return await get_entry(name, key)
+
+    async def set(self, name: str, key: str, value: str, ttl: float | None):
+        from services.cache_entries import put_entry
+
+        await put_entry(name, key, value, ttl)
+
+    async def add(self, name: str, key: str, value: str, ttl: float) -> bool:
+        from services.cache_entries import add_entry
+
+        return await add_entry(name, key, value, ttl)
+
+    async def delete(self, name: str, key: str):
+        from services.cache_entries import delete_entry
+
+        await delete_entry(name, key)
+
+    async def trim(self, name: str, maxsize: int):
+        from services.cache_entries import trim_entries
+
+        await trim_entries(name, maxsize)
+
+    async def publish(self, name: str, key: str):
+        from services.cache_entries import publish_invalidation
+
+        await publish_invalidation(name, key, self.origin)
+        self.sent += 1
+
+    async def _listen(self):
+        from services.cache_entries import invalidations_since
+
+        newest = None  # server time of the newest invalidation seen
+        seen = {}  # _id -> at, within the overlap window
+        while True:
+            try:
+                docs = await invalidations_since(newest - _POLL_OVERLAP if newest is not None else None)
+                for doc in docs:
+                    if doc["_id"] in seen:
+                        continue
+                    seen[doc["_id"]] = doc["at"]
+                    newest = doc["at"] if newest is None else max(newest, doc["at"])
+                    self._invalidated(doc["cache"], doc["key"], doc["origin"])
+                if newest is not None:
+                    seen = {_id: at for _id, at in seen.items() if at >= newest - _POLL_OVERLAP}
+                self._listening = True
+            except Exception as e:
+                self._lost_invalidations(e)
+            await asyncio.sleep(settings.CACHE_INVALIDATION_POLL_SECONDS)
+
+
+class RedisBackend(_Backend):
+    """Shared tier in Redis (or anything speaking its protocol, see bench/fake_redis.py).
+
+    Entries expire with Redis TTLs; size limits are the server's maxmemory
+    policy (allkeys-lru). Invalidations use pub/sub.
+    """
+
+    shared = True
+
+    def __init__(self):
+        super().__init__()
+        self._client = None
+
+    def _redis(self):
+        if self._client is None:
+            import redis.asyncio as redis
+
+            # RESP2 works with every server version and with bench/fake_redis.py
+            self._client = redis.from_url(settings.CACHE_REDIS_URL, protocol=2)
+        return self._client
+
+    async def get(self, name: str, key: str):
+        async with self._redis().pipeline(transaction=False) as pipe:
+            pipe.get(_REDIS_PREFIX + f"{name}:{key}")
+            pipe.pttl(_REDIS_PREFIX + f"{name}:{key}")
+            raw, pttl = await pipe.execute()
+        if raw is None:
+            return None
+        return raw.decode("utf-8"), pttl / 1000 if pttl >= 0 else None
+
+    async def set(self, name: str, key: str, value: str, ttl: float | None):
+        px = max(1, int(ttl * 1000)) if ttl is not None else None
+        await self._redis().set(_REDIS_PREFIX + f"{name}:{key}", value, px=px)
+
+    async def add(self, name: str, key: str, value: str, ttl: float) -> bool:
+        return bool(await self._redis().set(_REDIS_PREFIX + f"{name}:{key}", value, px=max(1, int(ttl * 1000)), nx=True))
+
+    async def delete(self, name: str, key: str):
+        await self._redis().delete(_REDIS_PREFIX + f"{name}:{key}")
+
+    async def publish(self, name: str, key: str):
+        await self._redis().publish(_REDIS_CHANNEL, json.dumps([name, key, self.origin]))
+        self.sent += 1
+
+    async def _listen(self):
+        while True:
+            pubsub = self._redis().pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(_REDIS_CHANNEL)
+                self._listening = True
+                async for message in pubsub.listen():
+                    self._invalidated(*json.loads(message["data"]))
+                raise ConnectionError("Subscription ended")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._lost_invalidations(e)
+            finally:
+                await pubsub.aclose()
+            await asyncio.sleep(1)
+
+    async def close(self):
+        await super().close()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# CACHE_BACKEND -> backend class
+BACKENDS = {
+    "memory": MemoryBackend,
+    "mongo": MongoBackend,
+    "redis": RedisBackend,
+}
+
+
+def _backend() -> _Backend:
+    backend = BACKENDS.get(settings.CACHE_BACKEND)
+    if backend is None:
+        raise RuntimeError(f"Unknown CACHE_BACKEND: {settings.CACHE_BACKEND}")
+    return backend()
+
+
+cache_backend = _backend()
@@ -8,12 +8,14 @@ def create_access_token(user_id: str) -> str:
     payload = {"sub": user_id, "iat": int(now.timestamp()), "exp": exp}
     return jwt.encode(payload, settings.JWT_SECRET, algorithm=settings.JWT_ALGORITHM)
 
-def decode_access_token(token: str) -> str:
+def decode_access_token_claims(token: str) -> dict:
     try:
         payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
     except JWTError as exc:
         raise ValueError("Invalid token") from exc
-    user_id = payload.get("sub")
-    if not user_id:
+    if not payload.get("sub"):
         raise ValueError("Invalid token payload")
-    return user_id
\ No newline at end of file
+    return payload
+
+def decode_access_token(token: str) -> str:
+    return decode_access_token_claims(token)["sub"]
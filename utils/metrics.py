@@ -0,0 +1,118 @@
+import os
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from pymongo import monitoring
+
+_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+_DB_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+LLM_LATENCY = Histogram(
+    "workspaceai_llm_request_seconds",
+    "Chat completion latency (time to the last token when streaming)",
+    ["mode", "model", "outcome"],
+    buckets=_LATENCY_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "workspaceai_llm_tokens_total",
+    "Tokens reported by the OpenAI usage block",
+    ["mode", "model", "kind"],
+)
+LLM_EVENTS = Counter(
+    "workspaceai_llm_resilience_total",
+    "Retries, hedged requests, fallbacks and deadline expiries of LLM calls",
+    ["mode", "event"],
+)
+ROUTER_DECISIONS = Counter(
+    "workspaceai_router_decisions_total",
+    "Local intent router decisions (canned reply, cheap chat model or planner)",
+    ["route", "reason"],
+)
+TOOL_LATENCY = Histogram(
+    "workspaceai_tool_seconds",
+    "Google tool call latency; a batch counts once",
+    ["tool", "outcome"],
+    buckets=_LATENCY_BUCKETS,
+)
+TOOL_PLANS = Counter(
+    "workspaceai_tool_plans_total",
+    "Plans executed per tool",
+    ["tool", "outcome"],
+)
+MONGO_LATENCY = Histogram(
+    "workspaceai_mongo_command_seconds",
+    "MongoDB command round-trip time",
+    ["command", "collection", "outcome"],
+    buckets=_DB_BUCKETS,
+)
+
+
+def observe_llm(mode: str, model: str, seconds: float, ok: bool, usage=None):
+    LLM_LATENCY.labels(mode=mode, model=model, outcome="ok" if ok else "error").observe(seconds)
+    if usage is not None:
+        LLM_TOKENS.labels(mode=mode, model=model, kind="prompt").inc(usage.prompt_tokens or 0)
+        LLM_TOKENS.labels(mode=mode, model=model, kind="completion").inc(usage.completion_tokens or 0)
+
+
+def observe_tool(tool: str, seconds: float, outcomes: list):
+    failed = sum(1 for outcome in outcomes if isinstance(outcome, Exception))
+    TOOL_LATENCY.labels(tool=tool, outcome="error" if failed == len(outcomes) else "ok").observe(seconds)
+    TOOL_PLANS.labels(tool=tool, outcome="ok").inc(len(outcomes) - failed)
+    TOOL_PLANS.labels(tool=tool, outcome="error").inc(failed)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """pymongo command listener feeding MONGO_LATENCY; pass it in event_listeners."""
+
+    def __init__(self):
+        self._collections = {}  # request_id -> collection name
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        self._collections[event.request_id] = collection if isinstance(collection, str) else ""
+
+    def _observe(self, event, outcome: str):
+        collection = self._collections.pop(event.request_id, "")
+        MONGO_LATENCY.labels(
+            command=event.command_name, collection=collection, outcome=outcome
+        ).observe(event.duration_micros / 1_000_000)
+
+    def succeeded(self, event):
+        self._observe(event, "ok")
+
+    def failed(self, event):
+        self._observe(event, "error")
+
+
+class _CacheStatsCollector:
+    """Exports the stats() dicts of registered in-process caches as gauges."""
+
+    def __init__(self):
+        self._sources = {}
+
+    def register(self, name: str, stats):
+        self._sources[name] = stats
+
+    def collect(self):
+        family = GaugeMetricFamily(
+            "workspaceai_cache", "In-process cache counters and sizes", labels=["cache", "stat"]
+        )
+        for name, stats in self._sources.items():
+            for stat, value in stats().items():
+                family.add_metric([name, stat], value)
+        yield family
+
+
+cache_stats = _CacheStatsCollector()
+REGISTRY.register(cache_stats)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # uvicorn --workers N: aggregate the per-process files
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,85 @@
+import json
+import logging
+import os
+import threading
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _candidate_paths() -> list:
+    paths = []
+    if settings.GOOGLE_TOKEN_JSON_PATH:
+        paths.append(settings.GOOGLE_TOKEN_JSON_PATH)
+    paths.append(os.path.join(_ROOT, "credentials.json"))
+    paths.append(os.path.join(os.getcwd(), "credentials.json"))
+    return list(dict.fromkeys(os.path.abspath(path) for path in paths))
+
+
+class OAuthClientConfig:
+    """The Google OAuth client ("web" or "installed" section of credentials.json).
+
+    The first candidate file holding such a section wins. Files are parsed
+    once; later calls only stat the candidates and re-read them when an
+    mtime changes or a file appears or disappears.
+    """
+
+    def __init__(self, candidates=_candidate_paths):
+        self._candidates = candidates
+        self._signature = None  # ((path, mtime_ns), ...) of the existing candidates
+        self._path = None
+        self._config = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def _stat(self) -> tuple:
+        signature = []
+        for path in self._candidates():
+            try:
+                signature.append((path, os.stat(path).st_mtime_ns))
+            except OSError:
+                continue
+        return tuple(signature)
+
+    def _load(self, signature: tuple):
+        self._path, self._config = None, {}
+        for path, _mtime in signature:
+            try:
+                with open(path, "r", encoding="utf-8") as handle:
+                    payload = json.load(handle)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning("Skipping OAuth client file %s: %s", path, e)
+                continue
+            section = (payload.get("web") or payload.get("installed")) if isinstance(payload, dict) else None
+            if section:
+                self._path, self._config = path, section
+                break
+        self._signature = signature
+        self.loads += 1
+
+    def _current(self):
+        signature = self._stat()
+        with self._lock:
+            if signature != self._signature:
+                self._load(signature)
+            return self._path, self._config
+
+    def get(self) -> dict:
+        """client_id, client_secret, auth_uri, token_uri, ...; {} when no file has a client."""
+        return dict(self._current()[1])
+
+    def path(self) -> str | None:
+        return self._current()[0]
+
+    def client_id(self) -> str:
+        """GOOGLE_OAUTH_CLIENT_ID, else the client_id from the file."""
+        return settings.GOOGLE_OAUTH_CLIENT_ID or self._current()[1].get("client_id", "")
+
+    def stats(self) -> dict:
+        return {"loads": self.loads, "found": int(self._path is not None)}
+
+
+oauth_client_config = OAuthClientConfig()
@@ -1,13 +1,106 @@
+import asyncio
 import hashlib
-from passlib.context import CryptContext
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+
+from config import settings
+
+
+class PasswordHasherBusy(Exception):
+    """Too many hash/verify calls are already queued; retry later."""
+
+
+@lru_cache(maxsize=None)
+def _context(rounds: int):
+    # passlib is imported with the first hash, usually in a hasher process
+    from passlib.context import CryptContext
+
+    # hashes at any other cost report needs_update, so changing BCRYPT_ROUNDS rehashes on login
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds,
+    )
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def _prehash(password: str) -> str:
     return hashlib.sha256(password.encode("utf-8")).hexdigest()
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(_prehash(password))
+def hash_password(password: str, rounds: int = settings.BCRYPT_ROUNDS) -> str:
+    return _context(rounds).hash(_prehash(password))
 
 def verify_password(password: str, hashed: str) -> bool:
-    return pwd_context.verify(_prehash(password), hashed)
\ No newline at end of file
+    return _context(settings.BCRYPT_ROUNDS).verify(_prehash(password), hashed)
+
+def verify_and_update(password: str, hashed: str, rounds: int = settings.BCRYPT_ROUNDS):
+    """(valid, new_hash); new_hash is set when the stored hash should be replaced."""
+    return _context(rounds).verify_and_update(_prehash(password), hashed)
+
+
+class _PasswordHasher:
+    """Runs bcrypt in a bounded pool of worker processes, off the event loop and the GIL.
+
+    At most max_pending calls may be running or queued; beyond that callers
+    get PasswordHasherBusy instead of waiting behind a login storm. With
+    workers=0 the calls run in the default thread pool instead.
+    """
+
+    def __init__(self, workers: int, max_pending: int, rounds: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self._pool = None
+        self.pending = 0
+        self.rejected = 0
+
+    def _executor(self):
+        if self.workers <= 0:
+            return None
+        if self._pool is None:
+            # spawn: forking a process that runs an event loop and threads is unsafe
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordHasherBusy()
+        self.pending += 1
+        executor = self._executor()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            # a worker died; start a fresh pool for the next caller
+            if self._pool is executor:
+                self._pool = None
+            raise
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password, self.rounds)
+
+    async def verify_and_update(self, password: str, hashed: str):
+        return await self._run(verify_and_update, password, hashed, self.rounds)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> dict:
+        return {"pending": self.pending, "rejected": self.rejected, "max_pending": self.max_pending}
+
+
+password_hasher = _PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS if settings.PASSWORD_HASH_WORKERS >= 0 else max(1, (os.cpu_count() or 2) // 2),
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+    rounds=settings.BCRYPT_ROUNDS,
+)
@@ -0,0 +1,334 @@
+import json
+import logging
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar("current_span", default=None)
+# not worth a trace: probes and scrapes
+_UNTRACED_PATHS = {"/health", "/metrics"}
+
+
+class _Trace:
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.root = None
+        self.finished = []
+        self.exported = False
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "attributes", "start_ns", "end_ns", "error")
+
+    def __init__(self, trace: _Trace, name: str, parent_id: str | None, attributes: dict, kind: str = "internal"):
+        self.trace = trace
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        trace = self.trace
+        if trace.exported:
+            # outlived the request (e.g. a background task it started)
+            _exporter.export([self])
+        else:
+            trace.finished.append(self)
+            if self is trace.root:
+                trace.exported = True
+                _exporter.export(trace.finished)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": (self.end_ns - self.start_ns) / 1e6,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+@contextmanager
+def span(name: str, current: bool = True, **attributes):
+    """Child span of the current one; yields None when the request is not sampled.
+
+    Pass current=False where the block yields (async generators), so the span
+    does not leak into the caller's context between steps.
+    """
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, parent.span_id, attributes)
+    token = _current.set(child) if current else None
+    try:
+        yield child
+    except BaseException as exc:
+        child.error = f"{type(exc).__name__}: {exc}"
+        raise
+    finally:
+        if token is not None:
+            _current.reset(token)
+        child.end()
+
+
+def current_span() -> Span | None:
+    return _current.get()
+
+
+def _parse_traceparent(header: str):
+    """(trace_id, parent_id, sampled) from a W3C traceparent header, or None."""
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        flags = int(parts[3], 16)
+        int(parts[1] + parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+class _JsonlExporter:
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, spans: list):
+        with open(self.path, "a", encoding="utf-8") as handle:
+            for item in spans:
+                handle.write(json.dumps(item, default=str) + "\n")
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+_OTLP_KINDS = {"internal": 1, "server": 2}
+
+
+class _OtlpExporter:
+    """OTLP/HTTP with the JSON encoding, posted to TRACE_OTLP_ENDPOINT."""
+
+    def __init__(self, endpoint: str, service_name: str):
+        self.endpoint = endpoint
+        self.service_name = service_name
+
+    def write(self, spans: list):
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": _otlp_value(self.service_name)}]},
+                "scopeSpans": [{
+                    "scope": {"name": "workspaceai"},
+                    "spans": [
+                        {
+                            "traceId": item["trace_id"],
+                            "spanId": item["span_id"],
+                            **({"parentSpanId": item["parent_id"]} if item["parent_id"] else {}),
+                            "name": item["name"],
+                            "kind": _OTLP_KINDS.get(item.get("kind"), 1),
+                            "startTimeUnixNano": str(item["start_ns"]),
+                            "endTimeUnixNano": str(item["end_ns"]),
+                            "attributes": [
+                                {"key": key, "value": _otlp_value(value)}
+                                for key, value in item["attributes"].items()
+                            ],
+                            "status": {"code": 2, "message": item["error"]} if item["error"] else {"code": 1},
+                        }
+                        for item in spans
+                    ],
+                }],
+            }],
+        }
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(payload, default=str).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=5):
+            pass
+
+
+class _Exporter:
+    """Hands finished spans to a background thread; drops them when the queue is full."""
+
+    def __init__(self, max_queue: int = 10_000):
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._backend = None
+        self.dropped = 0
+        self.exported = 0
+
+    def _make_backend(self):
+        if settings.TRACE_EXPORTER == "otlp":
+            return _OtlpExporter(settings.TRACE_OTLP_ENDPOINT, settings.TRACE_SERVICE_NAME)
+        return _JsonlExporter(settings.TRACE_JSONL_PATH)
+
+    def export(self, spans: list):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._backend = self._make_backend()
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait([item.to_dict() for item in spans])
+        except queue.Full:
+            self.dropped += len(spans)
+
+    def _run(self):
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            # coalesce whatever else is waiting into one write
+            while len(batch) < 512:
+                try:
+                    more = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if more is None:
+                    self._write(batch)
+                    return
+                batch.extend(more)
+            self._write(batch)
+
+    def _write(self, batch: list):
+        try:
+            self._backend.write(batch)
+            self.exported += len(batch)
+        except Exception as exc:
+            self.dropped += len(batch)
+            logger.warning("Trace export failed: %s", exc)
+
+    def shutdown(self, timeout: float = 5.0):
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self) -> dict:
+        return {"exported": self.exported, "dropped": self.dropped, "queued": self._queue.qsize()}
+
+
+_exporter = _Exporter()
+
+
+def shutdown_tracing():
+    _exporter.shutdown()
+
+
+def tracing_stats() -> dict:
+    return _exporter.stats()
+
+
+class _UpstreamBudget:
+    """Per-second cap on requests traced only because the caller's traceparent asked."""
+
+    def __init__(self):
+        self._second = 0
+        self._used = 0
+
+    def take(self) -> bool:
+        second = int(time.monotonic())
+        if second != self._second:
+            self._second, self._used = second, 0
+        if self._used >= settings.TRACE_UPSTREAM_MAX_PER_SECOND:
+            return False
+        self._used += 1
+        return True
+
+
+class TracingMiddleware:
+    """Opens a root span per sampled HTTP request (head-based sampling).
+
+    TRACE_SAMPLE_RATE decides sampling; 0 turns tracing off whatever callers
+    send. An incoming W3C traceparent header links the trace to the caller,
+    and its sampled flag is a hint: such requests are also traced, up to
+    TRACE_UPSTREAM_MAX_PER_SECOND. The span stays open until the last body
+    chunk is sent, so streamed responses are covered. Sampled responses carry
+    an x-trace-id header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._upstream = _UpstreamBudget()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in _UNTRACED_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        rate = settings.TRACE_SAMPLE_RATE
+        if rate <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        parent_id = None
+        upstream_sampled = False
+        trace_id = None
+        for name, value in scope.get("headers") or []:
+            if name == b"traceparent":
+                parsed = _parse_traceparent(value.decode("latin-1"))
+                if parsed is not None:
+                    trace_id, parent_id, upstream_sampled = parsed
+                break
+        sampled = random.random() < rate or (upstream_sampled and self._upstream.take())
+        if not sampled:
+            await self.app(scope, receive, send)
+            return
+
+        trace = _Trace(trace_id or f"{random.getrandbits(128):032x}")
+        root = trace.root = Span(trace, f"{scope['method']} {scope['path']}", parent_id, {
+            "http.method": scope["method"],
+            "http.target": scope["path"],
+        }, kind="server")
+        token = _current.set(root)
+
+        async def traced_send(message):
+            if message["type"] == "http.response.start":
+                root.set(**{"http.status_code": message["status"]})
+                headers = list(message.get("headers") or [])
+                headers.append((b"x-trace-id", trace.trace_id.encode("ascii")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, traced_send)
+        except BaseException as exc:
+            root.error = f"{type(exc).__name__}: {exc}"
+            raise
+        finally:
+            _current.reset(token)
+            root.end()
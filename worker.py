@@ -0,0 +1,35 @@
+"""Runs confirmed action requests outside the API process.
+
+    ACTION_WORKER_IN_PROCESS=false uvicorn main:app   # API only queues jobs
+    python worker.py                                  # one or more of these execute them
+"""
+import asyncio
+import logging
+import signal
+
+from agent.jobs import run_worker
+from agent.llm import close_client
+from db import close_db, connect_db
+from services.messages import message_writer
+from utils.cache import cache_backend
+
+
+async def main():
+    await connect_db()
+    await cache_backend.start()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await run_worker(stop)
+    finally:
+        await message_writer.close()
+        await close_client()
+        await cache_backend.close()
+        await close_db()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())